@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+招标文件文本提取的基准测试
+
+生成合成的招标文件（PDF和Word，10到1000页，包含大量表格和较长的中文段落），
+分别测量 DocumentProcessor._extract_pdf_text、_extract_docx_text 和 _extract_table_text
+的耗时、每秒页数和峰值内存，作为更换解析方式或解析库时的对比基线。
+
+每项测量在独立的子进程中运行，峰值内存互不影响。
+
+用法：
+    python benchmarks/extraction_benchmark.py
+    python benchmarks/extraction_benchmark.py --pages 10 200 --table-ratio 0.8 --output-dir /tmp/tender_fixtures
+"""
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 合成文件的版式：A4纸，小四号字
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 50
+FONT_SIZE = 10.5
+LEADING = 16
+CHARS_PER_LINE = int((PAGE_WIDTH - 2 * MARGIN) / FONT_SIZE)
+LINES_PER_PAGE = int((PAGE_HEIGHT - 2 * MARGIN) / LEADING)
+
+# 含表格的页面中，表格的行列数
+TABLE_ROWS = 12
+TABLE_COLS = 5
+TABLE_ROW_HEIGHT = 22
+
+_PHRASES = [
+    "投标人应具备独立承担民事责任的能力", "具有良好的商业信誉和健全的财务会计制度",
+    "项目实施周期自合同签订之日起计算", "须提供近三年同类项目的业绩证明材料",
+    "系统应支持国产化操作系统和数据库", "运维服务响应时间不超过三十分钟",
+    "技术方案应包含总体架构设计、功能设计、安全设计和实施计划", "按照等级保护三级要求进行安全建设",
+    "提供不少于五人的驻场服务团队", "质保期内免费提供软件升级和技术支持",
+    "评标委员会根据技术方案的完整性和可行性进行评分", "投标文件应当按照招标文件规定的格式编制",
+    "数据迁移过程中应保证业务连续性", "需提供详细的培训计划和应急预案",
+]
+
+
+def _cjk_text(rng: random.Random, length: int) -> str:
+    """生成指定长度左右的中文段落"""
+    parts = []
+    total = 0
+    while total < length:
+        phrase = rng.choice(_PHRASES) + rng.choice("，；。")
+        parts.append(phrase)
+        total += len(phrase)
+    return "".join(parts)
+
+
+def _wrap(text: str, width: int) -> list:
+    return [text[i:i + width] for i in range(0, len(text), width)]
+
+
+def _table_rows(rng: random.Random, table_index: int) -> list:
+    header = ["序号", "评分项", "分值", "评分标准", "备注"][:TABLE_COLS]
+    rows = [header]
+    for row in range(1, TABLE_ROWS):
+        rows.append([str(row), f"评分项{table_index}-{row}", str(rng.randint(1, 10)),
+                     _cjk_text(rng, 10)[:12], "无"][:TABLE_COLS])
+    return rows
+
+
+def build_pdf(pages: int, table_ratio: float, seed: int = 0) -> bytes:
+    """
+    生成合成的PDF招标文件
+
+    文字使用不嵌入的STSong-Light字体（UniGB-UCS2-H编码），并附带ToUnicode映射，
+    与常见的由Word导出的中文PDF一样可以提取文本。
+
+    Args:
+        pages: 页数
+        table_ratio: 含表格的页面比例
+        seed: 随机种子
+
+    Returns:
+        PDF文件内容
+    """
+    rng = random.Random(seed)
+    objects = {}
+
+    # 1 目录 2 页面树 3 字体 4 CID字体 5 字体描述 6 ToUnicode，之后是每页的页面对象和内容流
+    used_chars = set()
+
+    def hex_text(text: str) -> str:
+        used_chars.update(text)
+        return "<" + text.encode("utf-16-be").hex().upper() + ">"
+
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[3] = (b"<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /UniGB-UCS2-H "
+                  b"/DescendantFonts [4 0 R] /ToUnicode 6 0 R >>")
+    objects[4] = (b"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light "
+                  b"/CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 4 >> "
+                  b"/FontDescriptor 5 0 R /DW 1000 >>")
+    objects[5] = (b"<< /Type /FontDescriptor /FontName /STSong-Light /Flags 6 /FontBBox [-25 -254 1000 880] "
+                  b"/ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 880 /StemV 93 >>")
+
+    page_ids = []
+    table_index = 0
+    for page_number in range(1, pages + 1):
+        commands = []
+        y = PAGE_HEIGHT - MARGIN
+        lines_left = LINES_PER_PAGE
+
+        if rng.random() < table_ratio:
+            table_index += 1
+            column_width = (PAGE_WIDTH - 2 * MARGIN) / TABLE_COLS
+            commands.append("0.5 w")
+            for row_index, row in enumerate(_table_rows(rng, table_index)):
+                row_top = y - row_index * TABLE_ROW_HEIGHT
+                for col_index, cell in enumerate(row):
+                    x = MARGIN + col_index * column_width
+                    commands.append(f"{x:.1f} {row_top - TABLE_ROW_HEIGHT:.1f} {column_width:.1f} {TABLE_ROW_HEIGHT} re S")
+                    commands.append(f"BT /F1 9 Tf {x + 3:.1f} {row_top - 15:.1f} Td {hex_text(cell)} Tj ET")
+            y -= TABLE_ROWS * TABLE_ROW_HEIGHT + LEADING
+            lines_left -= (TABLE_ROWS * TABLE_ROW_HEIGHT) // LEADING + 1
+
+        commands.append(f"BT /F1 {FONT_SIZE} Tf {LEADING} TL {MARGIN} {y - FONT_SIZE:.1f} Td")
+        while lines_left > 0:
+            for line in _wrap(_cjk_text(rng, rng.randint(300, 800)), CHARS_PER_LINE)[:lines_left]:
+                commands.append(f"{hex_text(line)} Tj T*")
+                lines_left -= 1
+            commands.append("T*")
+            lines_left -= 1
+        commands.append("ET")
+
+        page_id = 5 + 2 * page_number
+        content_id = page_id + 1
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>").encode("ascii")
+        objects[content_id] = _pdf_stream("\n".join(commands).encode("ascii"), compress=True)
+        page_ids.append(page_id)
+
+    # 与实际文件一样，ToUnicode只包含用到的字符
+    to_unicode_lines = [
+        "/CIDInit /ProcSet findresource begin", "12 dict begin", "begincmap",
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+        "/CMapName /Adobe-Identity-UCS def", "/CMapType 2 def",
+        "1 begincodespacerange", "<0000> <FFFF>", "endcodespacerange",
+    ]
+    codes = sorted(ord(char) for char in used_chars)
+    for start in range(0, len(codes), 100):
+        block = codes[start:start + 100]
+        to_unicode_lines.append(f"{len(block)} beginbfchar")
+        to_unicode_lines.extend(f"<{code:04X}> <{code:04X}>" for code in block)
+        to_unicode_lines.append("endbfchar")
+    to_unicode_lines += ["endcmap", "CMapName currentdict /CMap defineresource pop", "end", "end"]
+    objects[6] = _pdf_stream("\n".join(to_unicode_lines).encode("ascii"))
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[2] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("ascii")
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = output.tell()
+        output.write(f"{object_id} 0 obj\n".encode("ascii") + objects[object_id] + b"\nendobj\n")
+    xref_offset = output.tell()
+    size = max(objects) + 1
+    output.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode("ascii"))
+    for object_id in range(1, size):
+        output.write(f"{offsets[object_id]:010d} 00000 n \n".encode("ascii"))
+    output.write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("ascii"))
+    return output.getvalue()
+
+
+def _pdf_stream(data: bytes, compress: bool = False) -> bytes:
+    if compress:
+        data = zlib.compress(data)
+        return f"<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n".encode("ascii") + data + b"\nendstream"
+    return f"<< /Length {len(data)} >>\nstream\n".encode("ascii") + data + b"\nendstream"
+
+
+def build_docx(pages: int, table_ratio: float, seed: int = 0) -> bytes:
+    """
+    生成合成的Word招标文件，每页之间插入分页符
+
+    Args:
+        pages: 页数
+        table_ratio: 含表格的页面比例
+        seed: 随机种子
+
+    Returns:
+        docx文件内容
+    """
+    import docx
+    from docx.enum.text import WD_BREAK
+
+    rng = random.Random(seed)
+    document = docx.Document()
+    table_index = 0
+    page_chars = CHARS_PER_LINE * LINES_PER_PAGE
+    for page_number in range(1, pages + 1):
+        chars_left = page_chars
+        if page_number % 10 == 1:
+            document.add_heading(f"第{page_number // 10 + 1}章 {rng.choice(_PHRASES)}", level=1)
+        if rng.random() < table_ratio:
+            table_index += 1
+            rows = _table_rows(rng, table_index)
+            table = document.add_table(rows=len(rows), cols=TABLE_COLS)
+            table.style = "Table Grid"
+            for table_row, row in zip(table.rows, rows):
+                for cell, text in zip(table_row.cells, row):
+                    cell.text = text
+            chars_left -= TABLE_ROWS * CHARS_PER_LINE * TABLE_ROW_HEIGHT // LEADING
+        while chars_left > 0:
+            text = _cjk_text(rng, min(chars_left, rng.randint(300, 800)))
+            document.add_paragraph(text)
+            chars_left -= len(text) + CHARS_PER_LINE
+        document.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def _peak_rss_mb():
+    """当前进程的峰值内存（MB），无法获取时返回None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux以KB为单位，macOS以字节为单位
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        memory = psutil.Process().memory_info()
+        return round(getattr(memory, "peak_wset", memory.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def measure(kind: str, path: str) -> dict:
+    """
+    测量一项提取的耗时
+
+    Args:
+        kind: pdf（_extract_pdf_text）、docx（_extract_docx_text）或 table（逐个表格调用_extract_table_text，不含文档加载）
+        path: 合成文件路径
+
+    Returns:
+        耗时、提取出的字符数、峰值内存等
+    """
+    from page_modules.document_analysis import DocumentProcessor
+
+    with open(path, "rb") as f:
+        file_content = f.read()
+
+    result = {"kind": kind}
+    if kind == "table":
+        import docx
+        document = docx.Document(io.BytesIO(file_content))
+        tables = document.tables
+        started = time.perf_counter()
+        chars = sum(len(DocumentProcessor._extract_table_text(table)) for table in tables)
+        result.update(seconds=time.perf_counter() - started, chars=chars, tables=len(tables), ok=True)
+    else:
+        extract = DocumentProcessor._extract_pdf_text if kind == "pdf" else DocumentProcessor._extract_docx_text
+        started = time.perf_counter()
+        ok, text = extract(file_content)
+        result.update(seconds=time.perf_counter() - started, chars=len(text) if ok else 0, ok=ok,
+                      error=None if ok else text)
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _run_worker(kind: str, path: str, in_process: bool) -> dict:
+    if in_process:
+        return measure(kind, path)
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", kind, path],
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"kind": kind, "ok": False, "error": completed.stderr.strip().splitlines()[-1:], "seconds": 0}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _fixture(output_dir: str, kind: str, pages: int, table_ratio: float, seed: int) -> str:
+    """生成合成文件，同样参数的文件已存在时直接复用"""
+    extension = "pdf" if kind == "pdf" else "docx"
+    path = os.path.join(output_dir, f"tender_{pages}p_t{int(table_ratio * 100)}_s{seed}.{extension}")
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        data = build_pdf(pages, table_ratio, seed) if kind == "pdf" else build_docx(pages, table_ratio, seed)
+        with open(path, "wb") as f:
+            f.write(data)
+        print(f"已生成 {os.path.basename(path)}（{len(data) // 1024} KB，{time.perf_counter() - started:.1f}s）")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="招标文件文本提取的基准测试")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000], help="合成文件的页数")
+    parser.add_argument("--table-ratio", type=float, default=0.5, help="含表格的页面比例")
+    parser.add_argument("--formats", nargs="+", choices=["pdf", "docx", "table"], default=["pdf", "docx", "table"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", help="合成文件的保存目录，已存在的文件会被复用；默认使用临时目录")
+    parser.add_argument("--in-process", action="store_true", help="在当前进程中测量（便于配合性能分析工具，峰值内存不准确）")
+    parser.add_argument("--json", dest="json_path", help="把全部结果写入该JSON文件")
+    parser.add_argument("--worker", nargs=2, metavar=("KIND", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(*args.worker)))
+        return
+
+    temp_dir = None
+    output_dir = args.output_dir
+    if not output_dir:
+        temp_dir = tempfile.TemporaryDirectory(prefix="tender_fixtures_")
+        output_dir = temp_dir.name
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    print(f"{'提取':<8}{'页数':>6}{'耗时(s)':>10}{'页/秒':>10}{'字符数':>12}{'峰值内存(MB)':>14}")
+    try:
+        for pages in args.pages:
+            for kind in args.formats:
+                path = _fixture(output_dir, "pdf" if kind == "pdf" else "docx", pages, args.table_ratio, args.seed)
+                result = _run_worker(kind, path, args.in_process)
+                result.update(pages=pages, table_ratio=args.table_ratio, file_bytes=os.path.getsize(path))
+                result["pages_per_second"] = round(pages / result["seconds"], 1) if result["seconds"] else None
+                results.append(result)
+                if not result.get("ok"):
+                    print(f"{kind:<8}{pages:>6}  失败: {result.get('error')}")
+                    continue
+                print(f"{kind:<8}{pages:>6}{result['seconds']:>10.2f}{result['pages_per_second']:>10}"
+                      f"{result['chars']:>12}{str(result['peak_rss_mb']):>14}")
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""
+本地模拟的OpenAI兼容接口，用于在不消耗token、不依赖网络的情况下测量并发和缓存改动的效果
+
+实现 /v1/models、/v1/chat/completions（流式与非流式），以及批量生成使用的 /v1/files 和 /v1/batches；
+可配置首字延迟、输出速度、错误注入、429限流和服务端前缀缓存。只依赖标准库。
+
+用法：
+    python benchmarks/mock_openai_server.py --port 8765 --ttft 0.5 --tokens-per-second 60
+然后在左侧配置面板中把Base URL设为 http://127.0.0.1:8765/v1，API Key任意填写。
+"""
+import argparse
+import email.parser
+import email.policy
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 每次写出的片段间隔（秒），输出速度较高时把多个token合并到一个片段中
+MIN_CHUNK_INTERVAL = 0.02
+
+# 模拟卡住的流最多保持的时间（秒），通常客户端会先因读取超时而断开
+STALL_SECONDS = 600
+
+# 服务端前缀缓存的粒度（token），与OpenAI的缓存规则一致
+CACHE_BLOCK_TOKENS = 128
+
+MOCK_MODELS = ["mock-gpt-fast", "mock-gpt-large", "mock-deepseek-chat"]
+
+_FILLER = "本项目实施过程中将严格按照招标文件要求组织技术力量，确保各项工作按期保质完成。"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符按1个token计，其余字符按4个字符1个token计"""
+    cjk = sum(1 for char in text if '一' <= char <= '鿿')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class MockSettings:
+    """模拟服务端的行为参数"""
+
+    def __init__(self, ttft: float = 0.5, ttft_jitter: float = 0.2, tokens_per_second: float = 60.0,
+                 output_tokens: int = 600, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 rpm_limit: int = 0, retry_after: float = 1.0, stall_rate: float = 0.0,
+                 disconnect_rate: float = 0.0, prefix_cache: bool = True, reject_stream_options: bool = False,
+                 batch_seconds: float = 0.0):
+        """
+        Args:
+            ttft: 首字延迟（秒）
+            ttft_jitter: 首字延迟的随机波动比例
+            tokens_per_second: 每个请求的输出速度
+            output_tokens: 每个请求输出的token数（请求中的max_tokens更小时以其为准）
+            error_rate: 随机返回500错误的概率
+            rate_limit_rate: 随机返回429的概率
+            rpm_limit: 每分钟请求数上限，超过后返回429，0表示不限
+            retry_after: 429响应中Retry-After的秒数
+            stall_rate: 流式输出中途卡住（不再输出，直到客户端超时断开）的概率
+            disconnect_rate: 流式输出中途断开连接的概率
+            prefix_cache: 是否模拟服务端前缀缓存（相同的系统提示词前缀计入cached_tokens）
+            reject_stream_options: 模拟不接受stream_options参数的兼容网关（返回400）
+            batch_seconds: 批量任务从创建到完成的时间（秒），之前查询到的状态为in_progress
+        """
+        self.ttft = ttft
+        self.ttft_jitter = ttft_jitter
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm_limit = rpm_limit
+        self.retry_after = retry_after
+        self.stall_rate = stall_rate
+        self.disconnect_rate = disconnect_rate
+        self.prefix_cache = prefix_cache
+        self.reject_stream_options = reject_stream_options
+        self.batch_seconds = batch_seconds
+
+
+class MockState:
+    """服务端计数：请求数、在途数、错误数和前缀缓存"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self._recent = deque()
+        self._prefixes = set()
+        # 上传的文件和批量任务
+        self.files = {}
+        self.batches = {}
+
+    def admit(self, rpm_limit: int) -> bool:
+        """按滑动窗口检查RPM，允许时记入窗口"""
+        now = time.monotonic()
+        with self.lock:
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if rpm_limit and len(self._recent) >= rpm_limit:
+                return False
+            self._recent.append(now)
+            return True
+
+    def cached_prefix_tokens(self, messages: list) -> int:
+        """第一条消息（系统提示词）之前出现过时，其token数按缓存粒度向下取整计为命中"""
+        if not messages:
+            return 0
+        prefix = str(messages[0].get('content') or '')
+        digest = hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+        with self.lock:
+            seen = digest in self._prefixes
+            self._prefixes.add(digest)
+        if not seen:
+            return 0
+        return estimate_tokens(prefix) // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'errors': self.errors,
+                'rate_limited': self.rate_limited,
+                'prompt_tokens': self.prompt_tokens,
+                'cached_tokens': self.cached_tokens,
+                'completion_tokens': self.completion_tokens,
+            }
+
+
+def _mock_content(messages: list, response_format: dict, output_tokens: int) -> str:
+    """生成模拟输出：要求JSON时返回同时满足解析和目录生成的JSON，否则返回填充文本"""
+    if (response_format or {}).get('type') == 'json_object':
+        return json.dumps({
+            "overview": "模拟的项目概述。",
+            "requirements": "模拟的技术评分要求。",
+            "outline": [
+                {"id": "1", "title": "技术方案", "description": "模拟章节", "children": [
+                    {"id": "1.1", "title": "总体设计", "description": "模拟章节"},
+                    {"id": "1.2", "title": "实施计划", "description": "模拟章节"}
+                ]}
+            ]
+        }, ensure_ascii=False)
+    text = ""
+    while estimate_tokens(text) < output_tokens:
+        text += _FILLER
+    return text[:output_tokens]
+
+
+def _split_tokens(text: str) -> list:
+    """按“一个中文字符或4个其他字符为一个token”切分"""
+    pieces = []
+    buffer = ""
+    for char in text:
+        if '一' <= char <= '鿿':
+            if buffer:
+                pieces.append(buffer)
+                buffer = ""
+            pieces.append(char)
+        else:
+            buffer += char
+            if len(buffer) == 4:
+                pieces.append(buffer)
+                buffer = ""
+    if buffer:
+        pieces.append(buffer)
+    return pieces
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings: MockSettings = MockSettings()
+    state: MockState = MockState()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, headers: dict = None) -> None:
+        self._send_json(status, {"error": {"message": message, "type": "mock_error", "code": status}}, headers)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        path = self.path.rstrip('/')
+        if path.endswith('/models'):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": model, "object": "model", "created": 0, "owned_by": "mock"} for model in MOCK_MODELS
+            ]})
+        elif path.endswith('/mock/stats'):
+            self._send_json(200, self.state.snapshot())
+        elif '/files/' in path and path.endswith('/content'):
+            self._file_content(path.split('/')[-2])
+        elif '/batches/' in path:
+            self._send_batch(path.split('/')[-1])
+        else:
+            self._send_error(404, f"未知路径: {self.path}")
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        path = self.path.rstrip('/')
+        if path.endswith('/files'):
+            self._upload_file(body)
+            return
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            self._send_error(400, "请求体不是合法的JSON")
+            return
+
+        if path.endswith('/batches'):
+            self._create_batch(request)
+            return
+        if '/batches/' in path and path.endswith('/cancel'):
+            self._cancel_batch(path.split('/')[-2])
+            return
+        if not path.endswith('/chat/completions'):
+            self._send_error(404, f"未知路径: {self.path}")
+            return
+
+        settings = self.settings
+        state = self.state
+        with state.lock:
+            state.requests += 1
+
+        if not state.admit(settings.rpm_limit) or random.random() < settings.rate_limit_rate:
+            with state.lock:
+                state.rate_limited += 1
+            self._send_error(429, "Rate limit reached (mock)", {"Retry-After": f"{settings.retry_after:g}"})
+            return
+        if settings.reject_stream_options and 'stream_options' in request:
+            self._send_error(400, "Unrecognized request argument supplied: stream_options")
+            return
+        if random.random() < settings.error_rate:
+            with state.lock:
+                state.errors += 1
+            self._send_error(500, "Internal server error (mock)")
+            return
+
+        with state.lock:
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        try:
+            self._complete(request)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已断开（如对冲请求被取消）
+            pass
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    def _complete(self, request: dict) -> None:
+        settings = self.settings
+        messages = request.get('messages') or []
+        model = request.get('model') or MOCK_MODELS[0]
+        output_tokens = min(settings.output_tokens, request.get('max_tokens') or settings.output_tokens)
+        content = _mock_content(messages, request.get('response_format'), output_tokens)
+        prompt_tokens = sum(estimate_tokens(str(m.get('content') or '')) + 4 for m in messages)
+        cached_tokens = self.state.cached_prefix_tokens(messages) if settings.prefix_cache else 0
+        completion_tokens = estimate_tokens(content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        ttft = max(0.0, settings.ttft * (1 + random.uniform(-settings.ttft_jitter, settings.ttft_jitter)))
+        time.sleep(ttft)
+
+        if not request.get('stream'):
+            time.sleep(completion_tokens / settings.tokens_per_second if settings.tokens_per_second > 0 else 0)
+            self._record_usage(usage)
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(delta: dict, finish_reason=None, with_usage=None) -> bytes:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if with_usage is None else [],
+            }
+            if with_usage is not None:
+                payload["usage"] = with_usage
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+
+        tokens = _split_tokens(content)
+        per_chunk = 1
+        interval = 0.0
+        if settings.tokens_per_second > 0:
+            per_chunk = max(1, int(settings.tokens_per_second * MIN_CHUNK_INTERVAL))
+            interval = per_chunk / settings.tokens_per_second
+
+        # 中途卡住或断开的位置
+        failure = None
+        if random.random() < settings.stall_rate:
+            failure = ('stall', random.randint(0, len(tokens)))
+        elif random.random() < settings.disconnect_rate:
+            failure = ('disconnect', random.randint(1, max(1, len(tokens))))
+
+        self._write_chunk(event({"role": "assistant", "content": ""}))
+        for start in range(0, len(tokens), per_chunk):
+            if failure is not None and start >= failure[1]:
+                if failure[0] == 'stall':
+                    # 不再输出，等待客户端读取超时或主动断开
+                    time.sleep(STALL_SECONDS)
+                self.close_connection = True
+                return
+            self._write_chunk(event({"content": "".join(tokens[start:start + per_chunk])}))
+            if interval:
+                time.sleep(interval)
+
+        self._write_chunk(event({}, finish_reason="stop"))
+        if (request.get('stream_options') or {}).get('include_usage'):
+            self._write_chunk(event({}, with_usage=usage))
+        self._record_usage(usage)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _upload_file(self, body: bytes) -> None:
+        """上传文件（multipart/form-data，字段file和purpose）"""
+        message = email.parser.BytesParser(policy=email.policy.default).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode('latin-1') + body
+        )
+        fields = {}
+        for part in message.iter_parts():
+            fields[part.get_param('name', header='content-disposition')] = (
+                part.get_filename(), part.get_payload(decode=True) or b""
+            )
+        if 'file' not in fields:
+            self._send_error(400, "缺少file字段")
+            return
+        filename, content = fields['file']
+        purpose = (fields.get('purpose') or (None, b"batch"))[1].decode('utf-8')
+        self._send_json(200, self._store_file(content, filename or "upload.jsonl", purpose))
+
+    def _store_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file_object = {
+            "id": f"file-mock-{uuid.uuid4().hex[:12]}",
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with self.state.lock:
+            self.state.files[file_object['id']] = (file_object, content)
+        return file_object
+
+    def _file_content(self, file_id: str) -> None:
+        with self.state.lock:
+            stored = self.state.files.get(file_id)
+        if stored is None:
+            self._send_error(404, f"文件不存在: {file_id}")
+            return
+        content = stored[1]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _create_batch(self, request: dict) -> None:
+        """创建批量任务：立即生成全部结果，batch_seconds之后才报告完成"""
+        with self.state.lock:
+            stored = self.state.files.get(request.get('input_file_id'))
+        if stored is None:
+            self._send_error(400, f"输入文件不存在: {request.get('input_file_id')}")
+            return
+
+        outputs, errors = [], []
+        for line in stored[1].decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            body = item.get('body') or {}
+            record = {"id": f"batch-req-{uuid.uuid4().hex[:12]}", "custom_id": item.get('custom_id')}
+            if random.random() < self.settings.error_rate:
+                record["response"] = {"status_code": 500, "body": {
+                    "error": {"message": "Internal server error (mock)", "type": "mock_error"}}}
+                record["error"] = None
+                errors.append(record)
+                continue
+            content = _mock_content(body.get('messages') or [], body.get('response_format'),
+                                    self.settings.output_tokens)
+            record["response"] = {"status_code": 200, "body": {
+                "object": "chat.completion",
+                "model": body.get('model') or MOCK_MODELS[0],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+            }}
+            record["error"] = None
+            outputs.append(record)
+
+        def to_file(records: list) -> bytes:
+            return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode('utf-8')
+
+        now = time.time()
+        batch = {
+            "id": f"batch_mock_{uuid.uuid4().hex[:12]}",
+            "object": "batch",
+            "endpoint": request.get('endpoint'),
+            "input_file_id": request.get('input_file_id'),
+            "completion_window": request.get('completion_window'),
+            "status": "in_progress",
+            "created_at": int(now),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len(outputs) + len(errors), "completed": 0, "failed": 0},
+        }
+        pending = {
+            "complete_at": now + self.settings.batch_seconds,
+            "output_file_id": self._store_file(to_file(outputs), "output.jsonl", "batch_output")['id'] if outputs else None,
+            "error_file_id": self._store_file(to_file(errors), "errors.jsonl", "batch_output")['id'] if errors else None,
+            "counts": {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)},
+        }
+        with self.state.lock:
+            self.state.batches[batch['id']] = (batch, pending)
+        self._send_batch(batch['id'])
+
+    def _send_batch(self, batch_id: str) -> None:
+        with self.state.lock:
+            stored = self.state.batches.get(batch_id)
+            if stored is not None:
+                batch, pending = stored
+                if batch['status'] == "in_progress" and time.time() >= pending['complete_at']:
+                    batch.update(status="completed", output_file_id=pending['output_file_id'],
+                                 error_file_id=pending['error_file_id'], request_counts=pending['counts'])
+                batch = dict(batch)
+        if stored is None:
+            self._send_error(404, f"批量任务不存在: {batch_id}")
+            return
+        self._send_json(200, batch)
+
+    def _cancel_batch(self, batch_id: str) -> None:
+        with self.state.lock:
+            stored = self.state.batches.get(batch_id)
+            if stored is not None and stored[0]['status'] == "in_progress":
+                stored[0]['status'] = "cancelled"
+        self._send_batch(batch_id)
+
+    def _record_usage(self, usage: dict) -> None:
+        with self.state.lock:
+            self.state.prompt_tokens += usage['prompt_tokens']
+            self.state.cached_tokens += usage['prompt_tokens_details']['cached_tokens']
+            self.state.completion_tokens += usage['completion_tokens']
+
+
+def start_mock_server(settings: MockSettings, host: str = "127.0.0.1", port: int = 0):
+    """
+    在后台线程中启动模拟服务
+
+    Args:
+        settings: 行为参数
+        host: 监听地址
+        port: 监听端口，0表示自动选择
+
+    Returns:
+        (server, base_url)，调用server.shutdown()停止；计数见server.RequestHandlerClass.state
+    """
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"settings": settings, "state": MockState()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    thread = threading.Thread(target=server.serve_forever, name="mock-openai-server", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser) -> None:
+    """添加模拟服务行为参数的命令行选项（基准测试脚本共用）"""
+    parser.add_argument("--ttft", type=float, default=0.5, help="首字延迟（秒）")
+    parser.add_argument("--ttft-jitter", type=float, default=0.2, help="首字延迟的随机波动比例")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="单个请求的输出速度")
+    parser.add_argument("--output-tokens", type=int, default=600, help="每个请求输出的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回500的概率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="随机返回429的概率")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="每分钟请求数上限，超过返回429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应的Retry-After（秒）")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="流式输出中途卡住的概率")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="流式输出中途断开的概率")
+    parser.add_argument("--no-prefix-cache", action="store_true", help="不模拟服务端前缀缓存")
+    parser.add_argument("--reject-stream-options", action="store_true",
+                        help="模拟不接受stream_options参数的兼容网关（返回400）")
+    parser.add_argument("--batch-seconds", type=float, default=0.0, help="批量任务从创建到完成的时间（秒）")
+
+
+def settings_from_args(args) -> MockSettings:
+    return MockSettings(
+        ttft=args.ttft,
+        ttft_jitter=args.ttft_jitter,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        rpm_limit=args.rpm_limit,
+        retry_after=args.retry_after,
+        stall_rate=args.stall_rate,
+        disconnect_rate=args.disconnect_rate,
+        prefix_cache=not args.no_prefix_cache,
+        reject_stream_options=args.reject_stream_options,
+        batch_seconds=args.batch_seconds,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的OpenAI兼容接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(settings_from_args(args), args.host, args.port)
+    print(f"模拟接口已启动: {base_url}（Ctrl+C 停止，{base_url}/mock/stats 查看计数）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
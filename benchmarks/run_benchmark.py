@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+正文生成的端到端吞吐基准测试
+
+用合成目录（默认50、300、1000个叶子章节）驱动实际的生成流程：
+建立目录索引（get_outline_index）→ AsyncOpenAIService.generate_chapters
+（即_run_content_job在后台事件循环中运行的部分）→ 生成Word文档（_build_word_document），
+请求发往本地模拟接口（见mock_openai_server.py），不消耗token，结果可复现。
+
+用法：
+    python benchmarks/run_benchmark.py
+    python benchmarks/run_benchmark.py --leaves 300 --max-concurrency 32 --error-rate 0.02 --stall-rate 0.01
+    python benchmarks/run_benchmark.py --base-url http://127.0.0.1:8765/v1   # 使用已启动的模拟接口
+
+注意：--use-cache 会读写本机的响应缓存（~/.ai_write_helper），调用记录同样写入本机的调用记录文件。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_openai_server import start_mock_server, add_settings_arguments, settings_from_args
+
+# 合成目录的结构：每个二级章节下的叶子章节数、每个一级章节下的二级章节数
+LEAVES_PER_SECTION = 5
+SECTIONS_PER_CHAPTER = 6
+
+SYNTHETIC_OVERVIEW = "\n".join(
+    f"{index}. 本项目为某市政务云平台运维服务项目，服务期三年，涵盖基础设施、平台软件、安全防护与应急保障等内容。"
+    for index in range(1, 41)
+)
+
+
+def build_outline(leaves: int) -> dict:
+    """
+    构建指定叶子章节数的三级目录
+
+    Args:
+        leaves: 叶子章节数
+
+    Returns:
+        与generate_outline返回结构相同的目录数据
+    """
+    outline = []
+    created = 0
+    chapter_index = 0
+    while created < leaves:
+        chapter_index += 1
+        sections = []
+        for section_index in range(1, SECTIONS_PER_CHAPTER + 1):
+            if created >= leaves:
+                break
+            children = []
+            for leaf_index in range(1, LEAVES_PER_SECTION + 1):
+                if created >= leaves:
+                    break
+                children.append({
+                    "id": f"{chapter_index}.{section_index}.{leaf_index}",
+                    "title": f"实施要点{chapter_index}-{section_index}-{leaf_index}",
+                    "description": f"说明第{chapter_index}部分第{section_index}节的第{leaf_index}项实施要点"
+                })
+                created += 1
+            sections.append({
+                "id": f"{chapter_index}.{section_index}",
+                "title": f"专项方案{chapter_index}-{section_index}",
+                "description": f"第{chapter_index}部分的第{section_index}项专项方案",
+                "children": children
+            })
+        outline.append({
+            "id": str(chapter_index),
+            "title": f"技术方案第{chapter_index}部分",
+            "description": f"技术方案第{chapter_index}部分的总体说明",
+            "children": sections
+        })
+    return {"outline": outline}
+
+
+def _percentile(values: list, p: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def _mock_stats(base_url: str) -> dict:
+    try:
+        with urllib.request.urlopen(f"{base_url}/mock/stats", timeout=5) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def run_once(leaves: int, base_url: str, args, run_label: str) -> dict:
+    """
+    对一个合成目录跑一次完整的生成和导出
+
+    Args:
+        leaves: 叶子章节数
+        base_url: 模拟接口地址
+        args: 命令行参数
+        run_label: 用于区分各次运行的标签（每次运行使用独立的限流器和并发控制器）
+
+    Returns:
+        本次运行的指标
+    """
+    from services.async_openai_service import AsyncOpenAIService, run_coroutine
+    from services.telemetry import get_telemetry, summarize
+    from services.outline_index import get_outline_index
+    from page_modules.content_edit import _build_word_document, DOCX_AVAILABLE
+
+    outline_data = build_outline(leaves)
+    leaf_nodes_info = get_outline_index(outline_data).leaf_nodes_info()
+
+    service = AsyncOpenAIService(
+        api_key=f"mock-key-{run_label}",
+        base_url=base_url,
+        model_name=args.model,
+        use_cache=args.use_cache,
+        http_settings={
+            'connect_timeout': 10.0,
+            'read_timeout': args.read_timeout,
+            'max_connections': max(args.max_concurrency, 8)
+        },
+        rate_limits={'rpm_limit': 0, 'tpm_limit': 0},
+        max_retries=args.max_retries,
+        max_concurrency=args.max_concurrency,
+        hedge_ratio=args.hedge_ratio
+    )
+
+    generated_content = {}
+    generation_errors = {}
+    finish_times = []
+    server_before = _mock_stats(base_url)
+    started_wall = time.time()
+    started = time.monotonic()
+
+    def on_result(result):
+        node_path, content, error = result
+        finish_times.append(time.monotonic() - started)
+        if error:
+            generation_errors[node_path] = error
+        else:
+            generated_content[node_path] = content
+
+    run_stats = {}
+    run_coroutine(service.generate_chapters(leaf_nodes_info, SYNTHETIC_OVERVIEW, on_result,
+                                            run_stats=run_stats)).result()
+    generation_seconds = time.monotonic() - started
+
+    export_seconds = None
+    document_size = None
+    if DOCX_AVAILABLE:
+        export_started = time.monotonic()
+        document_size = len(_build_word_document(outline_data, generated_content, generation_errors))
+        export_seconds = time.monotonic() - export_started
+
+    server_after = _mock_stats(base_url)
+    server = {key: server_after.get(key, 0) - server_before.get(key, 0)
+              for key in ('requests', 'errors', 'rate_limited', 'prompt_tokens', 'cached_tokens', 'completion_tokens')}
+    server['max_in_flight'] = server_after.get('max_in_flight')
+
+    return {
+        'leaves': leaves,
+        'run': run_label,
+        'completed': len(generated_content),
+        'failed': len(generation_errors),
+        'generation_seconds': round(generation_seconds, 2),
+        'chapters_per_second': round(leaves / generation_seconds, 2) if generation_seconds else None,
+        'finish_p50': _percentile(finish_times, 50),
+        'finish_p95': _percentile(finish_times, 95),
+        'finish_p99': _percentile(finish_times, 99),
+        'export_seconds': round(export_seconds, 2) if export_seconds is not None else None,
+        'document_bytes': document_size,
+        'concurrency': service.concurrency_controller.snapshot(),
+        'hedging': run_stats['hedging'].snapshot(),
+        'context': run_stats['context'].snapshot(),
+        'server': server,
+        'calls': summarize(get_telemetry().recent(since=started_wall)),
+    }
+
+
+def print_result(result: dict) -> None:
+    def seconds(value):
+        return f"{value:.1f}s" if value is not None else "-"
+
+    server = result['server']
+    print(f"\n=== {result['leaves']} 个叶子章节（{result['run']}）===")
+    print(f"完成 {result['completed']}，失败 {result['failed']}，生成耗时 {seconds(result['generation_seconds'])}，"
+          f"吞吐 {result['chapters_per_second']} 章/秒")
+    print(f"章节完成时间 p50 {seconds(result['finish_p50'])} · p95 {seconds(result['finish_p95'])} · "
+          f"p99 {seconds(result['finish_p99'])}")
+    print(f"导出Word {seconds(result['export_seconds'])}" +
+          (f"（{result['document_bytes'] // 1024} KB）" if result['document_bytes'] else "（未安装python-docx，跳过）"))
+    concurrency = result['concurrency']
+    print(f"并发控制：目标 {concurrency['target']} / 上限 {concurrency['max_limit']}，"
+          f"服务端最大在途 {server.get('max_in_flight')}")
+    print(f"服务端：请求 {server['requests']}，500 {server['errors']}，429 {server['rate_limited']}，"
+          f"前缀缓存命中 {server['cached_tokens']}/{server['prompt_tokens']} tokens")
+    if result['hedging'] and result['hedging']['hedges']:
+        print(f"对冲请求 {result['hedging']['hedges']} 次（先完成 {result['hedging']['hedge_wins']} 次）")
+    context = result['context']
+    if context and context['full_tokens']:
+        print(f"同级章节上下文：{context['full_tokens']} → {context['compressed_tokens']} tokens"
+              f"（节省 {context['saved_ratio']:.0%}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="正文生成的端到端吞吐基准测试")
+    parser.add_argument("--leaves", type=int, nargs="+", default=[50, 300, 1000], help="合成目录的叶子章节数")
+    parser.add_argument("--repeat", type=int, default=1, help="每个规模重复运行的次数（配合--use-cache测量缓存回放）")
+    parser.add_argument("--base-url", help="使用已启动的模拟接口，不指定时在进程内启动")
+    parser.add_argument("--model", default="mock-gpt-fast")
+    parser.add_argument("--max-concurrency", type=int, default=64, help="自适应并发的上限")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--hedge-ratio", type=float, default=0.1, help="对冲预算，0表示关闭")
+    parser.add_argument("--read-timeout", type=float, default=30.0, help="读取超时（秒）")
+    parser.add_argument("--use-cache", action="store_true", help="启用本地响应缓存")
+    parser.add_argument("--json", dest="json_path", help="把全部结果写入该JSON文件")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_mock_server(settings_from_args(args))
+        print(f"模拟接口: {base_url}")
+
+    results = []
+    try:
+        for leaves in args.leaves:
+            for repeat in range(1, args.repeat + 1):
+                result = run_once(leaves, base_url, args, f"{leaves}-{repeat}-{int(time.time())}")
+                print_result(result)
+                results.append(result)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,46 @@
 import streamlit as st
 import json
 import os
-import openai
-from typing import List, Dict
+import uuid
+from typing import List, Dict, Optional
+from services.client_registry import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+    DEFAULT_MAX_CONNECTIONS
+)
+from services.concurrency_controller import DEFAULT_MAX_LIMIT
+from services.rate_limiter import DEFAULT_RPM_LIMIT, DEFAULT_TPM_LIMIT
+from services.retry_policy import DEFAULT_MAX_RETRIES
+from services.hedging import DEFAULT_HEDGE_RATIO
+from services.document_chunker import DEFAULT_CHUNK_SIZE, DEFAULT_PARALLELISM
+from services.endpoint_pool import DEFAULT_ENDPOINT_WEIGHT, DEFAULT_ENDPOINT_CONCURRENCY
+from services.openai_servce import ANALYSIS_MODE_COMBINED, ANALYSIS_MODE_SEPARATE, DEFAULT_ANALYSIS_MODE
+from services.model_router import DEFAULT_MODEL_ROUTES
 
 # 配置文件路径 - 存储到用户家目录中
 CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".ai_write_helper", "user_config.json")
 
 def load_config() -> Dict:
     """从本地JSON文件加载配置"""
-    config = {'api_key': '', 'base_url': '', 'model_name': 'gpt-3.5-turbo'}
+    config = {
+        'api_key': '',
+        'base_url': '',
+        'model_name': 'gpt-3.5-turbo',
+        'bypass_cache': False,
+        'connect_timeout': DEFAULT_CONNECT_TIMEOUT,
+        'read_timeout': DEFAULT_READ_TIMEOUT,
+        'max_connections': DEFAULT_MAX_CONNECTIONS,
+        'max_concurrency': DEFAULT_MAX_LIMIT,
+        'rpm_limit': DEFAULT_RPM_LIMIT,
+        'tpm_limit': DEFAULT_TPM_LIMIT,
+        'max_retries': DEFAULT_MAX_RETRIES,
+        'hedge_ratio': DEFAULT_HEDGE_RATIO,
+        'analysis_chunk_size': DEFAULT_CHUNK_SIZE,
+        'analysis_parallelism': DEFAULT_PARALLELISM,
+        'analysis_mode': DEFAULT_ANALYSIS_MODE,
+        'endpoints': [],
+        'model_routes': dict(DEFAULT_MODEL_ROUTES)
+    }
     
     # 确保配置目录存在
     config_dir = os.path.dirname(CONFIG_FILE)
@@ -30,13 +61,31 @@ def load_config() -> Dict:
     
     return config
 
-def save_config(api_key: str, base_url: str, model_name: str) -> bool:
-    """保存配置到本地JSON文件"""
-    config = {
+def save_config(api_key: str, base_url: str, model_name: str, extra_settings: Optional[Dict] = None) -> bool:
+    """
+    保存配置到本地JSON文件
+    
+    Args:
+        api_key: OpenAI API密钥
+        base_url: 基础URL
+        model_name: 模型名称
+        extra_settings: 其他设置项（如缓存、限流等），与已有配置合并保存
+    """
+    config = {}
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except Exception:
+            config = {}
+    
+    config.update({
         'api_key': api_key,
         'base_url': base_url,
         'model_name': model_name
-    }
+    })
+    if extra_settings:
+        config.update(extra_settings)
     
     # 确保配置目录存在
     config_dir = os.path.dirname(CONFIG_FILE)
@@ -56,21 +105,16 @@ def save_config(api_key: str, base_url: str, model_name: str) -> bool:
         return False
 
 def get_available_models(api_key: str, base_url: str) -> List[str]:
-    """获取可用的模型列表"""
+    """获取可用的模型列表（经由OpenAIService，受限流预算约束）"""
     try:
-        client = openai.OpenAI(
-            api_key=api_key,
-            base_url=base_url if base_url else None
+        from services.openai_servce import OpenAIService, get_rate_limit_settings
+        service = OpenAIService(
+            api_key,
+            base_url,
+            st.session_state.get('model_name', 'gpt-3.5-turbo'),
+            rate_limits=get_rate_limit_settings()
         )
-        
-        models = client.models.list()
-        chat_models = []
-        for model in models.data:
-            model_id = model.id.lower()
-            if any(keyword in model_id for keyword in ['gpt', 'claude', 'chat', 'llama', 'qwen', 'deepseek']):
-                chat_models.append(model.id)
-        
-        return sorted(list(set(chat_models)))
+        return service.get_available_models()
     except Exception as e:
         st.error(f"获取模型列表失败: {str(e)}")
         return []
@@ -97,12 +141,69 @@ def render_config_panel(title: str = "AI写标书助手"):
         if 'model_name' not in st.session_state:
             st.session_state.model_name = 'gpt-3.5-turbo'
         
+        if 'bypass_cache' not in st.session_state:
+            st.session_state.bypass_cache = False
+        
+        if 'connect_timeout' not in st.session_state:
+            st.session_state.connect_timeout = DEFAULT_CONNECT_TIMEOUT
+        
+        if 'read_timeout' not in st.session_state:
+            st.session_state.read_timeout = DEFAULT_READ_TIMEOUT
+        
+        if 'max_connections' not in st.session_state:
+            st.session_state.max_connections = DEFAULT_MAX_CONNECTIONS
+        
+        if 'max_concurrency' not in st.session_state:
+            st.session_state.max_concurrency = DEFAULT_MAX_LIMIT
+        
+        if 'rpm_limit' not in st.session_state:
+            st.session_state.rpm_limit = DEFAULT_RPM_LIMIT
+        
+        if 'tpm_limit' not in st.session_state:
+            st.session_state.tpm_limit = DEFAULT_TPM_LIMIT
+        
+        if 'max_retries' not in st.session_state:
+            st.session_state.max_retries = DEFAULT_MAX_RETRIES
+        
+        if 'hedge_ratio' not in st.session_state:
+            st.session_state.hedge_ratio = DEFAULT_HEDGE_RATIO
+        
+        if 'analysis_chunk_size' not in st.session_state:
+            st.session_state.analysis_chunk_size = DEFAULT_CHUNK_SIZE
+        
+        if 'analysis_parallelism' not in st.session_state:
+            st.session_state.analysis_parallelism = DEFAULT_PARALLELISM
+        
+        if 'analysis_mode' not in st.session_state:
+            st.session_state.analysis_mode = DEFAULT_ANALYSIS_MODE
+        
+        if 'endpoints' not in st.session_state:
+            st.session_state.endpoints = []
+        
+        if 'model_routes' not in st.session_state:
+            st.session_state.model_routes = dict(DEFAULT_MODEL_ROUTES)
+        
         # 只在首次加载时从文件读取配置
         if not st.session_state.config_loaded:
             config = load_config()
             st.session_state.api_key = config.get('api_key', '')
             st.session_state.base_url = config.get('base_url', '')
             st.session_state.model_name = config.get('model_name', 'gpt-3.5-turbo')
+            st.session_state.bypass_cache = config.get('bypass_cache', False)
+            st.session_state.connect_timeout = config.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)
+            st.session_state.read_timeout = config.get('read_timeout', DEFAULT_READ_TIMEOUT)
+            st.session_state.max_connections = config.get('max_connections', DEFAULT_MAX_CONNECTIONS)
+            st.session_state.max_concurrency = config.get('max_concurrency', DEFAULT_MAX_LIMIT)
+            st.session_state.rpm_limit = config.get('rpm_limit', DEFAULT_RPM_LIMIT)
+            st.session_state.tpm_limit = config.get('tpm_limit', DEFAULT_TPM_LIMIT)
+            st.session_state.max_retries = config.get('max_retries', DEFAULT_MAX_RETRIES)
+            st.session_state.hedge_ratio = config.get('hedge_ratio', DEFAULT_HEDGE_RATIO)
+            st.session_state.analysis_chunk_size = config.get('analysis_chunk_size', DEFAULT_CHUNK_SIZE)
+            st.session_state.analysis_parallelism = config.get('analysis_parallelism', DEFAULT_PARALLELISM)
+            st.session_state.analysis_mode = config.get('analysis_mode', DEFAULT_ANALYSIS_MODE)
+            st.session_state.endpoints = [dict(endpoint, id=endpoint.get('id') or uuid.uuid4().hex)
+                                          for endpoint in config.get('endpoints', [])]
+            st.session_state.model_routes = dict(DEFAULT_MODEL_ROUTES, **config.get('model_routes', {}))
             st.session_state.config_loaded = True
         
         # 使用session state中的值作为默认值
@@ -152,11 +253,36 @@ def render_config_panel(title: str = "AI写标书助手"):
                 help="输入要使用的模型名称，如：gpt-3.5-turbo, gpt-4, gpt-4-turbo-preview等"
             )
         
+        # 按任务类型选择模型
+        model_routes = _render_model_routes()
+        
+        # 响应缓存配置
+        bypass_cache = _render_cache_settings()
+        
+        # 连接配置
+        http_settings = _render_http_settings()
+        
+        # 限流配置
+        rate_limits = _render_rate_limit_settings()
+        
+        # 文档解析配置
+        analysis_settings = _render_analysis_settings()
+        
+        # 多端点配置
+        endpoints = _render_endpoint_settings()
+        
         if st.button("💾 保存配置", use_container_width=True):
-            if save_config(api_key, base_url, model_name):
+            extra_settings = {'bypass_cache': bypass_cache}
+            extra_settings.update(http_settings)
+            extra_settings.update(rate_limits)
+            extra_settings.update(analysis_settings)
+            extra_settings['endpoints'] = endpoints
+            extra_settings['model_routes'] = model_routes
+            if save_config(api_key, base_url, model_name, extra_settings):
                 st.session_state.api_key = api_key
                 st.session_state.base_url = base_url
                 st.session_state.model_name = model_name
+                st.session_state.update(extra_settings)
                 
                 # 清除OpenAI服务缓存，确保配置更改后立即生效
                 try:
@@ -176,4 +302,286 @@ def render_config_panel(title: str = "AI写标书助手"):
         1. 配置API密钥和Base URL
         2. 选择或输入模型名称
         3. 按步骤完成标书编写流程
-        """)
\ No newline at end of file
+        """)
+
+
+def _render_cache_settings() -> bool:
+    """
+    渲染响应缓存设置
+    
+    Returns:
+        是否跳过缓存
+    """
+    with st.expander("🗄️ 响应缓存", expanded=False):
+        bypass_cache = st.checkbox(
+            "跳过响应缓存",
+            value=st.session_state.bypass_cache,
+            help="勾选后每次都重新请求AI接口，不读取也不写入本地缓存"
+        )
+        
+        try:
+            from services.response_cache import get_response_cache
+            cache = get_response_cache()
+            stats = cache.stats()
+            st.caption(f"已缓存 {stats['entries']} 条响应，共 {stats['bytes'] / 1024 / 1024:.1f} MB")
+            if st.button("🧹 清空缓存", key="clear_response_cache", use_container_width=True):
+                cache.clear()
+                st.success("缓存已清空")
+        except Exception as e:
+            st.caption(f"缓存不可用: {e}")
+    
+    return bypass_cache
+
+
+def _render_http_settings() -> Dict:
+    """
+    渲染连接设置（超时、连接池大小、并发上限、重试次数与请求对冲）
+    
+    Returns:
+        连接设置字典
+    """
+    with st.expander("🌐 连接设置", expanded=False):
+        connect_timeout = st.number_input(
+            "连接超时（秒）",
+            min_value=1.0,
+            max_value=120.0,
+            value=float(st.session_state.connect_timeout),
+            step=1.0
+        )
+        read_timeout = st.number_input(
+            "读取超时（秒）",
+            min_value=10.0,
+            max_value=1800.0,
+            value=float(st.session_state.read_timeout),
+            step=10.0,
+            help="单次流式读取的最长等待时间，长章节可适当调大"
+        )
+        max_connections = st.number_input(
+            "连接池大小",
+            min_value=1,
+            max_value=1000,
+            value=int(st.session_state.max_connections),
+            step=8,
+            help="所有会话共享的最大并发连接数，应不小于生成正文时的并发数"
+        )
+        max_concurrency = st.number_input(
+            "最大并发请求数",
+            min_value=1,
+            max_value=1000,
+            value=int(st.session_state.max_concurrency),
+            step=1,
+            help="生成正文时自适应并发的上限；实际并发数会根据限流、错误和首字延迟自动调整"
+        )
+        max_retries = st.number_input(
+            "失败重试次数",
+            min_value=0,
+            max_value=10,
+            value=int(st.session_state.max_retries),
+            step=1,
+            help="遇到限流、超时、5xx等临时错误时，单次请求自动重试的次数（指数退避，遵循Retry-After）"
+        )
+        hedge_percent = st.number_input(
+            "对冲请求预算（%）",
+            min_value=0,
+            max_value=50,
+            value=int(round(float(st.session_state.hedge_ratio) * 100)),
+            step=5,
+            help="生成正文时，某个章节迟迟没有首字或输出停滞，超过近期请求的95分位耗时后，"
+                 "再发一个相同的请求并采用先完成的结果。对冲请求数最多为章节数的该比例，0表示关闭"
+        )
+    
+    return {
+        'connect_timeout': connect_timeout,
+        'read_timeout': read_timeout,
+        'max_connections': int(max_connections),
+        'max_concurrency': int(max_concurrency),
+        'max_retries': int(max_retries),
+        'hedge_ratio': hedge_percent / 100
+    }
+
+
+def _render_rate_limit_settings() -> Dict:
+    """
+    渲染限流预算设置（按当前Base URL和模型生效）
+    
+    Returns:
+        限流预算字典
+    """
+    with st.expander("🚦 限流设置", expanded=False):
+        st.caption("同一API Key同时处理多个标书时，按服务商的配额设置预算，可在发出请求前平滑流量。0表示不限制。")
+        rpm_limit = st.number_input(
+            "每分钟请求数 (RPM)",
+            min_value=0,
+            max_value=100000,
+            value=int(st.session_state.rpm_limit),
+            step=10
+        )
+        tpm_limit = st.number_input(
+            "每分钟Token数 (TPM)",
+            min_value=0,
+            max_value=100000000,
+            value=int(st.session_state.tpm_limit),
+            step=10000
+        )
+    
+    return {
+        'rpm_limit': int(rpm_limit),
+        'tpm_limit': int(tpm_limit)
+    }
+
+
+def _render_analysis_settings() -> Dict:
+    """
+    渲染文档解析设置（解析模式与长文档分块）
+    
+    Returns:
+        文档解析设置字典
+    """
+    mode_options = {
+        ANALYSIS_MODE_COMBINED: "合并解析（一次请求）",
+        ANALYSIS_MODE_SEPARATE: "分别解析（两次请求）",
+    }
+    with st.expander("📄 文档解析", expanded=False):
+        analysis_mode = st.radio(
+            "解析模式",
+            options=list(mode_options.keys()),
+            index=list(mode_options.keys()).index(st.session_state.analysis_mode)
+                  if st.session_state.analysis_mode in mode_options
+                  else 0,
+            format_func=lambda mode: mode_options[mode],
+            help="合并解析只提交一次招标文件，同时返回项目概述和技术评分要求；模型对合并提示效果不好时可改为分别解析"
+        )
+        st.caption("文档超过分块大小时，按页和标题切块并行提取，再合并去重（此时按项分别解析）。")
+        chunk_size = st.number_input(
+            "分块大小（字符）",
+            min_value=0,
+            max_value=1000000,
+            value=int(st.session_state.analysis_chunk_size),
+            step=5000,
+            help="每块的最大字符数，应小于模型上下文长度；0表示不分块，整篇文档一次提交"
+        )
+        parallelism = st.number_input(
+            "并行解析数",
+            min_value=1,
+            max_value=64,
+            value=int(st.session_state.analysis_parallelism),
+            step=1,
+            help="同时解析的文本块数量"
+        )
+    
+    return {
+        'analysis_chunk_size': int(chunk_size),
+        'analysis_parallelism': int(parallelism),
+        'analysis_mode': analysis_mode
+    }
+
+
+def _render_endpoint_settings() -> List[Dict]:
+    """
+    渲染额外端点设置（多个密钥或代理网关之间的负载均衡）
+    
+    Returns:
+        端点配置列表
+    """
+    with st.expander("🔀 多端点负载均衡", expanded=False):
+        st.caption("生成正文时，章节请求在主端点和下面的端点之间按权重分流；连续失败的端点会被暂时摘除，"
+                   "到期后自动探测恢复。主端点权重为1，并发上限取“最大并发请求数”。")
+        
+        endpoints = []
+        removed = False
+        for index, config in enumerate(st.session_state.endpoints, 2):
+            endpoint_id = config['id']
+            st.markdown(f"**端点 {index}**")
+            name = st.text_input("名称", value=config.get('name', ''), key=f"endpoint_{endpoint_id}_name",
+                                 placeholder=f"端点{index}")
+            api_key = st.text_input("API Key", value=config.get('api_key', ''), type="password",
+                                    key=f"endpoint_{endpoint_id}_api_key")
+            base_url = st.text_input("Base URL (可选)", value=config.get('base_url', ''),
+                                     key=f"endpoint_{endpoint_id}_base_url")
+            model_name = st.text_input("模型名称 (可选)", value=config.get('model_name', ''),
+                                       key=f"endpoint_{endpoint_id}_model_name", help="留空时使用主端点的模型")
+            col_weight, col_concurrency = st.columns(2)
+            with col_weight:
+                weight = st.number_input("权重", min_value=0.1, max_value=100.0, step=0.5,
+                                         value=float(config.get('weight', DEFAULT_ENDPOINT_WEIGHT)),
+                                         key=f"endpoint_{endpoint_id}_weight")
+            with col_concurrency:
+                max_concurrency = st.number_input("并发上限", min_value=1, max_value=1000, step=1,
+                                                  value=int(config.get('max_concurrency', DEFAULT_ENDPOINT_CONCURRENCY)),
+                                                  key=f"endpoint_{endpoint_id}_max_concurrency")
+            col_enabled, col_remove = st.columns(2)
+            with col_enabled:
+                enabled = st.checkbox("启用", value=config.get('enabled', True), key=f"endpoint_{endpoint_id}_enabled")
+            with col_remove:
+                if st.button("🗑️ 删除", key=f"endpoint_{endpoint_id}_remove", use_container_width=True):
+                    removed = True
+                    continue
+            
+            endpoints.append({
+                'id': endpoint_id,
+                'name': name.strip(),
+                'api_key': api_key.strip(),
+                'base_url': base_url.strip(),
+                'model_name': model_name.strip(),
+                'weight': float(weight),
+                'max_concurrency': int(max_concurrency),
+                'enabled': enabled
+            })
+        
+        if st.button("➕ 添加端点", key="add_endpoint", use_container_width=True):
+            endpoints.append({'id': uuid.uuid4().hex, 'enabled': True})
+            removed = True
+        
+        if removed:
+            st.session_state.endpoints = endpoints
+            st.rerun()
+    
+    return endpoints
+
+
+def _render_route_model_input(label: str, route_key: str, help_text: str) -> str:
+    """渲染单个任务的模型选择，空字符串表示使用主模型"""
+    current = st.session_state.model_routes.get(route_key, '')
+    if st.session_state.get('available_models'):
+        options = [''] + [model for model in st.session_state.available_models if model]
+        if current and current not in options:
+            options.append(current)
+        return st.selectbox(label, options=options, index=options.index(current), key=f"route_{route_key}",
+                            format_func=lambda model: model or "（使用主模型）", help=help_text)
+    return st.text_input(label, value=current, key=f"route_{route_key}", placeholder="留空使用主模型",
+                         help=help_text).strip()
+
+
+def _render_model_routes() -> Dict:
+    """
+    渲染模型路由设置：文档解析、目录生成和章节正文分别使用不同的模型
+    
+    Returns:
+        路由规则字典
+    """
+    with st.expander("🧭 模型路由", expanded=False):
+        st.caption("正文章节数量最多，可以交给更快、更便宜的模型；留空的任务使用上面的主模型。")
+        analysis_model = _render_route_model_input(
+            "文档解析模型", 'analysis_model', "提取项目概述和技术评分要求，需要较长的上下文")
+        outline_model = _render_route_model_input(
+            "目录生成模型", 'outline_model', "生成JSON格式的目录结构，需要稳定地输出结构化结果")
+        chapter_model = _render_route_model_input(
+            "正文生成模型", 'chapter_model', "为每个叶子章节生成正文，请求量最大")
+        major_chapter_model = _render_route_model_input(
+            "重点章节模型", 'major_chapter_model', "层级较浅的叶子章节（没有下级的一级、二级章节）覆盖的内容更多，可单独指定模型")
+        major_chapter_level = st.number_input(
+            "重点章节层级",
+            min_value=0,
+            max_value=3,
+            value=int(st.session_state.model_routes.get('major_chapter_level', 0)),
+            step=1,
+            help="层级不超过该值的叶子章节使用重点章节模型，0表示不区分"
+        )
+    
+    return {
+        'analysis_model': analysis_model,
+        'outline_model': outline_model,
+        'chapter_model': chapter_model,
+        'major_chapter_model': major_chapter_model,
+        'major_chapter_level': int(major_chapter_level)
+    }
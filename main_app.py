@@ -33,8 +33,6 @@ def main():
         st.session_state.api_key = ''
     if 'file_content' not in st.session_state:
         st.session_state.file_content = ''
-    if 'start_analysis' not in st.session_state:
-        st.session_state.start_analysis = False
     if 'project_overview' not in st.session_state:
         st.session_state.project_overview = ''
     if 'tech_requirements' not in st.session_state:
@@ -51,8 +49,6 @@ def main():
         st.session_state.outline_data = None
     if 'outline_generated' not in st.session_state:
         st.session_state.outline_generated = False
-    if 'generating_outline' not in st.session_state:
-        st.session_state.generating_outline = False
 
     # 来自content_edit.py的变量
     if 'chapter_contents' not in st.session_state:
@@ -4,10 +4,12 @@ import PyPDF2
 import docx
 import io
 import logging
-import queue
-import time
 from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from services.openai_servce import get_openai_service, ANALYSIS_MODE_COMBINED, ANALYSIS_SECTIONS
+from services.cancellation import GenerationCancelled
+from services.job_manager import (JOB_ANALYSIS, JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED, JOB_POLL_INTERVAL,
+                                  get_job_manager, get_session_job, submit_session_job, claim_finished_job)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,7 +24,6 @@ class SessionManager:
     KEYS = {
         'api_key': None,
         'file_content': '',
-        'start_analysis': False,
         'project_overview': '',
         'tech_requirements': ''
     }
@@ -133,14 +134,26 @@ class DocumentProcessor:
         """
         if uploaded_file is None:
             return False, "未上传文件"
+        
+        # 获取文件内容（避免多次读取）
+        return DocumentProcessor.extract_text(uploaded_file.getvalue(), uploaded_file.type)
+    
+    @staticmethod
+    def extract_text(file_content: bytes, file_type: str) -> Tuple[bool, str]:
+        """
+        从文件内容中提取文本（不依赖上传组件，可在后台任务中调用）
+        
+        Args:
+            file_content: 文件内容
+            file_type: 文件的MIME类型
             
+        Returns:
+            Tuple[bool, str]: (是否成功, 文本内容或错误信息)
+        """
         try:
-            # 获取文件内容（避免多次读取）
-            file_content = uploaded_file.getvalue()
-            
-            if uploaded_file.type == FileType.PDF.value:
+            if file_type == FileType.PDF.value:
                 return DocumentProcessor._extract_pdf_text(file_content)
-            elif uploaded_file.type == FileType.DOCX.value:
+            elif file_type == FileType.DOCX.value:
                 return DocumentProcessor._extract_docx_text(file_content)
             else:
                 supported_types = [FileType.PDF.value, FileType.DOCX.value]
@@ -234,7 +247,8 @@ def render_document_analysis_page() -> Dict:
     
     if uploaded_file:
         # 检查是否正在解析中，如果是则禁用按钮
-        is_analyzing = SessionManager.get('start_analysis')
+        analysis_job = get_session_job(JOB_ANALYSIS)
+        is_analyzing = analysis_job is not None and not analysis_job.done
         button_text = "⏳ 解析中..." if is_analyzing else "🔍 开始解析"
         if st.button(button_text, type="primary", use_container_width=True, disabled=is_analyzing):
             _handle_analysis_request(uploaded_file)
@@ -280,37 +294,67 @@ def _render_file_uploader():
     )
 
 def _handle_analysis_request(uploaded_file):
-    """处理文档解析请求"""
+    """提交文档解析任务：文本提取和AI分析都在后台任务中进行，页面只轮询进度"""
     if not SessionManager.get('api_key'):
         st.error("请先在左侧配置面板中设置OpenAI API密钥！")
         return
 
-    with st.spinner("正在解析文档..."):
-        success, content = DocumentProcessor.extract_text_from_file(uploaded_file)
-        
-        if success:
-            SessionManager.set('file_content', content)
-            st.success("文档解析完成！正在生成分析结果...")
-            SessionManager.set('start_analysis', True)
-            st.rerun()
-        else:
-            st.error(f"文档解析失败: {content}")
-
-def _fetch_analysis_stream(analysis_type: str, result_queue: queue.Queue, openai_service, file_content: str):
-    """在线程中获取AI分析结果并放入队列"""
     try:
-        content_stream = openai_service.analyze_document(file_content, analysis_type)
-        for chunk in content_stream:
-            result_queue.put((analysis_type, chunk))
+        openai_service = get_openai_service()
     except Exception as e:
-        result_queue.put((analysis_type, f"AI分析失败: {str(e)}"))
-    finally:
-        result_queue.put((analysis_type, None))
+        st.error(f"初始化服务失败: {e}")
+        return
 
-def _render_analysis_results():
-    """渲染AI分析结果"""
+    submit_session_job(JOB_ANALYSIS, _run_analysis_job, openai_service, uploaded_file.getvalue(), uploaded_file.type)
+    st.rerun()
 
-    col1, col2 = st.columns(2)
+def _run_analysis_job(job, openai_service, file_bytes: bytes, file_type: str):
+    """
+    后台任务：提取招标文件文本并分析，两项结果按分析类型写入job的outputs
+
+    运行在后台线程中，不访问Streamlit组件；某一项分析失败时记录到job的errors，另一项照常完成。
+
+    Returns:
+        {'file_content': 提取出的文本}
+    """
+    job.set_stats({'stage': "正在提取文档文本..."})
+    success, file_content = DocumentProcessor.extract_text(file_bytes, file_type)
+    if not success:
+        raise ValueError(f"文档解析失败: {file_content}")
+    job.set_stats({'stage': "文档解析完成，正在生成分析结果..."})
+
+    # 合并模式下一次请求同时返回两项内容；需要分块解析的长文档仍按项分别请求
+    use_combined = (openai_service.analysis_settings.get('mode') == ANALYSIS_MODE_COMBINED
+                    and not openai_service.needs_chunking(file_content))
+    if use_combined:
+        try:
+            for analysis_type, chunk in openai_service.analyze_document_combined(file_content, job.cancel_token):
+                job.append_output(analysis_type, chunk)
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            for analysis_type in ANALYSIS_SECTIONS:
+                job.record_item(analysis_type, error=str(e))
+        return {'file_content': file_content}
+
+    def fetch(analysis_type: str):
+        try:
+            for chunk in openai_service.analyze_document(file_content, analysis_type, job.cancel_token):
+                job.append_output(analysis_type, chunk)
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            # 错误单独记录，不会混入分析结果文本
+            job.record_item(analysis_type, error=str(e))
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(fetch, analysis_type) for analysis_type in ANALYSIS_SECTIONS]
+    for future in futures:
+        future.result()
+    return {'file_content': file_content}
+
+def _render_analysis_results():
+    """渲染AI分析结果：解析任务运行中时实时显示，结束后把结果写入页面状态"""
 
     overview_editor = MarkdownEditor(
         title="项目概述",
@@ -323,84 +367,75 @@ def _render_analysis_results():
         placeholder="这里将显示技术评分要求内容..."
     )
 
-    if not SessionManager.get('start_analysis'):
-        with col1:
-            overview_editor.render()
-        with col2:
-            requirements_editor.render()
+    job = get_session_job(JOB_ANALYSIS)
+    if job is not None and not job.done:
+        if st.button("⏹️ 停止解析", use_container_width=True):
+            job.cancel_token.cancel("已停止解析")
+            st.rerun()
+        _render_analysis_progress(job.id)
         return
 
-    # --- Concurrent Analysis Logic ---
-    try:
-        from services.openai_servce import get_openai_service
-        openai_service = get_openai_service()
-        file_content = SessionManager.get('file_content')
-    except Exception as e:
-        st.error(f"初始化服务失败: {e}")
-        SessionManager.set('start_analysis', False)
-        st.rerun()
-        return
-        
-    result_queue = queue.Queue()
-    analysis_map = {
-        "overview": {"editor": overview_editor, "content": "", "finished": False},
-        "requirements": {"editor": requirements_editor, "content": "", "finished": False},
-    }
+    if job is not None and claim_finished_job(job):
+        _apply_analysis_job(job.snapshot())
 
-    # Render placeholders
+    col1, col2 = st.columns(2)
     with col1:
-        st.markdown(f"**{overview_editor.title}**")
-        overview_editor._render_mode_switch()
-        overview_placeholder = st.empty()
+        overview_editor.render()
     with col2:
-        st.markdown(f"**{requirements_editor.title}**")
-        requirements_editor._render_mode_switch()
-        req_placeholder = st.empty()
-    
-    placeholders = {"overview": overview_placeholder, "requirements": req_placeholder}
+        requirements_editor.render()
 
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        executor.submit(_fetch_analysis_stream, "overview", result_queue, openai_service, file_content)
-        executor.submit(_fetch_analysis_stream, "requirements", result_queue, openai_service, file_content)
-
-        while not all(d["finished"] for d in analysis_map.values()):
-            try:
-                analysis_type, chunk = result_queue.get(timeout=30)
-                data = analysis_map[analysis_type]
-                
-                if chunk is None:
-                    data["finished"] = True
-                    continue
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def _render_analysis_progress(job_id: str):
+    """轮询解析任务，实时显示两项分析结果；任务结束后刷新整个页面"""
+    job = get_job_manager().get(job_id)
+    if job is None or job.done:
+        st.rerun()
+        return
 
-                if isinstance(chunk, str):
-                    data["content"] += chunk
-                
-                content_html = f'''
+    snapshot = job.snapshot()
+    st.caption(snapshot['stats'].get('stage', ''))
+    columns = dict(zip(ANALYSIS_SECTIONS, st.columns(2)))
+    for analysis_type, title in ANALYSIS_SECTIONS.items():
+        with columns[analysis_type]:
+            st.markdown(f"**{title}**")
+            if analysis_type in snapshot['errors']:
+                st.error(f"{title} AI分析失败: {snapshot['errors'][analysis_type]}")
+            content = snapshot['outputs'].get(analysis_type, '')
+            if content:
+                st.markdown(f'''
                 <div style="border: 1px solid #e6e6e6; border-radius: 5px; padding: 15px; margin-bottom: 20px;">
-                    <h4 style="margin-bottom: 10px;">{data["editor"].title} 预览</h4>
+                    <h4 style="margin-bottom: 10px;">{title} 预览</h4>
                     <hr>
-                    {data["content"]}
+                    {content}
                 </div>
-                '''
-                placeholders[analysis_type].markdown(content_html, unsafe_allow_html=True)
-            except queue.Empty:
-                st.warning("分析超时，请检查网络或API设置。")
-                SessionManager.set('start_analysis', False)
-                break
-            except Exception as e:
-                st.error(f"处理队列时出错: {e}")
-                SessionManager.set('start_analysis', False)
-                break
-    
-    SessionManager.update({
-        'project_overview': analysis_map['overview']['content'],
-        'tech_requirements': analysis_map['requirements']['content'],
-        'start_analysis': False
-    })
-    
+                ''', unsafe_allow_html=True)
+
+def _apply_analysis_job(snapshot: Dict):
+    """把已结束的解析任务的结果写入页面状态"""
+    if snapshot['status'] == JOB_FAILED:
+        st.error(snapshot['error'])
+        return
+
+    if snapshot['result']:
+        SessionManager.set('file_content', snapshot['result']['file_content'])
+    # 取消或失败的部分只在生成了内容时覆盖，否则保留之前的解析结果
+    for analysis_type, session_key in (('overview', 'project_overview'), ('requirements', 'tech_requirements')):
+        content = snapshot['outputs'].get(analysis_type, '')
+        succeeded = snapshot['status'] == JOB_COMPLETED and analysis_type not in snapshot['errors']
+        if succeeded or content:
+            SessionManager.set(session_key, content)
+
+    if snapshot['status'] == JOB_CANCELLED:
+        st.warning(f"⏹️ {snapshot['error']}，已保留生成到一半的内容")
+        return
+
+    failed = [ANALYSIS_SECTIONS[analysis_type] for analysis_type in snapshot['errors']]
+    if failed:
+        # 保留错误提示
+        st.error(f"{'、'.join(failed)} 分析失败，请检查网络或API设置后重新解析。")
+        return
+
     st.success("分析全部完成！")
-    time.sleep(1)
-    st.rerun()
 
 def _render_summary():
     """渲染内容总结区域"""
@@ -1,8 +1,12 @@
 import streamlit as st
+import copy
 import json
 import uuid
 from typing import Dict, List, Any, Optional, Tuple
 from services.openai_servce import get_openai_service
+from services.json_stream import OutlineStreamParser
+from services.job_manager import (JOB_OUTLINE, JOB_COMPLETED, JOB_CANCELLED, JOB_POLL_INTERVAL, get_job_manager,
+                                  get_session_job, submit_session_job, claim_finished_job)
 from components.tree_display import render_tree_display
 
 
@@ -18,6 +22,12 @@ def render_outline_edit_page() -> Dict:
     # 初始化状态
     _init_session_state()
     
+    # 目录在后台任务中生成，页面只轮询进度；新打开的标签页从任务的输入恢复项目信息
+    outline_job = get_session_job(JOB_OUTLINE)
+    if outline_job is not None and not st.session_state.get('project_overview'):
+        st.session_state.project_overview = outline_job.inputs.get('project_overview', '')
+        st.session_state.tech_requirements = outline_job.inputs.get('tech_requirements', '')
+    
     # 检查前置条件
     if not _check_prerequisites():
         return {"outline_data": None}
@@ -25,9 +35,9 @@ def render_outline_edit_page() -> Dict:
     # 渲染控制面板
     _render_control_panel()
     
-    # 处理目录生成
-    if st.session_state.generating_outline and not st.session_state.outline_generated:
-        _handle_outline_generation()
+    # 任务结束后把结果写入页面状态
+    if outline_job is not None:
+        _handle_outline_job(outline_job)
     
     # 显示目录树
     if st.session_state.outline_data:
@@ -44,7 +54,6 @@ def _init_session_state():
     defaults = {
         'outline_data': None,
         'outline_generated': False,
-        'generating_outline': False,
         'show_add_dialog': False,
         'show_edit_dialog': False,
         'editing_chapter': None
@@ -76,19 +85,19 @@ def _render_control_panel():
     # """, unsafe_allow_html=True)
     
     col1, col2, col3 = st.columns([1.2, 1.2, 1.6])
+    outline_job = get_session_job(JOB_OUTLINE)
+    generating = outline_job is not None and not outline_job.done
     
     with col1:
         # 生成目录按钮
         if st.button(
-            "🔄 正在生成..." if st.session_state.generating_outline else "🚀 生成目录",
+            "🔄 正在生成..." if generating else "🚀 生成目录",
             type="primary",
-            disabled=st.session_state.generating_outline,
+            disabled=generating,
             use_container_width=True,
             help="基于项目概述和技术要求生成标书目录结构"
         ):
-            st.session_state.generating_outline = True
-            st.session_state.outline_generated = False
-            st.rerun()
+            _start_outline_generation()
     
     with col2:
         # 新增目录项按钮
@@ -152,52 +161,147 @@ def _render_status_indicator():
     st.markdown(status_html, unsafe_allow_html=True)
 
 
-def _handle_outline_generation():
-    """处理目录生成"""
-    with st.spinner("🤖 正在生成目录，请稍后..."):
-        outline_data = _generate_outline()
+def _start_outline_generation():
+    """提交目录生成任务"""
+    overview = st.session_state.project_overview
+    requirements = st.session_state.tech_requirements
+    if not overview or not requirements:
+        st.error("⚠️ 项目概述或技术要求为空")
+        return
+    
+    try:
+        openai_service = get_openai_service()
+    except Exception as e:
+        st.error(f"🚨 生成目录时发生错误：{str(e)}")
+        return
+    
+    submit_session_job(JOB_OUTLINE, _run_outline_job, openai_service, overview, requirements,
+                       inputs={'project_overview': overview, 'tech_requirements': requirements})
+    st.session_state.outline_generated = False
+    st.rerun()
+
+
+def _run_outline_job(job, openai_service, overview: str, requirements: str):
+    """后台任务：流式生成目录JSON，写入job的outputs（在后台线程中运行，不访问Streamlit组件）"""
+    for chunk in openai_service.generate_outline(overview, requirements, job.cancel_token):
+        job.append_output('outline', chunk)
+
+
+def _handle_outline_job(job):
+    """目录生成任务运行中时显示进度和停止按钮；结束后应用结果（每个会话只应用一次）"""
+    if not job.done:
+        if st.button("⏹️ 停止生成目录", use_container_width=True):
+            job.cancel_token.cancel("已停止生成目录")
+            st.rerun()
+        _render_outline_progress(job.id)
+        return
+    
+    if claim_finished_job(job):
+        outline_data = _apply_outline_job(job.snapshot())
         if outline_data:
             st.session_state.outline_data = outline_data
             st.session_state.outline_generated = True
-            st.session_state.generating_outline = False
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def _render_outline_progress(job_id: str):
+    """轮询目录生成任务，已完整接收的章节标题实时绘制成目录树；任务结束后刷新整个页面"""
+    job = get_job_manager().get(job_id)
+    if job is None or job.done:
+        st.rerun()
+        return
+    
+    st.info("🤖 正在生成目录，已完成的章节会实时显示...")
+    parser = _outline_parser(job.id, job.snapshot()['outputs'].get('outline', ''))
+    partial_outline = parser.partial_outline()
+    if partial_outline:
+        render_tree_display({'outline': partial_outline}, key_prefix="outline_stream")
+    
+    # 已完整接收的一级章节可以先交给正文编辑，不必等整个目录生成完
+    completed = parser.completed_chapters
+    if completed:
+        handed_off = st.session_state.get('outline_handoff') == (job.id, len(completed))
+        if st.button(f"✍️ 先用已完成的 {len(completed)} 个一级章节编写正文", disabled=handed_off,
+                     use_container_width=True, key="outline_handoff_button",
+                     help="目录的其余部分生成完成后会替换为完整目录，届时在正文编辑页点击“更新变更章节”，"
+                          "已生成的章节输入不变，只生成新增的章节"):
+            _hand_off_completed_chapters(job.id, completed)
             st.rerun()
+        if st.session_state.get('outline_handoff', (None, 0))[0] == job.id:
+            st.caption(f"已交给正文编辑 {st.session_state.outline_handoff[1]} 个一级章节，可前往“正文编辑”开始生成")
+
+
+def _hand_off_completed_chapters(job_id: str, completed_chapters: List[Dict]):
+    """把已完整接收的一级章节作为当前目录，后续步骤先基于这些章节开始"""
+    outline_data = {'outline': copy.deepcopy(completed_chapters)}
+    if not _validate_outline_structure(outline_data):
+        return
+    st.session_state.outline_data = outline_data
+    st.session_state.outline_generated = False
+    st.session_state.outline_handoff = (job_id, len(completed_chapters))
+
+
+def _outline_parser(job_id: str, outline_json: str) -> OutlineStreamParser:
+    """
+    任务对应的增量解析器，保存在session_state中，每次只解析上次之后新收到的文本
 
+    Args:
+        job_id: 目录生成任务ID
+        outline_json: 任务目前为止的全部输出
 
-def _generate_outline() -> Optional[Dict]:
-    """生成目录数据"""
+    Returns:
+        已解析到outline_json末尾的解析器
+    """
+    state = st.session_state.get('outline_stream_parser')
+    if state is None or state['job_id'] != job_id or len(outline_json) < state['consumed']:
+        state = {'job_id': job_id, 'parser': OutlineStreamParser(), 'consumed': 0}
+        st.session_state.outline_stream_parser = state
+    if len(outline_json) > state['consumed']:
+        state['parser'].feed(outline_json[state['consumed']:])
+        state['consumed'] = len(outline_json)
+    return state['parser']
+
+
+def _apply_outline_job(snapshot: Dict) -> Optional[Dict]:
+    """解析已结束的目录生成任务的输出；未完整生成时保留已经完整接收的一级章节"""
+    outline_json = snapshot['outputs'].get('outline', '')
+    parser = _outline_parser(snapshot['id'], outline_json)
+    st.session_state.pop('outline_stream_parser', None)
+    
+    if snapshot['status'] == JOB_CANCELLED:
+        st.warning(f"⏹️ {snapshot['error']}")
+        return _keep_completed_chapters(parser)
+    if snapshot['status'] != JOB_COMPLETED:
+        st.error(f"🚨 生成目录时发生错误：{snapshot['error']}")
+        return _keep_completed_chapters(parser)
+    
+    if not outline_json.strip():
+        st.error("🤖 AI服务返回空内容")
+        return None
+    
     try:
-        openai_service = get_openai_service()
-        overview = st.session_state.project_overview
-        requirements = st.session_state.tech_requirements
-        
-        if not overview or not requirements:
-            st.error("⚠️ 项目概述或技术要求为空")
-            return None
-        
-        # 调用AI生成目录
-        outline_json = ""
-        for chunk in openai_service.generate_outline(overview, requirements):
-            outline_json += chunk
-        
-        if not outline_json.strip():
-            st.error("🤖 AI服务返回空内容")
-            return None
-        
-        # 解析JSON
         outline_data = json.loads(outline_json)
-        
-        # 验证数据结构
-        if not _validate_outline_structure(outline_data):
-            return None
-        
-        return outline_data
-        
     except json.JSONDecodeError as e:
         st.error(f"📝 解析目录数据失败：{str(e)}")
+        return _keep_completed_chapters(parser)
+    
+    # 验证数据结构
+    if not _validate_outline_structure(outline_data):
         return None
-    except Exception as e:
-        st.error(f"🚨 生成目录时发生错误：{str(e)}")
+    return outline_data
+
+
+def _keep_completed_chapters(parser: OutlineStreamParser) -> Optional[Dict]:
+    """生成中断时保留已经完整接收的一级章节，后续步骤可以先基于这些章节继续"""
+    if not parser.completed_chapters:
         return None
+    
+    outline_data = {'outline': parser.completed_chapters}
+    if not _validate_outline_structure(outline_data):
+        return None
+    
+    st.warning(f"⚠️ 目录未完整生成，已保留 {len(parser.completed_chapters)} 个完整的一级章节，可重新生成或手动补充")
+    return outline_data
 
 
 def _validate_outline_structure(data: Dict) -> bool:
@@ -0,0 +1,587 @@
+import asyncio
+import threading
+import time
+import streamlit as st
+from typing import AsyncGenerator, Callable, Dict, List, Optional, Tuple
+from services.openai_servce import OpenAIService, get_rate_limit_settings, get_model_routes, CHAPTER_TEMPERATURE
+from services.model_router import ModelRouter, TASK_CHAPTER
+from services.retry_policy import RetryPolicy, classify_error, build_resume_messages, DEFAULT_MAX_RETRIES
+from services.rate_limiter import estimate_prompt_tokens, estimate_text_tokens, DEFAULT_COMPLETION_TOKENS
+from services.response_cache import get_response_cache, iter_cached_chunks
+from services.client_registry import get_async_openai_client, get_http_settings
+from services.concurrency_controller import get_concurrency_controller, DEFAULT_MAX_LIMIT
+from services.endpoint_pool import EndpointPool, PooledEndpoint, DEFAULT_ENDPOINT_WEIGHT, DEFAULT_ENDPOINT_CONCURRENCY
+from services.usage_tracker import (
+    get_usage_tracker,
+    stream_usage_options,
+    is_stream_options_rejected,
+    mark_stream_usage_unsupported
+)
+from services.telemetry import CallMetrics, get_telemetry
+from services.hedging import (StreamProgress, LatencyTracker, HedgeBudget, DEFAULT_HEDGE_RATIO,
+                              HEDGE_CHECK_INTERVAL)
+from services.cancellation import CancellationToken
+from services.singleflight import get_inflight_table, make_flight_key
+from services.context_compression import ContextSavings, sibling_digest
+
+# 同时在途的请求数上限，实际并发数由自适应控制器在此范围内调整
+DEFAULT_MAX_CONCURRENCY = DEFAULT_MAX_LIMIT
+
+# 进程级后台事件循环，所有异步请求共用
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_event_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    获取进程级后台事件循环，首次调用时在守护线程中启动
+
+    Streamlit脚本线程本身没有事件循环，且每次rerun都会重新执行脚本，
+    因此所有异步请求统一提交到这个常驻循环中运行。
+
+    Returns:
+        正在运行的事件循环
+    """
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None or _event_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="async-openai-loop", daemon=True)
+            thread.start()
+            _event_loop = loop
+    return _event_loop
+
+
+def run_coroutine(coro):
+    """
+    将协程提交到后台事件循环执行
+
+    Args:
+        coro: 待执行的协程
+
+    Returns:
+        concurrent.futures.Future，可在调用线程中等待结果
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+class AsyncOpenAIService(OpenAIService):
+    """基于AsyncOpenAI客户端的异步服务类，在单个事件循环中并发生成大量章节"""
+
+    def __init__(self, api_key: str, base_url: str = None, model_name: str = "gpt-3.5-turbo",
+                 use_cache: bool = True, http_settings: dict = None, rate_limits: dict = None,
+                 max_retries: int = DEFAULT_MAX_RETRIES, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 endpoints: list = None, hedge_ratio: float = DEFAULT_HEDGE_RATIO, model_routes: dict = None):
+        """
+        初始化异步OpenAI服务
+
+        Args:
+            api_key: OpenAI API密钥
+            base_url: 基础URL（可选，用于代理）
+            model_name: 模型名称
+            use_cache: 是否使用本地响应缓存
+            http_settings: 连接设置（超时、连接池大小）
+            rate_limits: 限流预算 {'rpm_limit': ..., 'tpm_limit': ...}
+            max_retries: 单次调用遇到临时错误时的最大重试次数
+            max_concurrency: 同时在途的请求数上限（自适应并发控制器的上限）
+            endpoints: 额外的端点配置，见configure_endpoints
+            hedge_ratio: 对冲预算，对冲请求数最多为章节数的该比例，0表示关闭
+            model_routes: 按任务类型选择模型的规则，见ModelRouter
+        """
+        super().__init__(api_key, base_url, model_name, use_cache=use_cache, http_settings=http_settings,
+                         rate_limits=rate_limits, max_retries=max_retries, model_routes=model_routes)
+        self.max_concurrency = max_concurrency
+
+        # 异步客户端同样由client_registry共享，提示词构建等逻辑复用同步服务
+        self.async_client = get_async_openai_client(api_key, base_url, **self.http_settings)
+
+        self.endpoint_pool: Optional[EndpointPool] = None
+        self.configure_endpoints(endpoints or [])
+
+        # 对冲阈值来自本服务最近请求的延迟分布；预算按每次生成任务单独计算，见generate_chapters
+        self.hedge_ratio = hedge_ratio
+        self.latency_tracker = LatencyTracker()
+
+    @property
+    def concurrency_controller(self):
+        """主端点上章节正文所用模型的自适应并发控制器"""
+        return get_concurrency_controller(self.base_url, self.router.model_for(TASK_CHAPTER), self.max_concurrency,
+                                          self.api_key)
+
+    def configure_endpoints(self, endpoints: list) -> None:
+        """
+        配置额外的端点；配置后章节请求在主端点和这些端点之间按权重和健康状态分流
+
+        需要在主线程中调用（端点的客户端通过client_registry获取）。
+
+        Args:
+            endpoints: 端点配置列表，每项包含name/api_key/base_url/model_name/weight/max_concurrency/enabled，
+                       model_name为空时跟随模型路由（与主端点使用相同的模型）
+        """
+        extra_endpoints = [config for config in endpoints if config.get('enabled', True) and config.get('api_key')]
+        if not extra_endpoints:
+            self.endpoint_pool = None
+            return
+
+        pooled = [PooledEndpoint("主端点", self.api_key, self.base_url, '',
+                                 weight=DEFAULT_ENDPOINT_WEIGHT, max_concurrency=self.max_concurrency,
+                                 client=self.async_client)]
+        for index, config in enumerate(extra_endpoints, 2):
+            base_url = config.get('base_url', '')
+            pooled.append(PooledEndpoint(
+                config.get('name') or f"端点{index}",
+                config['api_key'],
+                base_url,
+                config.get('model_name', ''),
+                weight=float(config.get('weight', DEFAULT_ENDPOINT_WEIGHT)),
+                max_concurrency=int(config.get('max_concurrency', DEFAULT_ENDPOINT_CONCURRENCY)),
+                client=get_async_openai_client(config['api_key'], base_url, **self.http_settings)
+            ))
+
+        if self.endpoint_pool is None:
+            self.endpoint_pool = EndpointPool(pooled)
+        else:
+            self.endpoint_pool.configure(pooled)
+
+    def _route(self, endpoint: Optional[PooledEndpoint], model_name: str) -> tuple:
+        """返回本次尝试使用的 (客户端, base_url, 模型, 密钥, 并发上限)，未配置端点池时使用主端点"""
+        if endpoint is None:
+            return self.async_client, self.base_url, model_name, self.api_key, self.max_concurrency
+        return (endpoint.client, endpoint.base_url, endpoint.model_name or model_name, endpoint.api_key,
+                endpoint.max_concurrency)
+
+    async def astream_chat_completion(
+        self,
+        messages: list,
+        temperature: float = 0.7,
+        response_format: dict = None,
+        progress: Optional[StreamProgress] = None,
+        avoid_endpoints: list = None,
+        model_name: str = None,
+        task: str = None,
+        chapter_id: str = None,
+        share: bool = True
+    ) -> AsyncGenerator[str, None]:
+        """
+        异步流式聊天完成请求
+
+        Args:
+            messages: 消息列表
+            temperature: 温度参数，控制随机性
+            response_format: 返回格式（可选）
+            progress: 用于对外报告请求进度（可选）
+            avoid_endpoints: 尽量避开的端点（对冲请求避开原请求所在的端点）
+            model_name: 使用的模型（可选），默认按任务类型由self.router选择；端点配置了固定模型时以端点为准
+            task: 任务类型（可选），写入调用记录
+            chapter_id: 章节编号（可选），写入调用记录
+            share: 相同的请求正在进行时是否直接跟随其输出（对冲请求必须为False），见services.singleflight
+
+        Yields:
+            流式返回的文本片段
+
+        Raises:
+            LLMServiceError: 重试预算用尽或遇到不可重试的错误
+        """
+        requested_model = model_name or (self.router.model_for(task) if task else self.model_name)
+
+        # 命中本地缓存时直接回放；SQLite读写放到线程池，避免阻塞事件循环
+        cache_key = None
+        if self.use_cache:
+            cache = get_response_cache()
+            cache_key = cache.make_key(requested_model, messages, temperature, response_format)
+            cached_content = await asyncio.to_thread(cache.get, cache_key)
+            if cached_content is not None:
+                for piece in iter_cached_chunks(cached_content):
+                    yield piece
+                get_telemetry().record(CallMetrics(task, chapter_id, requested_model, self.base_url).finish('cache_hit'))
+                return
+
+        def start(received):
+            return self._arequest_stream(messages, temperature, response_format, progress, avoid_endpoints,
+                                         requested_model, task, chapter_id, cache_key, received)
+
+        if not share:
+            async for chunk in start([]):
+                yield chunk
+            return
+        flight_key = make_flight_key(self.base_url, requested_model, messages, temperature, response_format)
+        async for chunk in get_inflight_table().astream(
+            flight_key,
+            start,
+            on_shared=lambda: get_telemetry().record(
+                CallMetrics(task, chapter_id, requested_model, self.base_url).finish('shared')),
+            progress=progress
+        ):
+            yield chunk
+
+    async def _arequest_stream(self, messages: list, temperature: float, response_format: Optional[dict],
+                               progress: Optional[StreamProgress], avoid_endpoints: Optional[list],
+                               requested_model: str, task: Optional[str], chapter_id: Optional[str],
+                               cache_key: Optional[str], received: list) -> AsyncGenerator[str, None]:
+        """实际请求接口（含端点选择、限流、自适应并发、重试和断点续写），参数见astream_chat_completion和_request_stream"""
+        # 记录本次调用的排队、首字延迟、耗时和用量，见services.telemetry
+        metrics = CallMetrics(task, chapter_id, requested_model, self.base_url)
+        status, call_error = 'error', None
+        try:
+            collected = list(received)
+            retries_done = 0
+            total_delay = 0.0
+            failed_endpoints = list(avoid_endpoints or [])
+            # 接口拒绝stream_options时本次调用不再携带
+            without_usage_options = False
+            while True:
+                # 断点续写：中途断开时让模型接着已输出的内容继续，调用方不会收到重复片段
+                request_messages = build_resume_messages(messages, "".join(collected))
+                prompt_tokens = estimate_prompt_tokens(request_messages)
+                estimated_tokens = prompt_tokens + DEFAULT_COMPLETION_TOKENS
+
+                endpoint = None
+                rate_limiter = None
+                controller = None
+                attempt_output = []
+                usage = None
+                stream = None
+                usage_options = {}
+                try:
+                    # 配置了多个端点时由端点池为每次尝试选择端点，失败后优先换到其他端点
+                    queued_at = time.monotonic()
+                    if self.endpoint_pool is not None:
+                        endpoint = await self.endpoint_pool.acquire(failed_endpoints)
+                    client, base_url, model_name, api_key, max_concurrency = self._route(endpoint, requested_model)
+                    if not without_usage_options:
+                        usage_options = stream_usage_options(base_url)
+
+                    # 先按RPM/TPM预算排队（不占用并发名额），请求结束后按实际输出修正token消耗
+                    rate_limiter = self._rate_limiter_for(base_url, model_name, api_key)
+                    await rate_limiter.aacquire(estimated_tokens)
+
+                    # 由自适应并发控制器决定何时可以发出请求，并把首字延迟和错误反馈给它
+                    endpoint_controller = get_concurrency_controller(base_url, model_name, max_concurrency, api_key)
+                    await endpoint_controller.acquire()
+                    controller = endpoint_controller
+                    metrics.queued(time.monotonic() - queued_at)
+
+                    started_at = time.monotonic()
+                    first_token_at = None
+                    last_token_at = None
+                    max_gap = 0.0
+                    if progress is not None:
+                        progress.mark_sent(endpoint)
+                    metrics.sent(endpoint.name if endpoint is not None else None, model_name)
+                    stream = await client.chat.completions.create(
+                        model=model_name,
+                        messages=request_messages,
+                        temperature=temperature,
+                        stream=True,
+                        **usage_options,
+                        **({"response_format": response_format} if response_format is not None else {})
+                    )
+
+                    async for chunk in stream:
+                        # 最后一个chunk携带usage（含服务端前缀缓存命中的cached_tokens）
+                        if getattr(chunk, 'usage', None) is not None:
+                            usage = chunk.usage
+                        if chunk.choices and chunk.choices[0].delta.content is not None:
+                            now = time.monotonic()
+                            if first_token_at is None:
+                                first_token_at = now
+                            else:
+                                max_gap = max(max_gap, now - last_token_at)
+                            last_token_at = now
+                            if progress is not None:
+                                progress.mark_token()
+                            metrics.token(chunk.choices[0].delta.content)
+                            attempt_output.append(chunk.choices[0].delta.content)
+                            collected.append(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+
+                    first_token_latency = (first_token_at or time.monotonic()) - started_at
+                    controller.record_success(first_token_latency)
+                    self.latency_tracker.record(first_token_latency, max_gap)
+                    if endpoint is not None:
+                        self.endpoint_pool.record_success(endpoint)
+                    if usage is not None:
+                        get_usage_tracker(base_url, model_name).record(usage)
+                    if without_usage_options and stream_usage_options(base_url):
+                        mark_stream_usage_unsupported(base_url)
+                    break
+
+                except asyncio.CancelledError:
+                    # 对冲竞速中落后的一方被取消时，立即关闭连接
+                    if stream is not None:
+                        await stream.close()
+                    raise
+                except Exception as e:
+                    if usage_options and not attempt_output and is_stream_options_rejected(e):
+                        # 接口可能不接受stream_options：去掉后立即重试一次，不计入重试次数，也不算作端点故障
+                        without_usage_options = True
+                        continue
+                    if controller is not None:
+                        controller.record_failure(e)
+                    if endpoint is not None:
+                        self.endpoint_pool.record_failure(endpoint, e)
+                        failed_endpoints.append(endpoint)
+                    error = classify_error(e, "".join(collected), retries_done + 1)
+                    delay = self.retry_policy.next_delay(error, retries_done, total_delay)
+                    if delay is None:
+                        raise error from e
+                    # 还有其他可用端点时立即换端点重试，不必退避等待
+                    if endpoint is not None and self.endpoint_pool.has_alternative(endpoint):
+                        delay = 0.0
+                finally:
+                    if usage is not None:
+                        metrics.add_usage(usage)
+                    # 退避等待期间不占用并发名额
+                    if controller is not None:
+                        await controller.release()
+                    if endpoint is not None:
+                        self.endpoint_pool.release(endpoint)
+                    if rate_limiter is not None:
+                        actual_tokens = usage.total_tokens if usage is not None else prompt_tokens + estimate_text_tokens("".join(attempt_output))
+                        rate_limiter.settle(estimated_tokens, actual_tokens)
+
+                retries_done += 1
+                total_delay += delay
+                await asyncio.sleep(delay)
+
+            # 只缓存完整结束的响应
+            if cache_key is not None and collected:
+                await asyncio.to_thread(get_response_cache().put, cache_key, "".join(collected), requested_model)
+            status = 'ok'
+        except (asyncio.CancelledError, GeneratorExit):
+            # 被取消（如对冲竞速中落后的一方），或调用方提前停止读取
+            status = 'cancelled'
+            raise
+        except Exception as e:
+            call_error = e
+            raise
+        finally:
+            get_telemetry().record(metrics.finish(status, call_error))
+
+    async def agenerate_chapter_content(self, chapter: dict, parent_chapters: list = None,
+                                        sibling_chapters: list = None, project_overview: str = "",
+                                        hedge_budget: Optional[HedgeBudget] = None,
+                                        context_info: Optional[str] = None,
+                                        references: Optional[List[str]] = None) -> str:
+        """
+        异步为单个章节生成内容
+
+        Args:
+            chapter: 章节数据
+            parent_chapters: 上级章节列表
+            sibling_chapters: 同级章节列表
+            project_overview: 项目概述信息
+            hedge_budget: 对冲预算（可选），提供时对卡住的请求发出对冲请求
+            context_info: 预先生成的上下文文本（可选），见OutlineIndex
+            references: 招标文件参考段落（可选），见TenderIndex
+
+        Returns:
+            生成的内容字符串
+        """
+        messages = self._build_chapter_messages(chapter, parent_chapters, sibling_chapters, project_overview,
+                                                context_info, references)
+        model_name = self.router.model_for(TASK_CHAPTER, level=len(parent_chapters or []) + 1)
+        if hedge_budget is None:
+            full_content = await self._acollect(messages, CHAPTER_TEMPERATURE, model_name, chapter.get('id'))
+        else:
+            full_content = await self._acollect_hedged(messages, CHAPTER_TEMPERATURE, model_name, chapter.get('id'),
+                                                       hedge_budget)
+        return full_content.strip()
+
+    async def _acollect(self, messages: list, temperature: float, model_name: str, chapter_id: str,
+                        progress: Optional[StreamProgress] = None, avoid_endpoints: list = None,
+                        share: bool = True) -> str:
+        full_content = ""
+        async for chunk in self.astream_chat_completion(messages, temperature=temperature, progress=progress,
+                                                        avoid_endpoints=avoid_endpoints, model_name=model_name,
+                                                        task=TASK_CHAPTER, chapter_id=chapter_id, share=share):
+            full_content += chunk
+        return full_content
+
+    async def _acollect_hedged(self, messages: list, temperature: float, model_name: str, chapter_id: str,
+                               budget: HedgeBudget) -> str:
+        """
+        带对冲的请求：原请求在首字或输出上卡住超过阈值时，在预算内再发一个相同的请求，
+        取先完成的一方，取消另一方
+
+        阈值取最近请求首字延迟（或最长输出间隔）的高百分位；在排队等待限流和并发名额时不计时。
+
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            model_name: 使用的模型
+            chapter_id: 章节编号
+            budget: 本次生成任务的对冲预算
+
+        Returns:
+            生成的完整内容
+        """
+        budget.record_request()
+        progress = StreamProgress()
+        primary = asyncio.ensure_future(self._acollect(messages, temperature, model_name, chapter_id, progress))
+        hedge = None
+        try:
+            while not primary.done() and budget.ratio > 0:
+                stalled = progress.stalled_for(time.monotonic())
+                if stalled is not None:
+                    kind, seconds = stalled
+                    if seconds >= self.latency_tracker.threshold(kind) and budget.try_spend():
+                        avoid = [progress.endpoint] if progress.endpoint is not None else []
+                        # 对冲请求与原请求完全相同，不能跟随原请求的输出
+                        hedge = asyncio.ensure_future(self._acollect(messages, temperature, model_name, chapter_id,
+                                                                     avoid_endpoints=avoid, share=False))
+                        break
+                await asyncio.wait([primary], timeout=HEDGE_CHECK_INTERVAL)
+
+            if hedge is None:
+                return await primary
+
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            budget.record_win()
+                        return task.result()
+            # 两个请求都失败时，报告原请求的错误
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if task is None:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # 取走同时失败一方的异常，避免事件循环告警
+                    task.exception()
+
+    async def generate_chapters(
+        self,
+        leaf_nodes_info: List[Tuple[str, dict]],
+        project_overview: str,
+        on_result: Callable[[Tuple[str, Optional[str], Optional[str]]], None],
+        cancel_token: Optional[CancellationToken] = None,
+        run_stats: Optional[Dict] = None
+    ) -> int:
+        """
+        在事件循环中并发生成所有叶子章节，在途请求数由自适应并发控制器限制，
+        卡住的章节在对冲预算内自动重发
+
+        Args:
+            leaf_nodes_info: (章节路径, 节点信息) 列表，节点信息包含chapter/parent_chapters/sibling_chapters，
+                             以及可选的预先生成的上下文context（见OutlineIndex.leaf_nodes_info）和招标文件参考段落references
+            project_overview: 项目概述
+            on_result: 每个章节完成后的回调，参数为 (章节路径, 内容, 错误信息)；
+                       回调在事件循环线程中执行，不能访问Streamlit组件
+            cancel_token: 取消信号（可选），取消后未完成的章节全部取消并关闭连接，已完成的章节照常回调
+            run_stats: 本次任务的统计（可选），开始时写入对冲预算hedging（HedgeBudget）和
+                       上下文压缩统计context（ContextSavings），任务运行中可以随时读取快照
+
+        Returns:
+            完成的章节数
+        """
+        # 服务按会话缓存，同一会话的多次任务不共用预算和统计
+        hedge_budget = HedgeBudget(self.hedge_ratio)
+        # 同级章节摘要按上级章节缓存，这里顺便统计本次任务中压缩节省的提示词token
+        context_savings = ContextSavings()
+        for _, node_info in leaf_nodes_info:
+            siblings = node_info['sibling_chapters']
+            if siblings and any(sibling.get('id') != node_info['chapter'].get('id') for sibling in siblings):
+                _, full_tokens, digest_tokens = sibling_digest(siblings)
+                context_savings.record(full_tokens, digest_tokens)
+        if run_stats is not None:
+            run_stats.update(hedging=hedge_budget, context=context_savings)
+        loop = asyncio.get_running_loop()
+
+        async def generate_single_node(node_path: str, node_info: dict):
+            try:
+                generated_text = await self.agenerate_chapter_content(
+                    node_info['chapter'],
+                    parent_chapters=node_info['parent_chapters'],
+                    sibling_chapters=node_info['sibling_chapters'],
+                    project_overview=project_overview,
+                    hedge_budget=hedge_budget,
+                    context_info=node_info.get('context'),
+                    references=node_info.get('references')
+                )
+                return node_path, generated_text, None
+            except Exception as e:
+                return node_path, None, f"生成失败: {str(e)}"
+
+        tasks = [asyncio.ensure_future(generate_single_node(node_path, node_info))
+                 for node_path, node_info in leaf_nodes_info]
+
+        def cancel_pending():
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        # 取消信号来自页面线程，转到事件循环中取消任务；被取消的请求在astream_chat_completion中关闭连接
+        remove_callback = None
+        if cancel_token is not None:
+            remove_callback = cancel_token.add_callback(lambda: loop.call_soon_threadsafe(cancel_pending))
+
+        completed_count = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                try:
+                    result = await finished
+                except asyncio.CancelledError:
+                    if cancel_token is not None and cancel_token.cancelled:
+                        continue
+                    raise
+                on_result(result)
+                completed_count += 1
+        finally:
+            if remove_callback is not None:
+                remove_callback()
+            # 整个任务被取消或出错时，不留下仍在请求的章节
+            cancel_pending()
+        return completed_count
+
+
+def get_async_openai_service() -> AsyncOpenAIService:
+    """
+    获取异步OpenAI服务实例，与get_openai_service一样按当前配置缓存
+
+    Returns:
+        AsyncOpenAIService实例
+    """
+    api_key = st.session_state.get('api_key', '')
+    base_url = st.session_state.get('base_url', '')
+    model_name = st.session_state.get('model_name', 'gpt-3.5-turbo')
+    use_cache = not st.session_state.get('bypass_cache', False)
+    http_settings = get_http_settings()
+    max_concurrency = int(st.session_state.get('max_concurrency', DEFAULT_MAX_CONCURRENCY))
+    rate_limits = get_rate_limit_settings()
+    max_retries = int(st.session_state.get('max_retries', DEFAULT_MAX_RETRIES))
+    endpoints = st.session_state.get('endpoints', [])
+    hedge_ratio = float(st.session_state.get('hedge_ratio', DEFAULT_HEDGE_RATIO))
+    model_routes = get_model_routes()
+
+    if not api_key:
+        raise ValueError("请先配置OpenAI API密钥")
+
+    cached_service = st.session_state.get('async_openai_service_instance')
+    if (cached_service and
+        cached_service.api_key == api_key and
+        cached_service.base_url == base_url and
+        cached_service.model_name == model_name and
+        cached_service.http_settings == http_settings):
+        cached_service.use_cache = use_cache
+        cached_service.max_concurrency = max_concurrency
+        cached_service.rate_limits = rate_limits
+        cached_service.retry_policy = RetryPolicy(max_retries=max_retries)
+        cached_service.configure_endpoints(endpoints)
+        cached_service.hedge_ratio = hedge_ratio
+        cached_service.router = ModelRouter(model_name, model_routes)
+        return cached_service
+
+    new_service = AsyncOpenAIService(api_key, base_url, model_name, use_cache=use_cache,
+                                     http_settings=http_settings, rate_limits=rate_limits,
+                                     max_retries=max_retries, max_concurrency=max_concurrency,
+                                     endpoints=endpoints, hedge_ratio=hedge_ratio, model_routes=model_routes)
+    st.session_state.async_openai_service_instance = new_service
+
+    return new_service
@@ -0,0 +1,269 @@
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from services.retry_policy import classify_error
+from services.model_router import TASK_CHAPTER
+
+# Batch接口参数
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+
+# 自动刷新任务状态的间隔（秒）
+BATCH_POLL_INTERVAL = 30
+
+# 任务的终止状态，之后不会再变化
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+BATCH_STATUS_LABELS = {
+    "validating": "校验中",
+    "in_progress": "进行中",
+    "finalizing": "整理结果中",
+    "completed": "已完成",
+    "failed": "失败",
+    "expired": "已过期",
+    "cancelling": "取消中",
+    "cancelled": "已取消",
+}
+
+# 已提交的任务保存在本地，关闭页面后也可以回来合并结果
+BATCH_JOBS_DIR = os.path.join(os.path.expanduser("~"), ".ai_write_helper", "batch_jobs")
+
+
+def build_batch_file(requests: List[Tuple[str, list]], model_name: str, temperature: float = 0.7) -> bytes:
+    """
+    将请求序列化为Batch接口要求的JSONL文件
+
+    Args:
+        requests: (custom_id, 消息列表) 列表
+        model_name: 模型名称
+        temperature: 温度参数
+
+    Returns:
+        JSONL文件内容
+    """
+    lines = []
+    for custom_id, messages in requests:
+        lines.append(json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {
+                "model": model_name,
+                "messages": messages,
+                "temperature": temperature
+            }
+        }, ensure_ascii=False))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def parse_batch_output(text: str) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """
+    解析Batch接口的输出文件（或错误文件）
+
+    Args:
+        text: JSONL文件内容
+
+    Returns:
+        {custom_id: (生成内容, 错误信息)}，两者只有一个不为None
+    """
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+
+        custom_id = record.get('custom_id')
+        if not custom_id:
+            continue
+        error = record.get('error')
+        response = record.get('response') or {}
+        body = response.get('body') or {}
+
+        if error:
+            message = error.get('message') if isinstance(error, dict) else str(error)
+            results[custom_id] = (None, f"生成失败: {message}")
+        elif response.get('status_code') != 200:
+            message = (body.get('error') or {}).get('message') or f"HTTP {response.get('status_code')}"
+            results[custom_id] = (None, f"生成失败: {message}")
+        else:
+            try:
+                content = body['choices'][0]['message']['content'] or ''
+            except (KeyError, IndexError, TypeError):
+                results[custom_id] = (None, "生成失败: 返回格式错误")
+                continue
+            results[custom_id] = (content.strip(), None)
+    return results
+
+
+def save_batch_job(job: Dict) -> None:
+    """将任务信息保存到本地"""
+    os.makedirs(BATCH_JOBS_DIR, exist_ok=True)
+    with open(os.path.join(BATCH_JOBS_DIR, f"{job['batch_id']}.json"), 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False, indent=2)
+
+
+def list_batch_jobs(base_url: str, model_name: str) -> List[Dict]:
+    """
+    列出本地保存的任务
+
+    Args:
+        base_url: 基础URL，只返回提交到该网关的任务
+        model_name: 模型名称
+
+    Returns:
+        任务列表，按提交时间倒序
+    """
+    if not os.path.isdir(BATCH_JOBS_DIR):
+        return []
+
+    jobs = []
+    for filename in os.listdir(BATCH_JOBS_DIR):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(BATCH_JOBS_DIR, filename), 'r', encoding='utf-8') as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if job.get('base_url', '') == (base_url or '') and job.get('model') == model_name:
+            jobs.append(job)
+    return sorted(jobs, key=lambda job: job.get('created_at', 0), reverse=True)
+
+
+class BatchGenerator:
+    """通过Batch接口离线批量生成章节内容，适合不需要实时输出的大批量任务"""
+
+    def __init__(self, openai_service):
+        """
+        初始化批量生成器
+
+        Args:
+            openai_service: OpenAIService实例，复用其客户端和提示词构建
+        """
+        self.service = openai_service
+        self.client = openai_service.client
+
+    def submit(self, leaf_nodes_info: list, project_overview: str = "", temperature: float = 0.7) -> Dict:
+        """
+        上传所有叶子章节的请求并创建批量任务
+
+        Args:
+            leaf_nodes_info: (章节路径, 节点信息) 列表，与实时生成使用的结构相同
+            project_overview: 项目概述
+            temperature: 温度参数
+
+        Returns:
+            任务信息字典（已保存到本地）
+
+        Raises:
+            LLMServiceError: 上传文件或创建任务失败
+        """
+        # 同一个批量任务只能使用一个模型，取章节正文的默认路由（不区分重点章节）
+        model_name = self.service.router.model_for(TASK_CHAPTER)
+        paths = {}
+        requests = []
+        for index, (node_path, node_info) in enumerate(leaf_nodes_info):
+            custom_id = f"chapter-{index}"
+            paths[custom_id] = node_path
+            messages = self.service._build_chapter_messages(
+                node_info['chapter'],
+                node_info['parent_chapters'],
+                node_info['sibling_chapters'],
+                project_overview,
+                node_info.get('context'),
+                node_info.get('references')
+            )
+            requests.append((custom_id, messages))
+
+        batch_file = build_batch_file(requests, model_name, temperature)
+        try:
+            input_file = self.client.files.create(file=("chapters.jsonl", batch_file), purpose="batch")
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window=BATCH_COMPLETION_WINDOW
+            )
+        except Exception as e:
+            raise classify_error(e) from e
+
+        job = {
+            'batch_id': batch.id,
+            'input_file_id': input_file.id,
+            'base_url': self.service.base_url or '',
+            'model': model_name,
+            'created_at': time.time(),
+            'paths': paths,
+            'merged': False
+        }
+        self._update_job(job, batch)
+        return job
+
+    def refresh(self, job: Dict) -> Dict:
+        """
+        查询任务的最新状态
+
+        Args:
+            job: 任务信息字典
+
+        Returns:
+            更新后的任务信息字典（已保存到本地）
+        """
+        try:
+            batch = self.client.batches.retrieve(job['batch_id'])
+        except Exception as e:
+            raise classify_error(e) from e
+        self._update_job(job, batch)
+        return job
+
+    def cancel(self, job: Dict) -> Dict:
+        """取消尚未完成的任务"""
+        try:
+            batch = self.client.batches.cancel(job['batch_id'])
+        except Exception as e:
+            raise classify_error(e) from e
+        self._update_job(job, batch)
+        return job
+
+    def fetch_results(self, job: Dict) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """
+        下载任务的输出文件和错误文件，按章节路径整理结果
+
+        Args:
+            job: 已结束的任务信息字典
+
+        Returns:
+            {章节路径: (生成内容, 错误信息)}；没有返回结果的章节记为失败
+        """
+        results = {}
+        for file_id in (job.get('output_file_id'), job.get('error_file_id')):
+            if not file_id:
+                continue
+            try:
+                text = self.client.files.content(file_id).text
+            except Exception as e:
+                raise classify_error(e) from e
+            for custom_id, result in parse_batch_output(text).items():
+                node_path = job['paths'].get(custom_id)
+                if node_path:
+                    results[node_path] = result
+
+        status_label = BATCH_STATUS_LABELS.get(job.get('status'), job.get('status'))
+        for node_path in job['paths'].values():
+            results.setdefault(node_path, (None, f"生成失败: 批量任务未返回结果（{status_label}）"))
+        return results
+
+    def _update_job(self, job: Dict, batch) -> None:
+        job['status'] = batch.status
+        counts = getattr(batch, 'request_counts', None)
+        job['request_counts'] = {
+            'total': getattr(counts, 'total', 0),
+            'completed': getattr(counts, 'completed', 0),
+            'failed': getattr(counts, 'failed', 0)
+        } if counts is not None else {}
+        job['output_file_id'] = getattr(batch, 'output_file_id', None)
+        job['error_file_id'] = getattr(batch, 'error_file_id', None)
+        save_batch_job(job)
@@ -0,0 +1,81 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 用户停止生成时的默认原因
+DEFAULT_CANCEL_REASON = "已停止生成"
+
+
+class GenerationCancelled(Exception):
+    """生成任务被取消（用户点击停止、切换页面或重新开始生成）"""
+
+
+class CancellationToken:
+    """
+    跨线程的取消信号，由页面创建并一路传给服务层
+
+    同步请求在读取流和退避等待时检查该信号；异步请求通过add_callback注册回调，
+    在取消时把事件循环中的任务一并取消。两种方式都会关闭正在进行的HTTP流。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = DEFAULT_CANCEL_REASON) -> None:
+        """发出取消信号并执行已注册的回调，重复调用无效果"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("执行取消回调失败")
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        注册取消时执行的回调（在调用cancel的线程中执行），已取消时立即执行
+
+        Args:
+            callback: 无参数的回调
+
+        Returns:
+            用于注销该回调的函数
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_callback(self, callback) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        """已取消时抛出GenerationCancelled"""
+        if self._event.is_set():
+            raise GenerationCancelled(self.reason or DEFAULT_CANCEL_REASON)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        等待指定时间，期间被取消时提前返回
+
+        Returns:
+            是否已被取消
+        """
+        return self._event.wait(timeout)
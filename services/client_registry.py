@@ -0,0 +1,113 @@
+import httpx
+import openai
+import streamlit as st
+
+# 连接池与超时的默认值，可在左侧配置面板中调整
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 120.0
+DEFAULT_MAX_CONNECTIONS = 128
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 64
+KEEPALIVE_EXPIRY = 60.0
+
+# 重试由services.retry_policy统一处理，关闭SDK自带的重试，避免重试次数叠加
+SDK_MAX_RETRIES = 0
+
+
+def _build_limits(max_connections: int) -> httpx.Limits:
+    """构建连接池大小限制，保活连接数不超过总连接数"""
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(DEFAULT_MAX_KEEPALIVE_CONNECTIONS, max_connections),
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+
+def _build_timeout(connect_timeout: float, read_timeout: float) -> httpx.Timeout:
+    """构建超时配置，read超时同时作为写入和连接池等待的超时"""
+    return httpx.Timeout(read_timeout, connect=connect_timeout)
+
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client(
+    api_key: str,
+    base_url: str = None,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT,
+    max_connections: int = DEFAULT_MAX_CONNECTIONS
+) -> openai.OpenAI:
+    """
+    获取进程级共享的同步OpenAI客户端
+
+    按 (api_key, base_url, 超时, 连接池大小) 缓存，所有会话和工作线程共用同一个
+    保活连接池，避免每次请求重新进行TCP/TLS握手。
+
+    Args:
+        api_key: OpenAI API密钥
+        base_url: 基础URL（可选，用于代理）
+        connect_timeout: 建立连接超时（秒）
+        read_timeout: 读取超时（秒）
+        max_connections: 连接池最大连接数
+
+    Returns:
+        openai.OpenAI客户端
+    """
+    http_client = openai.DefaultHttpxClient(
+        limits=_build_limits(max_connections),
+        timeout=_build_timeout(connect_timeout, read_timeout)
+    )
+    return openai.OpenAI(
+        api_key=api_key,
+        base_url=base_url if base_url else None,
+        http_client=http_client,
+        max_retries=SDK_MAX_RETRIES
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_async_openai_client(
+    api_key: str,
+    base_url: str = None,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT,
+    max_connections: int = DEFAULT_MAX_CONNECTIONS
+) -> openai.AsyncOpenAI:
+    """
+    获取进程级共享的异步OpenAI客户端
+
+    异步客户端只在services.async_openai_service的后台事件循环中使用，
+    因此可以安全地在所有会话之间共享。
+
+    Args:
+        api_key: OpenAI API密钥
+        base_url: 基础URL（可选，用于代理）
+        connect_timeout: 建立连接超时（秒）
+        read_timeout: 读取超时（秒）
+        max_connections: 连接池最大连接数
+
+    Returns:
+        openai.AsyncOpenAI客户端
+    """
+    http_client = openai.DefaultAsyncHttpxClient(
+        limits=_build_limits(max_connections),
+        timeout=_build_timeout(connect_timeout, read_timeout)
+    )
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url if base_url else None,
+        http_client=http_client,
+        max_retries=SDK_MAX_RETRIES
+    )
+
+
+def get_http_settings() -> dict:
+    """
+    从session state读取当前的连接设置
+
+    Returns:
+        可直接作为关键字参数传给客户端获取函数的字典
+    """
+    return {
+        'connect_timeout': float(st.session_state.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)),
+        'read_timeout': float(st.session_state.get('read_timeout', DEFAULT_READ_TIMEOUT)),
+        'max_connections': int(st.session_state.get('max_connections', DEFAULT_MAX_CONNECTIONS)),
+    }
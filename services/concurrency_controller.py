@@ -0,0 +1,183 @@
+import asyncio
+import time
+import threading
+import openai
+from typing import Dict, Optional, Tuple
+
+# 初始并发数（与原先线程池的固定值一致），以及默认上下限
+DEFAULT_INITIAL_LIMIT = 5
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 64
+
+# 遇到限流/服务端错误时的乘性减小系数，首字延迟上升时的温和减小系数
+OVERLOAD_DECREASE_FACTOR = 0.5
+LATENCY_DECREASE_FACTOR = 0.9
+
+# 首字延迟（TTFT）的平滑系数，以及判定为“延迟上升”的倍数
+TTFT_EWMA_ALPHA = 0.2
+TTFT_BASELINE_DRIFT = 0.01
+TTFT_TOLERANCE = 2.0
+
+# 两次减小之间的最短间隔（秒），避免同一波错误把并发数连续砍到底
+DECREASE_COOLDOWN = 2.0
+
+
+def is_overload_error(error: Exception) -> bool:
+    """
+    判断异常是否表示服务端过载（应当降低并发）
+
+    Args:
+        error: 请求抛出的异常
+
+    Returns:
+        HTTP 429、5xx、超时和连接错误返回True
+    """
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status_code = getattr(error, 'status_code', None)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+class AdaptiveConcurrencyController:
+    """AIMD并发控制器：健康时逐步增加在途请求数，遇到限流、5xx或首字延迟上升时成倍回退"""
+
+    def __init__(self, initial_limit: int = DEFAULT_INITIAL_LIMIT, min_limit: int = DEFAULT_MIN_LIMIT,
+                 max_limit: int = DEFAULT_MAX_LIMIT):
+        """
+        初始化并发控制器
+
+        Args:
+            initial_limit: 初始并发数
+            min_limit: 并发数下限
+            max_limit: 并发数上限
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.in_flight = 0
+
+        # 慢启动阶段每次成功+1，首次回退后改为每轮+1（加性增加）
+        self._slow_start = True
+        self._last_decrease = 0.0
+        self._ttft_ewma: Optional[float] = None
+        self._ttft_baseline: Optional[float] = None
+        self._condition: Optional[asyncio.Condition] = None
+
+        self.successes = 0
+        self.overloads = 0
+
+    @property
+    def target(self) -> int:
+        """当前允许的最大在途请求数"""
+        return max(self.min_limit, min(self.max_limit, int(self.limit)))
+
+    def _get_condition(self) -> asyncio.Condition:
+        # 延迟创建，确保绑定到实际运行请求的事件循环
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self) -> None:
+        """等待直到在途请求数低于目标并发数，然后占用一个名额"""
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < self.target)
+            self.in_flight += 1
+
+    async def release(self) -> None:
+        """释放一个名额并唤醒等待中的请求"""
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def record_success(self, ttft: float) -> None:
+        """
+        记录一次成功的请求并调整并发数
+
+        Args:
+            ttft: 首字延迟（秒）
+        """
+        self.successes += 1
+
+        if self._ttft_ewma is None:
+            self._ttft_ewma = ttft
+            self._ttft_baseline = ttft
+        else:
+            self._ttft_ewma = TTFT_EWMA_ALPHA * ttft + (1 - TTFT_EWMA_ALPHA) * self._ttft_ewma
+            # 基线取平滑值的历史低点，并缓慢向上漂移以适应长期变化
+            self._ttft_baseline = min(self._ttft_ewma,
+                                      self._ttft_baseline + TTFT_BASELINE_DRIFT * (self._ttft_ewma - self._ttft_baseline))
+
+        if self._ttft_ewma > self._ttft_baseline * TTFT_TOLERANCE:
+            self._decrease(LATENCY_DECREASE_FACTOR)
+        elif self._slow_start:
+            self.limit = min(self.max_limit, self.limit + 1)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def record_failure(self, error: Exception) -> None:
+        """
+        记录一次失败的请求，过载类错误会触发乘性减小
+
+        Args:
+            error: 请求抛出的异常
+        """
+        if is_overload_error(error):
+            self.overloads += 1
+            self._decrease(OVERLOAD_DECREASE_FACTOR)
+
+    def _decrease(self, factor: float) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        self._slow_start = False
+        self.limit = max(self.min_limit, self.limit * factor)
+
+    def snapshot(self) -> Dict:
+        """
+        获取当前状态，供UI展示
+
+        Returns:
+            包含在途请求数、目标并发数等信息的字典
+        """
+        return {
+            'in_flight': self.in_flight,
+            'target': self.target,
+            'max_limit': self.max_limit,
+            'ttft_ewma': self._ttft_ewma,
+            'successes': self.successes,
+            'overloads': self.overloads,
+        }
+
+
+_controllers: Dict[Tuple[str, str], AdaptiveConcurrencyController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_concurrency_controller(base_url: str, model_name: str, max_limit: int = DEFAULT_MAX_LIMIT,
+                               api_key: str = '') -> AdaptiveConcurrencyController:
+    """
+    获取进程级并发控制器，按 (base_url, model_name, api_key) 区分
+
+    同一网关和密钥上的所有会话共用一个控制器，学到的并发能力在多次生成之间保留。
+
+    Args:
+        base_url: 基础URL
+        model_name: 模型名称
+        max_limit: 并发数上限
+        api_key: API密钥，服务商的限流按密钥计算
+
+    Returns:
+        AdaptiveConcurrencyController实例
+    """
+    key = (base_url or '', model_name, api_key or '')
+    with _controllers_lock:
+        controller = _controllers.get(key)
+        if controller is None:
+            controller = AdaptiveConcurrencyController(max_limit=max_limit)
+            _controllers[key] = controller
+        else:
+            controller.max_limit = max_limit
+    return controller
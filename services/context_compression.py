@@ -0,0 +1,150 @@
+import threading
+from functools import lru_cache
+from typing import Dict, List, Tuple
+from services.rate_limiter import estimate_text_tokens
+
+# 同级章节摘要的token预算：超出时截短各章节描述，仍超出时只保留部分标题
+SIBLING_DIGEST_TOKENS = 400
+
+# 上级章节描述的最大字符数
+PARENT_DESCRIPTION_CHARS = 120
+
+# 截短后的描述至少保留的字符数，再短就不如只保留标题
+MIN_DESCRIPTION_CHARS = 8
+
+# 缓存的摘要数（每个非叶子章节一份）
+DIGEST_CACHE_SIZE = 4096
+
+
+def _sibling_line(sibling_id: str, title: str, description) -> str:
+    """与未压缩时的格式相同；description为None时只保留标题"""
+    if description is None:
+        return f"- {sibling_id} {title}\n"
+    return f"- {sibling_id} {title}\n  {description}\n"
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars] + "…"
+
+
+@lru_cache(maxsize=DIGEST_CACHE_SIZE)
+def _build_digest(siblings: Tuple[Tuple[str, str, str], ...], token_budget: int) -> Tuple[str, int, int]:
+    full = "".join(_sibling_line(*sibling) for sibling in siblings)
+    full_tokens = estimate_text_tokens(full)
+    if full_tokens <= token_budget:
+        return full, full_tokens, full_tokens
+
+    # 找出使总长度不超过预算的最大描述长度（所有章节使用同一上限，保持同级之间的信息量一致）
+    longest = max(len(description) for _, _, description in siblings)
+    low, high = MIN_DESCRIPTION_CHARS, longest
+    best = None
+    while low <= high:
+        limit = (low + high) // 2
+        digest = "".join(_sibling_line(sibling_id, title, _truncate(description, limit))
+                         for sibling_id, title, description in siblings)
+        if estimate_text_tokens(digest) <= token_budget:
+            best = digest
+            low = limit + 1
+        else:
+            high = limit - 1
+    if best is not None:
+        return best, full_tokens, estimate_text_tokens(best)
+
+    # 描述截到最短仍超出预算：只保留标题，标题也放不下时只列出前面的章节
+    lines = []
+    used = 0
+    for sibling_id, title, _ in siblings:
+        line = _sibling_line(sibling_id, title, None)
+        line_tokens = estimate_text_tokens(line)
+        if used + line_tokens > token_budget and lines:
+            lines.append(f"- ……等共{len(siblings)}个同级章节\n")
+            break
+        lines.append(line)
+        used += line_tokens
+    digest = "".join(lines)
+    return digest, full_tokens, estimate_text_tokens(digest)
+
+
+def sibling_digest(sibling_chapters: List[dict], token_budget: int = SIBLING_DIGEST_TOKENS) -> Tuple[str, int, int]:
+    """
+    构建同级章节的紧凑摘要
+
+    同一上级章节下的所有叶子章节使用同一份同级章节列表，摘要按内容缓存，每个上级章节只计算一次，
+    各章节的提示词前缀也因此保持一致。未超出预算时与完整列表相同。
+
+    Args:
+        sibling_chapters: 同级章节列表（含当前章节）
+        token_budget: token预算
+
+    Returns:
+        (摘要文本, 完整列表的token数, 摘要的token数)
+    """
+    siblings = tuple(
+        (sibling.get('id', 'unknown'), sibling.get('title', '未命名'), sibling.get('description', '') or '')
+        for sibling in sibling_chapters
+    )
+    return _build_digest(siblings, token_budget)
+
+
+def parent_description(description: str) -> str:
+    """截短上级章节的描述"""
+    return _truncate(description or '', PARENT_DESCRIPTION_CHARS)
+
+
+def build_chapter_context(chapter_id: str, parent_chapters: List[dict] = None,
+                          sibling_chapters: List[dict] = None) -> str:
+    """
+    构建章节提示词中的上下文部分（上级章节和同级章节信息）
+
+    结果只取决于上级章节、同级章节，以及同级章节中是否有当前章节以外的章节，
+    同一组同级章节共用，可以由OutlineIndex预先生成。
+
+    Args:
+        chapter_id: 当前章节ID
+        parent_chapters: 上级章节列表，每个元素包含章节id、标题和描述
+        sibling_chapters: 同级章节列表（含当前章节）
+
+    Returns:
+        上下文文本，没有上下文时为空字符串
+    """
+    context = ""
+
+    # 上级章节信息
+    if parent_chapters:
+        context += "上级章节信息：\n"
+        for parent in parent_chapters:
+            context += f"- {parent['id']} {parent['title']}\n  {parent_description(parent['description'])}\n"
+
+    # 同级章节信息（包含当前章节，使同级章节的提示词前缀保持一致）；同级章节较多时使用压缩后的摘要，
+    # 避免提示词长度随同级章节数平方增长
+    if sibling_chapters and any(sibling.get('id') != chapter_id for sibling in sibling_chapters):
+        context += "同级章节信息（含当前章节，请避免与其他同级章节内容重复）：\n"
+        context += sibling_digest(sibling_chapters)[0]
+    return context
+
+
+class ContextSavings:
+    """一次生成任务中章节提示词上下文的压缩效果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.chapters = 0
+        self.full_tokens = 0
+        self.compressed_tokens = 0
+
+    def record(self, full_tokens: int, compressed_tokens: int) -> None:
+        with self._lock:
+            self.chapters += 1
+            self.full_tokens += full_tokens
+            self.compressed_tokens += compressed_tokens
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            saved = self.full_tokens - self.compressed_tokens
+            return {
+                'chapters': self.chapters,
+                'full_tokens': self.full_tokens,
+                'compressed_tokens': self.compressed_tokens,
+                'saved_tokens': saved,
+                'saved_ratio': saved / self.full_tokens if self.full_tokens else 0.0,
+            }
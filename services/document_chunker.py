@@ -0,0 +1,109 @@
+import re
+from typing import List
+
+# 默认分块大小（字符数）与并行度，可在左侧配置面板中调整
+DEFAULT_CHUNK_SIZE = 30000
+DEFAULT_PARALLELISM = 4
+
+# PDF提取时插入的分页标记，见DocumentProcessor._extract_pdf_text
+_PAGE_MARKER = re.compile(r'^--- 第\d+页 ---$')
+
+# 常见的招标文件标题行：第X章/节/部分、一、二、…、1. / 1.1 / 1.1.1 编号
+_HEADING = re.compile(
+    r'^(第[一二三四五六七八九十百零\d]+[章节部分篇卷]'
+    r'|[一二三四五六七八九十]+、'
+    r'|\d+(\.\d+)*[\.、\s]\S)'
+)
+
+
+def _split_segments(text: str) -> List[str]:
+    """按分页标记和标题行把文本切成自然段落组，分页标记和标题保留在所属段落组的开头"""
+    segments = []
+    current = []
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if current and (_PAGE_MARKER.match(stripped) or _HEADING.match(stripped)):
+            segments.append('\n'.join(current))
+            current = []
+        current.append(line)
+    if current:
+        segments.append('\n'.join(current))
+    return [segment for segment in segments if segment.strip()]
+
+
+def _hard_split(segment: str, chunk_size: int) -> List[str]:
+    """对超过分块大小的单个段落组，先按行切分，单行仍过长时按字符切分"""
+    pieces = []
+    current = ''
+    for line in segment.split('\n'):
+        while len(line) > chunk_size:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(line[:chunk_size])
+            line = line[chunk_size:]
+        if current and len(current) + len(line) + 1 > chunk_size:
+            pieces.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_document(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[str]:
+    """
+    将招标文件文本按页或标题边界切分为不超过chunk_size的块
+
+    相邻的段落组会被贪心地合并到同一块中，尽量不在页面或章节中间断开。
+
+    Args:
+        text: 文档全文
+        chunk_size: 每块的最大字符数
+
+    Returns:
+        文本块列表
+    """
+    if not text:
+        return []
+    if chunk_size <= 0 or len(text) <= chunk_size:
+        return [text]
+
+    chunks = []
+    current = ''
+    for segment in _split_segments(text):
+        if len(segment) > chunk_size:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.extend(_hard_split(segment, chunk_size))
+            continue
+        if current and len(current) + len(segment) + 1 > chunk_size:
+            chunks.append(current)
+            current = segment
+        else:
+            current = f"{current}\n{segment}" if current else segment
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_passages(text: str, max_chars: int) -> List[str]:
+    """
+    将招标文件文本切分为用于检索的短段落
+
+    与split_document不同，相邻的段落组不合并，每页或每个标题下的内容各自成段；
+    超过max_chars的段落组按行切分。
+
+    Args:
+        text: 文档全文
+        max_chars: 每段的最大字符数
+
+    Returns:
+        段落列表，不含空段落
+    """
+    passages = []
+    for segment in _split_segments(text or ''):
+        passages.extend(_hard_split(segment, max_chars) if len(segment) > max_chars else [segment])
+    return [passage.strip() for passage in passages if passage.strip()]
@@ -0,0 +1,237 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Iterable, List
+from services.retry_policy import LLMServiceError, classify_error
+
+# 端点默认的权重与并发上限，可在左侧配置面板中调整
+DEFAULT_ENDPOINT_WEIGHT = 1
+DEFAULT_ENDPOINT_CONCURRENCY = 16
+
+# 连续失败多少次后暂时摘除端点；认证失败（401/403）立即摘除
+EJECT_AFTER_FAILURES = 3
+EJECT_STATUS_CODES = {401, 403}
+
+# 摘除时长：首次30秒，之后每次翻倍，最长10分钟
+BASE_EJECT_SECONDS = 30.0
+MAX_EJECT_SECONDS = 600.0
+
+# 健康分的平滑系数，以及参与加权时的最低健康分（避免分数归零后永远选不中）
+HEALTH_EWMA_ALPHA = 0.2
+MIN_HEALTH = 0.05
+
+# 所有端点都满载时，重新尝试选择的间隔（秒）
+POOL_WAIT_INTERVAL = 0.05
+
+
+class PooledEndpoint:
+    """端点池中的单个端点：一组 (api_key, base_url, model_name)，以及权重、并发上限和健康状态"""
+
+    def __init__(self, name: str, api_key: str, base_url: str, model_name: str,
+                 weight: float = DEFAULT_ENDPOINT_WEIGHT, max_concurrency: int = DEFAULT_ENDPOINT_CONCURRENCY,
+                 client=None):
+        """
+        初始化端点
+
+        Args:
+            name: 显示名称
+            api_key: API密钥
+            base_url: 基础URL
+            model_name: 模型名称
+            weight: 分流权重
+            max_concurrency: 该端点同时在途的请求数上限
+            client: 该端点使用的客户端（由服务在主线程中获取后传入）
+        """
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model_name = model_name
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.client = client
+
+        self.in_flight = 0
+        self.health = 1.0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.probing = False
+        self.successes = 0
+        self.failures = 0
+
+    @property
+    def identity(self) -> tuple:
+        """端点的身份，配置变化时用于保留已有的健康状态"""
+        return (self.api_key, self.base_url or '', self.model_name)
+
+    def state(self, now: float) -> str:
+        """当前状态：healthy（正常）、ejected（已摘除）或 half_open（摘除到期，等待探测）"""
+        if not self.ejected_until:
+            return 'healthy'
+        return 'ejected' if now < self.ejected_until else 'half_open'
+
+    def can_accept(self, now: float) -> bool:
+        state = self.state(now)
+        if state == 'ejected':
+            return False
+        if state == 'half_open':
+            # 摘除到期后只放行一个探测请求，成功后恢复
+            return not self.probing
+        return self.in_flight < self.max_concurrency
+
+
+class EndpointPool:
+    """多端点负载均衡：按权重和健康分分流请求，持续失败的端点被摘除，到期后通过探测请求恢复"""
+
+    def __init__(self, endpoints: Iterable[PooledEndpoint] = ()):
+        self._lock = threading.Lock()
+        self.endpoints: List[PooledEndpoint] = []
+        self.configure(endpoints)
+
+    def configure(self, endpoints: Iterable[PooledEndpoint]) -> None:
+        """
+        更新端点列表，身份未变的端点保留健康状态和在途计数
+
+        Args:
+            endpoints: 新的端点列表
+        """
+        with self._lock:
+            existing = {endpoint.identity: endpoint for endpoint in self.endpoints}
+            updated = []
+            for endpoint in endpoints:
+                current = existing.get(endpoint.identity)
+                if current is not None:
+                    current.name = endpoint.name
+                    current.weight = endpoint.weight
+                    current.max_concurrency = endpoint.max_concurrency
+                    current.client = endpoint.client
+                    endpoint = current
+                updated.append(endpoint)
+            self.endpoints = updated
+
+    def _try_select(self, exclude: Iterable[PooledEndpoint]) -> tuple:
+        now = time.monotonic()
+        with self._lock:
+            available = [e for e in self.endpoints if e.can_accept(now)]
+            if not available:
+                busy = any(e.state(now) == 'healthy' for e in self.endpoints)
+                return None, busy
+
+            # 尽量避开本次调用已经失败过的端点；只剩这些端点时仍然使用
+            excluded = set(id(e) for e in exclude)
+            preferred = [e for e in available if id(e) not in excluded] or available
+
+            # 摘除到期的端点优先用于探测，尽快确认是否恢复
+            for endpoint in preferred:
+                if endpoint.state(now) == 'half_open':
+                    endpoint.probing = True
+                    endpoint.in_flight += 1
+                    return endpoint, True
+
+            scores = [e.weight * max(e.health, MIN_HEALTH) / (e.in_flight + 1) for e in preferred]
+            endpoint = random.choices(preferred, weights=scores)[0]
+            endpoint.in_flight += 1
+            return endpoint, True
+
+    async def acquire(self, exclude: Iterable[PooledEndpoint] = ()) -> PooledEndpoint:
+        """
+        选择一个端点并占用它的一个并发名额，所有端点都满载时等待
+
+        Args:
+            exclude: 尽量避开的端点（本次调用中已失败的端点）
+
+        Returns:
+            选中的端点，使用后必须调用release释放名额
+
+        Raises:
+            LLMServiceError: 所有端点都被摘除（可重试）
+        """
+        exclude = list(exclude)
+        while True:
+            endpoint, busy = self._try_select(exclude)
+            if endpoint is not None:
+                return endpoint
+            if not busy:
+                raise LLMServiceError("所有端点均已被暂时摘除", transient=True, retry_after=self.next_recovery_in())
+            await asyncio.sleep(POOL_WAIT_INTERVAL)
+
+    def next_recovery_in(self) -> float:
+        """距离最早一个被摘除的端点恢复探测还有多少秒"""
+        now = time.monotonic()
+        with self._lock:
+            waits = [e.ejected_until - now for e in self.endpoints if e.ejected_until]
+        return max(0.0, min(waits)) if waits else 0.0
+
+    def has_alternative(self, endpoint: PooledEndpoint) -> bool:
+        """除指定端点外是否还有可用的端点，用于决定失败后能否立即换端点重试"""
+        now = time.monotonic()
+        with self._lock:
+            return any(e is not endpoint and e.state(now) != 'ejected' for e in self.endpoints)
+
+    def release(self, endpoint: PooledEndpoint) -> None:
+        """释放端点的一个并发名额；未记录结果就释放的探测请求不影响端点状态"""
+        with self._lock:
+            endpoint.in_flight -= 1
+            if endpoint.probing and endpoint.state(time.monotonic()) == 'half_open':
+                endpoint.probing = False
+
+    def record_success(self, endpoint: PooledEndpoint) -> None:
+        """请求成功：恢复健康分；探测成功的端点重新加入分流"""
+        with self._lock:
+            endpoint.successes += 1
+            endpoint.consecutive_failures = 0
+            endpoint.health = HEALTH_EWMA_ALPHA + (1 - HEALTH_EWMA_ALPHA) * endpoint.health
+            if endpoint.ejected_until:
+                endpoint.ejected_until = 0.0
+                endpoint.ejections = 0
+                endpoint.probing = False
+
+    def record_failure(self, endpoint: PooledEndpoint, error: Exception) -> None:
+        """
+        请求失败：降低健康分，必要时摘除端点
+
+        请求本身的问题（如400参数错误）不计入端点健康。
+
+        Args:
+            endpoint: 失败的端点
+            error: 请求抛出的异常
+        """
+        error = classify_error(error)
+        with self._lock:
+            if not error.transient and error.status_code not in EJECT_STATUS_CODES:
+                return
+
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            endpoint.health = (1 - HEALTH_EWMA_ALPHA) * endpoint.health
+            if (endpoint.probing or error.status_code in EJECT_STATUS_CODES
+                    or endpoint.consecutive_failures >= EJECT_AFTER_FAILURES):
+                self._eject(endpoint)
+
+    def _eject(self, endpoint: PooledEndpoint) -> None:
+        endpoint.ejections += 1
+        endpoint.probing = False
+        endpoint.consecutive_failures = 0
+        endpoint.ejected_until = time.monotonic() + min(MAX_EJECT_SECONDS,
+                                                        BASE_EJECT_SECONDS * (2 ** (endpoint.ejections - 1)))
+
+    def snapshot(self) -> List[Dict]:
+        """
+        获取各端点的状态，供UI展示
+
+        Returns:
+            每个端点一项，包含名称、在途请求数、健康分和摘除剩余时间等
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'name': e.name,
+                'state': e.state(now),
+                'in_flight': e.in_flight,
+                'max_concurrency': e.max_concurrency,
+                'health': e.health,
+                'successes': e.successes,
+                'failures': e.failures,
+                'ejected_for': max(0.0, e.ejected_until - now) if e.ejected_until else 0.0,
+            } for e in self.endpoints]
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from services.tender_retrieval import document_hash
+
+logger = logging.getLogger(__name__)
+
+# 章节生成结果按项目追加到本地日志，程序崩溃、会话超时或重启后可以从日志继续生成
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".ai_write_helper", "journals")
+
+# 恢复列表中显示的最近项目数
+MAX_LISTED_JOURNALS = 10
+
+
+def project_key(project_overview: str) -> str:
+    """
+    按项目概述区分项目，同一份招标文件解析出的概述相同，不同项目的日志互不影响
+
+    Args:
+        project_overview: 项目概述
+
+    Returns:
+        日志文件名使用的标识
+    """
+    return hashlib.sha256((project_overview or '').encode('utf-8')).hexdigest()[:16]
+
+
+class GenerationJournal:
+    """
+    章节生成的追加式日志（JSONL）
+
+    每行一条记录：'start'记录每次生成时的目录、项目概述和招标文件的哈希，'chapter'记录一个章节的结果。
+    读取时按顺序回放，同一章节以最后一条成功记录为准；崩溃时写到一半的行会被忽略。
+    招标文件全文较大，单独保存在同名的.tender.txt文件中，只在恢复时读取。
+    """
+
+    def __init__(self, key: str):
+        """
+        Args:
+            key: 项目标识，见project_key
+        """
+        self.key = key
+        self.path = os.path.join(JOURNAL_DIR, f"{key}.jsonl")
+        self.tender_path = os.path.join(JOURNAL_DIR, f"{key}.tender.txt")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_project(cls, project_overview: str) -> 'GenerationJournal':
+        return cls(project_key(project_overview))
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def start(self, outline_data: Dict, project_overview: str, reset: bool = False, tender_text: str = '') -> None:
+        """
+        记录一次生成开始
+
+        Args:
+            outline_data: 目录数据
+            project_overview: 项目概述
+            reset: 为True时（重新生成全部章节）清空之前的记录
+            tender_text: 招标文件全文，章节的输入哈希与之有关
+        """
+        tender_hash = document_hash(tender_text)
+        if tender_hash:
+            self._save_tender_text(tender_text)
+        if not reset:
+            self._terminate_partial_line()
+        self._append({
+            'type': 'start',
+            'outline_data': outline_data,
+            'project_overview': project_overview,
+            'tender_hash': tender_hash
+        }, mode='w' if reset else 'a')
+
+    def record(self, node_path: str, content: Optional[str] = None, error: Optional[str] = None,
+               input_hash: Optional[str] = None) -> None:
+        """
+        记录一个章节的结果，前三个参数与generate_chapters的回调相同
+
+        Args:
+            node_path: 章节路径
+            content: 生成的内容，失败时为None
+            error: 错误信息，成功时为None
+            input_hash: 生成输入的哈希，见OpenAIService.chapter_input_hash
+        """
+        entry = {'type': 'chapter', 'path': node_path}
+        if error:
+            entry['error'] = error
+        else:
+            entry['content'] = content
+            if input_hash:
+                entry['input_hash'] = input_hash
+        self._append(entry)
+
+    def _save_tender_text(self, tender_text: str) -> None:
+        """保存招标文件全文，先写临时文件再替换，崩溃时不会留下不完整的文件"""
+        temp_path = f"{self.tender_path}.tmp"
+        with self._lock:
+            try:
+                os.makedirs(JOURNAL_DIR, exist_ok=True)
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(tender_text)
+                os.replace(temp_path, self.tender_path)
+            except OSError as e:
+                logger.warning("保存招标文件失败: %s", e)
+
+    def load_tender_text(self) -> str:
+        """
+        读取最近一次生成时的招标文件全文
+
+        Returns:
+            招标文件全文；没有保存、或与最近一次生成记录的哈希不一致时返回空字符串
+        """
+        state = self.load()
+        if not state or not state['tender_hash']:
+            return ''
+        try:
+            with open(self.tender_path, 'r', encoding='utf-8') as f:
+                tender_text = f.read()
+        except OSError:
+            return ''
+        return tender_text if document_hash(tender_text) == state['tender_hash'] else ''
+
+    def _terminate_partial_line(self) -> None:
+        """上次崩溃时可能留下写到一半的行，补上换行，避免与新记录连在一起"""
+        with self._lock:
+            try:
+                with open(self.path, 'rb+') as f:
+                    f.seek(0, os.SEEK_END)
+                    if f.tell() == 0:
+                        return
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+            except OSError:
+                pass
+
+    def _append(self, entry: Dict, mode: str = 'a') -> None:
+        entry['ts'] = time.time()
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                os.makedirs(JOURNAL_DIR, exist_ok=True)
+                # 每条记录单独打开文件并写入操作系统缓冲区，进程崩溃也不会丢失已写入的章节
+                with open(self.path, mode, encoding='utf-8') as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning("写入生成日志失败: %s", e)
+
+    def load(self) -> Optional[Dict]:
+        """
+        回放日志
+
+        Returns:
+            {'key', 'updated_at', 'outline_data', 'project_overview', 'tender_hash', 'contents', 'errors', 'hashes'}，
+            contents、errors和hashes以章节路径为键；日志不存在时返回None
+        """
+        try:
+            updated_at = os.path.getmtime(self.path)
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return None
+
+        state = {
+            'key': self.key,
+            'updated_at': updated_at,
+            'outline_data': None,
+            'project_overview': '',
+            'tender_hash': '',
+            'contents': {},
+            'errors': {},
+            'hashes': {},
+        }
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('type') == 'start':
+                state['outline_data'] = entry.get('outline_data')
+                state['project_overview'] = entry.get('project_overview', '')
+                state['tender_hash'] = entry.get('tender_hash', '')
+            elif entry.get('type') == 'chapter' and entry.get('path'):
+                if entry.get('error'):
+                    state['errors'][entry['path']] = entry['error']
+                else:
+                    state['contents'][entry['path']] = entry.get('content') or ''
+                    state['errors'].pop(entry['path'], None)
+                    if entry.get('input_hash'):
+                        state['hashes'][entry['path']] = entry['input_hash']
+        return state
+
+
+def list_journals() -> List[Dict]:
+    """
+    列出最近的生成日志，用于在新会话中恢复
+
+    Returns:
+        load()的结果列表，按更新时间倒序
+    """
+    if not os.path.isdir(JOURNAL_DIR):
+        return []
+
+    paths = [os.path.join(JOURNAL_DIR, filename) for filename in os.listdir(JOURNAL_DIR)
+             if filename.endswith('.jsonl')]
+    paths.sort(key=os.path.getmtime, reverse=True)
+
+    journals = []
+    for path in paths[:MAX_LISTED_JOURNALS]:
+        state = GenerationJournal(os.path.basename(path)[:-len('.jsonl')]).load()
+        if state and state['outline_data']:
+            journals.append(state)
+    return journals
@@ -0,0 +1,142 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+# 默认的对冲预算：对冲请求数最多为章节数的10%，0表示关闭对冲
+DEFAULT_HEDGE_RATIO = 0.1
+
+# 以历史请求的哪个百分位作为“卡住”的判定阈值
+HEDGE_PERCENTILE = 95
+
+# 样本不足时使用的固定阈值（秒），以及阈值下限（避免把正常的抖动当成卡住）
+MIN_HEDGE_SAMPLES = 8
+DEFAULT_HEDGE_DELAY = 30.0
+MIN_HEDGE_DELAY = 2.0
+
+# 只保留最近的若干个样本，使阈值跟随服务端当前的状态
+LATENCY_WINDOW = 200
+
+# 未触发对冲时，检查章节进度的间隔（秒）
+HEDGE_CHECK_INTERVAL = 0.5
+
+
+def percentile(values, p: float) -> float:
+    """
+    计算百分位数（最近秩法）
+
+    Args:
+        values: 样本序列，不能为空
+        p: 百分位（0-100）
+
+    Returns:
+        对应的样本值
+    """
+    ordered = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class StreamProgress:
+    """单次流式调用的进度，由astream_chat_completion更新，供对冲逻辑判断请求是否卡住"""
+
+    def __init__(self):
+        self.sent_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.endpoint = None
+
+    def mark_sent(self, endpoint=None) -> None:
+        """请求已发出（排队等待限流和并发名额的时间不计入）；重试时重新计时"""
+        self.sent_at = time.monotonic()
+        self.last_token_at = None
+        self.endpoint = endpoint
+
+    def mark_token(self) -> None:
+        self.last_token_at = time.monotonic()
+
+    def stalled_for(self, now: float) -> Optional[tuple]:
+        """
+        请求已经多久没有进展
+
+        Returns:
+            ('first_token', 秒数) 表示还在等首字，('progress', 秒数) 表示输出中断；请求尚未发出时返回None
+        """
+        if self.sent_at is None:
+            return None
+        if self.last_token_at is None:
+            return 'first_token', now - self.sent_at
+        return 'progress', now - self.last_token_at
+
+
+class LatencyTracker:
+    """记录最近请求的首字延迟和最长输出间隔，用百分位数给出对冲阈值"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._first_token = deque(maxlen=window)
+        self._max_gap = deque(maxlen=window)
+
+    def record(self, first_token_latency: float, max_gap: float) -> None:
+        """
+        记录一次成功请求
+
+        Args:
+            first_token_latency: 从发出请求到收到首个片段的秒数
+            max_gap: 相邻两个片段之间的最长间隔（秒）
+        """
+        with self._lock:
+            self._first_token.append(first_token_latency)
+            self._max_gap.append(max_gap)
+
+    def threshold(self, kind: str) -> float:
+        """
+        获取对冲阈值
+
+        Args:
+            kind: 'first_token'（等待首字）或 'progress'（输出中断）
+
+        Returns:
+            超过该秒数未有进展即视为卡住
+        """
+        with self._lock:
+            samples = list(self._first_token if kind == 'first_token' else self._max_gap)
+        if len(samples) < MIN_HEDGE_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return max(MIN_HEDGE_DELAY, percentile(samples, HEDGE_PERCENTILE))
+
+
+class HedgeBudget:
+    """一次生成任务的对冲预算：已发出的对冲请求数不超过原始请求数的固定比例"""
+
+    def __init__(self, ratio: float = DEFAULT_HEDGE_RATIO):
+        self._lock = threading.Lock()
+        self.ratio = ratio
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def try_spend(self) -> bool:
+        """预算允许时占用一次对冲名额"""
+        with self._lock:
+            if self.hedges + 1 > self.ratio * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def record_win(self) -> None:
+        """对冲请求比原请求先完成"""
+        with self._lock:
+            self.hedge_wins += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+            }
@@ -0,0 +1,300 @@
+import re
+import threading
+import time
+import uuid
+import streamlit as st
+from typing import Any, Callable, Dict, List, Optional
+from services.cancellation import CancellationToken, GenerationCancelled
+
+# 任务类型
+JOB_ANALYSIS = "analysis"
+JOB_OUTLINE = "outline"
+JOB_CONTENT = "content"
+
+# 任务状态
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_FINAL_STATUSES = {JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED}
+
+# 记录浏览器会话标识的URL参数，页面刷新后URL不变，据此找回本会话提交的任务
+SESSION_PARAM = "sid"
+_SESSION_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# 页面轮询任务状态的间隔（秒）
+JOB_POLL_INTERVAL = 1.0
+
+# 每个浏览器会话保留的已结束任务数，更早的任务从内存中清除
+MAX_FINISHED_JOBS = 10
+
+
+class Job:
+    """
+    一个后台任务及其进度
+
+    任务函数在独立线程中运行，通过本对象的方法写入进度和结果；页面只读取snapshot()，
+    不与任务线程共享任何Streamlit对象。
+    """
+
+    def __init__(self, kind: str, owner: str, inputs: Optional[Dict] = None, total: int = 0):
+        """
+        Args:
+            kind: 任务类型（JOB_ANALYSIS / JOB_OUTLINE / JOB_CONTENT）
+            owner: 任务所属的浏览器会话，见current_owner
+            inputs: 任务的输入，浏览器重新连接时用于恢复页面状态
+            total: 需要完成的条目数（如章节数），0表示无法预知
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.owner = owner
+        self.inputs = inputs or {}
+        self.cancel_token = CancellationToken()
+        self.created_at = time.time()
+        self._lock = threading.Lock()
+        self._state = {
+            'status': JOB_PENDING,
+            'created_at': self.created_at,
+            'finished_at': None,
+            'error': None,
+            'total': total,
+            'completed': 0,
+            'failed': 0,
+            'outputs': {},
+            'results': {},
+            'errors': {},
+            'result': None,
+            'stats': {},
+        }
+
+    @property
+    def status(self) -> str:
+        with self._lock:
+            return self._state['status']
+
+    @property
+    def done(self) -> bool:
+        return self.status in JOB_FINAL_STATUSES
+
+    def append_output(self, section: str, text: str) -> None:
+        """追加一段流式输出（如解析结果、目录JSON）"""
+        with self._lock:
+            outputs = self._state['outputs']
+            outputs[section] = outputs.get(section, '') + text
+
+    def record_item(self, key: str, content: Optional[str] = None, error: Optional[str] = None) -> None:
+        """
+        记录一个条目（如章节）的结果
+
+        Args:
+            key: 条目标识（如章节路径）
+            content: 生成的内容，失败时为None
+            error: 错误信息，成功时为None
+        """
+        with self._lock:
+            if error:
+                self._state['failed'] += 1
+                self._state['errors'][key] = error
+            else:
+                self._state['completed'] += 1
+                self._state['results'][key] = content
+                self._state['errors'].pop(key, None)
+
+    def set_stats(self, stats: Dict) -> None:
+        """更新供页面展示的运行状态（如并发数、缓存命中率）"""
+        with self._lock:
+            self._state['stats'] = stats
+
+    def snapshot(self) -> Dict:
+        """获取任务当前状态的副本，供页面渲染"""
+        with self._lock:
+            state = dict(self._state)
+            # 内容都是字符串，复制各个字典即可
+            for key in ('outputs', 'results', 'errors', 'stats'):
+                state[key] = dict(state[key])
+        state.update(id=self.id, kind=self.kind)
+        return state
+
+    def _set(self, **fields) -> None:
+        with self._lock:
+            self._state.update(fields)
+
+
+class JobManager:
+    """进程级的后台任务管理：任务在独立线程中运行，不受页面rerun和浏览器断开的影响"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+
+    def submit(self, kind: str, owner: str, target: Callable[..., Any], *args,
+               inputs: Optional[Dict] = None, total: int = 0, **kwargs) -> Job:
+        """
+        提交任务；同一会话同类型的任务只保留一个在运行，提交新任务时取消旧任务，
+        不影响其他会话（包括使用同一API Key的其他人）的任务
+
+        Args:
+            kind: 任务类型
+            owner: 任务所属会话
+            target: 任务函数，第一个参数为Job，返回值作为任务的最终结果；
+                    运行在后台线程中，不能访问Streamlit组件和session_state
+            *args, **kwargs: 传给任务函数的其他参数
+            inputs: 任务的输入，见Job
+            total: 需要完成的条目数
+
+        Returns:
+            新任务
+        """
+        previous = self.active(kind, owner)
+        if previous is not None:
+            previous.cancel_token.cancel("已被新的任务替代")
+
+        job = Job(kind, owner, inputs=inputs, total=total)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune(owner)
+        thread = threading.Thread(target=self._run, args=(job, target, args, kwargs),
+                                  name=f"job-{kind}-{job.id}", daemon=True)
+        thread.start()
+        return job
+
+    def _run(self, job: Job, target: Callable, args: tuple, kwargs: dict) -> None:
+        job._set(status=JOB_RUNNING)
+        try:
+            result = target(job, *args, **kwargs)
+            if job.cancel_token.cancelled:
+                job._set(status=JOB_CANCELLED, result=result, error=job.cancel_token.reason)
+            else:
+                job._set(status=JOB_COMPLETED, result=result)
+        except GenerationCancelled as e:
+            job._set(status=JOB_CANCELLED, error=str(e))
+        except Exception as e:
+            job._set(status=JOB_CANCELLED if job.cancel_token.cancelled else JOB_FAILED, error=str(e))
+        finally:
+            job._set(finished_at=time.time())
+
+    def _prune(self, owner: str) -> None:
+        """清除该会话较早的已结束任务（调用方持有锁）"""
+        finished = sorted((job for job in self._jobs.values() if job.owner == owner and job.done),
+                          key=lambda job: job.created_at)
+        for job in finished[:-MAX_FINISHED_JOBS]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self, kind: str, owner: str) -> Optional[Job]:
+        """该会话最近提交的某类任务（页面刷新后据此找回任务）"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.kind == kind and job.owner == owner]
+        if not jobs:
+            return None
+        return max(jobs, key=lambda job: job.created_at)
+
+    def active(self, kind: str, owner: str) -> Optional[Job]:
+        """该会话正在运行的某类任务"""
+        job = self.latest(kind, owner)
+        return job if job is not None and not job.done else None
+
+    def cancel(self, job_id: str, reason: str = "已停止生成") -> None:
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel_token.cancel(reason)
+
+    def list(self, owner: str) -> List[Job]:
+        with self._lock:
+            return [job for job in self._jobs.values() if job.owner == owner]
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """
+    获取进程级任务管理器，所有会话共用
+
+    Returns:
+        JobManager实例
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+    return _manager
+
+
+def current_owner() -> str:
+    """
+    当前浏览器会话的标识，任务按此归属
+
+    标识是随机生成的，保存在session_state和URL参数中：刷新页面后从URL参数中恢复，
+    新打开的页面得到新的标识。使用同一API Key的不同浏览器或同事之间不会互相取消任务，
+    也不会读取对方任务的输入。
+
+    Returns:
+        32位十六进制标识
+    """
+    owner = st.session_state.get('job_owner')
+    if owner is None:
+        owner = st.query_params.get(SESSION_PARAM)
+        if not owner or not _SESSION_ID.match(owner):
+            owner = uuid.uuid4().hex
+        st.session_state.job_owner = owner
+    if st.query_params.get(SESSION_PARAM) != owner:
+        st.query_params[SESSION_PARAM] = owner
+    return owner
+
+
+def get_session_job(kind: str) -> Optional[Job]:
+    """
+    获取当前会话关注的某类任务
+
+    会话中没有记录时（页面刷新后session_state被清空），找回本会话（见current_owner）最近提交的同类任务；
+    其他会话的任务不会被找回。
+
+    Args:
+        kind: 任务类型
+
+    Returns:
+        任务，没有时返回None
+    """
+    manager = get_job_manager()
+    owner = current_owner()
+    job = manager.get(st.session_state.get(f'{kind}_job_id'))
+    if job is not None and job.owner != owner:
+        job = None
+    if job is None:
+        job = manager.latest(kind, owner)
+        if job is not None:
+            st.session_state[f'{kind}_job_id'] = job.id
+    return job
+
+
+def submit_session_job(kind: str, target: Callable[..., Any], *args, **kwargs) -> Job:
+    """
+    以当前会话的身份提交任务，并记录为当前会话关注的任务
+
+    参数见JobManager.submit。
+    """
+    job = get_job_manager().submit(kind, current_owner(), target, *args, **kwargs)
+    st.session_state[f'{kind}_job_id'] = job.id
+    return job
+
+
+def claim_finished_job(job: Job) -> bool:
+    """
+    已结束的任务在每个会话中只应用一次结果，避免覆盖用户之后的修改
+
+    Returns:
+        本会话是否第一次处理该任务的结果
+    """
+    key = f'{job.kind}_job_applied'
+    if st.session_state.get(key) == job.id:
+        return False
+    st.session_state[key] = job.id
+    return True
@@ -0,0 +1,319 @@
+import json
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+
+class _EscapeDecoder:
+    """解码字符串中的转义序列，序列被拆分在两个片段之间时会自动拼接"""
+
+    def __init__(self):
+        self.escape = None
+        self._pending_surrogate = None
+
+    @property
+    def active(self) -> bool:
+        return self.escape is not None
+
+    def start(self) -> None:
+        self.escape = ''
+
+    def feed(self, char: str) -> Optional[str]:
+        """输入转义符之后的一个字符，序列还不完整时返回None"""
+        self.escape += char
+        escape = self.escape
+        if escape[0] != 'u':
+            self.escape = None
+            return _SIMPLE_ESCAPES.get(escape, escape)
+        if len(escape) < 5:
+            return None
+        self.escape = None
+        try:
+            code = int(escape[1:], 16)
+        except ValueError:
+            return ''
+        # 代理对（如emoji）需要两个转义拼成一个字符
+        if 0xD800 <= code <= 0xDBFF:
+            self._pending_surrogate = code
+            return ''
+        if 0xDC00 <= code <= 0xDFFF and self._pending_surrogate is not None:
+            high = self._pending_surrogate
+            self._pending_surrogate = None
+            return chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00))
+        return chr(code)
+
+
+class JsonSectionStreamer:
+    """
+    增量解析形如 {"key": "字符串", ...} 的流式JSON，边接收边输出各字段的字符串内容
+
+    只关心顶层的字符串字段；非字符串的值会被跳过，完整结果仍应以json.loads为准。
+    """
+
+    def __init__(self):
+        self._state = 'object_start'
+        self._key = []
+        self._current_key = None
+        self._decoder = _EscapeDecoder()
+        self._skip_depth = 0
+        self._skip_in_string = False
+        self._skip_escape = False
+        self.completed: Set[str] = set()
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """
+        输入一段新的流式文本
+
+        Args:
+            text: 新收到的文本片段
+
+        Returns:
+            [(字段名, 新增的字符串内容)]，同一字段的连续内容已合并
+        """
+        output: List[Tuple[str, str]] = []
+        buffer = []
+
+        def flush():
+            if buffer:
+                if output and output[-1][0] == self._current_key:
+                    output[-1] = (self._current_key, output[-1][1] + ''.join(buffer))
+                else:
+                    output.append((self._current_key, ''.join(buffer)))
+                buffer.clear()
+
+        for char in text:
+            state = self._state
+            if state == 'value':
+                if self._decoder.active:
+                    decoded = self._decoder.feed(char)
+                    if decoded is not None:
+                        buffer.append(decoded)
+                elif char == '\\':
+                    self._decoder.start()
+                elif char == '"':
+                    flush()
+                    self.completed.add(self._current_key)
+                    self._state = 'after_value'
+                else:
+                    buffer.append(char)
+            elif state == 'object_start':
+                if char == '{':
+                    self._state = 'key_start'
+            elif state == 'key_start':
+                if char == '"':
+                    self._key = []
+                    self._state = 'key'
+                elif char == '}':
+                    self._state = 'done'
+            elif state == 'key':
+                if char == '"' and not (self._key and self._key[-1] == '\\'):
+                    self._current_key = ''.join(self._key)
+                    self._state = 'colon'
+                else:
+                    self._key.append(char)
+            elif state == 'colon':
+                if char == ':':
+                    self._state = 'value_start'
+            elif state == 'value_start':
+                if char == '"':
+                    self._state = 'value'
+                elif not char.isspace():
+                    # 非字符串值：跳过到同层的下一个逗号或右括号
+                    self._state = 'skip'
+                    self._skip_depth = 1 if char in '[{' else 0
+                    self._skip_in_string = False
+                    self._skip_escape = False
+            elif state == 'skip':
+                self._skip_value(char)
+            elif state == 'after_value':
+                if char == ',':
+                    self._state = 'key_start'
+                elif char == '}':
+                    self._state = 'done'
+
+        flush()
+        return output
+
+    def _skip_value(self, char: str) -> None:
+        if self._skip_in_string:
+            if self._skip_escape:
+                self._skip_escape = False
+            elif char == '\\':
+                self._skip_escape = True
+            elif char == '"':
+                self._skip_in_string = False
+        elif char == '"':
+            self._skip_in_string = True
+        elif char in '[{':
+            self._skip_depth += 1
+        elif char in ']}':
+            if self._skip_depth == 0:
+                self._state = 'done'
+            else:
+                self._skip_depth -= 1
+        elif char == ',' and self._skip_depth == 0:
+            self._state = 'key_start'
+
+
+class IncrementalJsonParser:
+    """
+    增量构建流式JSON文档，每当一个对象闭合时立即报告
+
+    解析过程中root始终是已接收部分对应的文档：容器在开始时就挂到父节点上，
+    字符串和数字等标量只有完整接收后才会写入。
+    """
+
+    def __init__(self):
+        self.root: Any = None
+        self.done = False
+        # 每层为 [容器, 路径, 待赋值的键]
+        self._stack: List[list] = []
+        self._string: Optional[List[str]] = None
+        self._decoder = _EscapeDecoder()
+        self._literal: Optional[List[str]] = None
+        self._completed: List[Tuple[tuple, Dict]] = []
+
+    def feed(self, text: str) -> List[Tuple[tuple, Dict]]:
+        """
+        输入一段新的流式文本
+
+        Args:
+            text: 新收到的文本片段
+
+        Returns:
+            本次新闭合的对象列表 [(路径, 对象)]，路径由键名和列表下标组成，如 ('outline', 0)
+        """
+        for char in text:
+            self._feed_char(char)
+        completed, self._completed = self._completed, []
+        return completed
+
+    def _feed_char(self, char: str) -> None:
+        if self._string is not None:
+            if self._decoder.active:
+                decoded = self._decoder.feed(char)
+                if decoded is not None:
+                    self._string.append(decoded)
+            elif char == '\\':
+                self._decoder.start()
+            elif char == '"':
+                value = ''.join(self._string)
+                self._string = None
+                top = self._stack[-1] if self._stack else None
+                if top is not None and isinstance(top[0], dict) and top[2] is None:
+                    top[2] = value
+                else:
+                    self._add_value(value)
+            else:
+                self._string.append(char)
+            return
+
+        if self._literal is not None:
+            if not (char.isspace() or char in ',]}'):
+                self._literal.append(char)
+                return
+            self._finish_literal()
+
+        if self.done or char.isspace() or char in ':,':
+            return
+        if char == '{' or char == '[':
+            container = {} if char == '{' else []
+            path = self._add_value(container)
+            self._stack.append([container, path, None])
+        elif char == '}' or char == ']':
+            if self._stack:
+                container, path, _ = self._stack.pop()
+                if isinstance(container, dict):
+                    self._completed.append((path, container))
+                if not self._stack:
+                    self.done = True
+        elif char == '"':
+            self._string = []
+        else:
+            self._literal = [char]
+
+    def _finish_literal(self) -> None:
+        raw = ''.join(self._literal)
+        self._literal = None
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw
+        self._add_value(value)
+
+    def _add_value(self, value: Any) -> tuple:
+        """把值挂到当前容器上，返回它的路径"""
+        if not self._stack:
+            self.root = value
+            if not isinstance(value, (dict, list)):
+                self.done = True
+            return ()
+        top = self._stack[-1]
+        container, path = top[0], top[1]
+        if isinstance(container, list):
+            container.append(value)
+            return path + (len(container) - 1,)
+        key = top[2]
+        top[2] = None
+        container[key] = value
+        return path + (key,)
+
+
+def _visible_chapters(chapters: list) -> List[Dict]:
+    visible = []
+    for chapter in chapters:
+        if not isinstance(chapter, dict) or not chapter.get('id') or not chapter.get('title'):
+            continue
+        node = {
+            'id': chapter['id'],
+            'title': chapter['title'],
+            'description': chapter.get('description', '')
+        }
+        if isinstance(chapter.get('children'), list):
+            node['children'] = _visible_chapters(chapter['children'])
+        visible.append(node)
+    return visible
+
+
+class OutlineStreamParser:
+    """增量解析generate_outline返回的目录JSON，边生成边给出已完成的章节"""
+
+    def __init__(self):
+        self._parser = IncrementalJsonParser()
+        self.completed_chapters: List[Dict] = []
+
+    def feed(self, text: str) -> List[Dict]:
+        """
+        输入一段新的流式文本
+
+        Args:
+            text: 新收到的文本片段
+
+        Returns:
+            本次新完成（对象已闭合）的一级章节列表
+        """
+        chapters = [value for path, value in self._parser.feed(text)
+                    if len(path) == 2 and path[0] == 'outline']
+        self.completed_chapters.extend(chapters)
+        return chapters
+
+    def partial_outline(self) -> List[Dict]:
+        """
+        获取当前已解析出的目录，用于边生成边展示
+
+        Returns:
+            章节列表，只包含编号和标题都已完整接收的章节
+        """
+        root = self._parser.root
+        if not isinstance(root, dict) or not isinstance(root.get('outline'), list):
+            return []
+        return _visible_chapters(root['outline'])
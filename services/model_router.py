@@ -0,0 +1,49 @@
+from typing import Dict, Optional
+
+# 任务类型：招标文件解析（长上下文提取）、目录生成（JSON结构）、章节正文（大批量短文本）
+TASK_ANALYSIS = "analysis"
+TASK_OUTLINE = "outline"
+TASK_CHAPTER = "chapter"
+
+# 层级不超过该值的叶子章节视为重点章节（如没有下级的一级、二级章节，通常需要写得更充分），0表示不区分
+DEFAULT_MAJOR_CHAPTER_LEVEL = 0
+
+DEFAULT_MODEL_ROUTES = {
+    'analysis_model': '',
+    'outline_model': '',
+    'chapter_model': '',
+    'major_chapter_model': '',
+    'major_chapter_level': DEFAULT_MAJOR_CHAPTER_LEVEL,
+}
+
+
+class ModelRouter:
+    """按任务类型把请求分配给不同的模型，未配置的任务使用主模型"""
+
+    def __init__(self, default_model: str, routes: Optional[Dict] = None):
+        """
+        初始化模型路由
+
+        Args:
+            default_model: 主模型，路由规则为空时使用
+            routes: 路由规则，键见DEFAULT_MODEL_ROUTES，模型名为空表示使用主模型
+        """
+        self.default_model = default_model
+        self.routes = dict(DEFAULT_MODEL_ROUTES, **(routes or {}))
+
+    def model_for(self, task: str, level: Optional[int] = None) -> str:
+        """
+        获取任务使用的模型
+
+        Args:
+            task: 任务类型（TASK_ANALYSIS / TASK_OUTLINE / TASK_CHAPTER）
+            level: 章节层级（仅章节正文使用，1表示一级章节）
+
+        Returns:
+            模型名称
+        """
+        if task == TASK_CHAPTER:
+            major_level = int(self.routes.get('major_chapter_level') or 0)
+            if level is not None and major_level and level <= major_level and self.routes.get('major_chapter_model'):
+                return self.routes['major_chapter_model']
+        return self.routes.get(f"{task}_model") or self.default_model
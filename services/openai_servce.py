@@ -1,12 +1,72 @@
-import openai
 import streamlit as st
-from typing import Generator, Dict, Any
+from typing import Generator, Dict, Any, List, Optional, Tuple
+import hashlib
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from services.response_cache import ResponseCache, get_response_cache, iter_cached_chunks
+from services.client_registry import get_openai_client, get_http_settings
+from services.rate_limiter import (
+    get_rate_limiter,
+    estimate_prompt_tokens,
+    estimate_text_tokens,
+    DEFAULT_COMPLETION_TOKENS,
+    DEFAULT_RPM_LIMIT,
+    DEFAULT_TPM_LIMIT
+)
+from services.retry_policy import RetryPolicy, LLMServiceError, classify_error, build_resume_messages, DEFAULT_MAX_RETRIES
+from services.document_chunker import split_document, DEFAULT_CHUNK_SIZE, DEFAULT_PARALLELISM
+from services.json_stream import JsonSectionStreamer
+from services.usage_tracker import (
+    get_usage_tracker,
+    stream_usage_options,
+    is_stream_options_rejected,
+    mark_stream_usage_unsupported
+)
+from services.telemetry import CallMetrics, get_telemetry
+from services.model_router import ModelRouter, DEFAULT_MODEL_ROUTES, TASK_ANALYSIS, TASK_OUTLINE, TASK_CHAPTER
+from services.cancellation import CancellationToken, GenerationCancelled
+from services.singleflight import get_inflight_table, make_flight_key
+from services.context_compression import build_chapter_context
+from services.outline_index import get_outline_index
+
+# 文档分析模式：一次请求同时提取两项内容，或按项分别请求
+ANALYSIS_MODE_COMBINED = "combined"
+ANALYSIS_MODE_SEPARATE = "separate"
+DEFAULT_ANALYSIS_MODE = ANALYSIS_MODE_COMBINED
+
+# 合并解析时JSON中的字段，与analyze_document的analysis_type一致
+ANALYSIS_SECTIONS = {"overview": "项目概述", "requirements": "技术评分要求"}
+
+# 分块解析时，某一块没有相关内容的约定返回值
+NO_CONTENT_MARK = "无"
+
+# 章节正文的温度参数
+CHAPTER_TEMPERATURE = 0.7
+
+
+def _group_fragments(fragments: list, max_chars: int) -> list:
+    """按顺序把提取片段分组，每组合计长度不超过max_chars（单个片段过长时单独成组）"""
+    groups = []
+    current = []
+    current_size = 0
+    for fragment in fragments:
+        if current and current_size + len(fragment) > max_chars:
+            groups.append(current)
+            current = []
+            current_size = 0
+        current.append(fragment)
+        current_size += len(fragment)
+    if current:
+        groups.append(current)
+    return groups
 
 class OpenAIService:
     """OpenAI服务类，提供流式和非流式请求功能"""
     
-    def __init__(self, api_key: str, base_url: str = None, model_name: str = "gpt-3.5-turbo"):
+    def __init__(self, api_key: str, base_url: str = None, model_name: str = "gpt-3.5-turbo", use_cache: bool = True,
+                 http_settings: dict = None, rate_limits: dict = None, max_retries: int = DEFAULT_MAX_RETRIES,
+                 analysis_settings: dict = None, model_routes: dict = None):
         """
         初始化OpenAI服务
         
@@ -14,22 +74,73 @@ class OpenAIService:
             api_key: OpenAI API密钥
             base_url: 基础URL（可选，用于代理）
             model_name: 模型名称
+            use_cache: 是否使用本地响应缓存
+            http_settings: 连接设置（超时、连接池大小），见client_registry.get_http_settings
+            rate_limits: 限流预算 {'rpm_limit': ..., 'tpm_limit': ...}，见get_rate_limit_settings
+            max_retries: 单次调用遇到临时错误时的最大重试次数
+            analysis_settings: 文档分析设置 {'chunk_size': ..., 'parallelism': ..., 'mode': ...}，见get_analysis_settings
+            model_routes: 按任务类型选择模型的规则，见ModelRouter
         """
         self.api_key = api_key
         self.base_url = base_url
         self.model_name = model_name
+        self.use_cache = use_cache
+        self.http_settings = http_settings or {}
+        self.rate_limits = rate_limits or {}
+        self.retry_policy = RetryPolicy(max_retries=max_retries)
+        self.analysis_settings = analysis_settings or {}
+        self.router = ModelRouter(model_name, model_routes)
         
-        # 初始化OpenAI客户端
-        self.client = openai.OpenAI(
-            api_key=api_key,
-            base_url=base_url if base_url else None
+        # 获取进程级共享的OpenAI客户端，复用保活连接
+        self.client = get_openai_client(api_key, base_url, **self.http_settings)
+    
+    @property
+    def rate_limiter(self):
+        """当前网关、模型和密钥对应的RPM/TPM限流器"""
+        return self._rate_limiter_for(self.base_url, self.model_name, self.api_key)
+    
+    def _rate_limiter_for(self, base_url: str, model_name: str, api_key: str):
+        """获取指定端点的限流器，预算取自当前的限流设置"""
+        return get_rate_limiter(
+            base_url,
+            model_name,
+            self.rate_limits.get('rpm_limit', DEFAULT_RPM_LIMIT),
+            self.rate_limits.get('tpm_limit', DEFAULT_TPM_LIMIT),
+            api_key
         )
     
+    @property
+    def usage_tracker(self):
+        """章节正文所用模型的token用量统计"""
+        return get_usage_tracker(self.base_url, self.router.model_for(TASK_CHAPTER))
+    
+    def get_available_models(self) -> list:
+        """
+        获取可用的聊天模型列表
+        
+        Returns:
+            排序后的模型ID列表
+        """
+        self.rate_limiter.acquire()
+        models = self.client.models.list()
+        chat_models = []
+        for model in models.data:
+            model_id = model.id.lower()
+            if any(keyword in model_id for keyword in ['gpt', 'claude', 'chat', 'llama', 'qwen', 'deepseek']):
+                chat_models.append(model.id)
+        
+        return sorted(list(set(chat_models)))
+    
     def stream_chat_completion(
         self, 
         messages: list, 
         temperature: float = 0.7,
-        response_format: dict = None
+        response_format: dict = None,
+        model_name: str = None,
+        task: str = None,
+        chapter_id: str = None,
+        cancel_token: Optional[CancellationToken] = None,
+        share: bool = True
     ) -> Generator[str, None, None]:
         """
         流式聊天完成请求
@@ -37,39 +148,164 @@ class OpenAIService:
         Args:
             messages: 消息列表
             temperature: 温度参数，控制随机性
+            response_format: 返回格式（可选）
+            model_name: 使用的模型（可选），默认按任务类型由self.router选择，未指定任务类型时为主模型
+            task: 任务类型（可选），见services.model_router，同时写入调用记录
+            chapter_id: 章节编号（可选），写入调用记录
+            cancel_token: 取消信号（可选），取消后立即关闭连接，不再重试
+            share: 相同的请求正在进行时（如另一个会话解析同一份招标文件）是否直接跟随其输出，
+                   见services.singleflight
             
         Yields:
             流式返回的文本片段
-        """
-        try:
-            stream = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=temperature,
-                stream=True,
-                **({"response_format": response_format} if response_format is not None else {})
-            )
             
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-                    
-        except Exception as e:
-            yield f"错误: {str(e)}"
+        Raises:
+            LLMServiceError: 重试预算用尽或遇到不可重试的错误
+            GenerationCancelled: 被取消
+        """
+        model_name = model_name or (self.router.model_for(task) if task else self.model_name)
+        
+        # 命中本地缓存时直接回放，不再请求接口
+        cache_key = None
+        if self.use_cache:
+            cache = get_response_cache()
+            cache_key = cache.make_key(model_name, messages, temperature, response_format)
+            cached_content = cache.get(cache_key)
+            if cached_content is not None:
+                yield from iter_cached_chunks(cached_content)
+                get_telemetry().record(CallMetrics(task, chapter_id, model_name, self.base_url).finish('cache_hit'))
+                return
+        
+        def start(received):
+            return self._request_stream(messages, temperature, response_format, model_name, task, chapter_id,
+                                        cancel_token, cache_key, received)
+        
+        if not share:
+            yield from start([])
+            return
+        flight_key = make_flight_key(self.base_url, model_name, messages, temperature, response_format)
+        yield from get_inflight_table().stream(
+            flight_key,
+            start,
+            cancel_token=cancel_token,
+            on_shared=lambda: get_telemetry().record(
+                CallMetrics(task, chapter_id, model_name, self.base_url).finish('shared'))
+        )
     
-    def analyze_document(self, file_content: str, analysis_type: str = "overview") -> Generator[str, None, None]:
+    def _request_stream(self, messages: list, temperature: float, response_format: Optional[dict], model_name: str,
+                        task: Optional[str], chapter_id: Optional[str], cancel_token: Optional[CancellationToken],
+                        cache_key: Optional[str], received: list) -> Generator[str, None, None]:
         """
-        分析文档内容
+        实际请求接口（含限流、重试和断点续写），参数见stream_chat_completion
         
         Args:
-            file_content: 文档内容
-            analysis_type: 分析类型 ("overview" 或 "requirements")
-            
-        Yields:
-            流式分析结果
+            cache_key: 响应缓存键，为None时不写入缓存
+            received: 已经输出给调用方的片段（跟随的请求中途失败时），从这些内容之后继续生成
         """
+        # 记录本次调用的排队、首字延迟、耗时和用量，见services.telemetry
+        metrics = CallMetrics(task, chapter_id, model_name, self.base_url)
+        status, call_error = 'error', None
+        try:
+            collected = list(received)
+            retries_done = 0
+            total_delay = 0.0
+            usage_options = stream_usage_options(self.base_url)
+            while True:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                # 断点续写：中途断开时让模型接着已输出的内容继续，调用方不会收到重复片段
+                request_messages = build_resume_messages(messages, "".join(collected))
+                
+                # 按RPM/TPM预算排队，请求结束后按实际输出修正token消耗
+                rate_limiter = self._rate_limiter_for(self.base_url, model_name, self.api_key)
+                prompt_tokens = estimate_prompt_tokens(request_messages)
+                estimated_tokens = prompt_tokens + DEFAULT_COMPLETION_TOKENS
+                queued_at = time.monotonic()
+                rate_limiter.acquire(estimated_tokens)
+                metrics.queued(time.monotonic() - queued_at)
+                
+                attempt_output = []
+                usage = None
+                stream = None
+                remove_close_callback = None
+                try:
+                    metrics.sent()
+                    stream = self.client.chat.completions.create(
+                        model=model_name,
+                        messages=request_messages,
+                        temperature=temperature,
+                        stream=True,
+                        **usage_options,
+                        **({"response_format": response_format} if response_format is not None else {})
+                    )
+                    if cancel_token is not None:
+                        # 在等待首字或下一个片段时被取消，也能从取消的线程中直接断开连接
+                        remove_close_callback = cancel_token.add_callback(stream.close)
+                    
+                    for chunk in stream:
+                        if cancel_token is not None:
+                            cancel_token.raise_if_cancelled()
+                        # 最后一个chunk携带usage（含服务端前缀缓存命中的cached_tokens）
+                        if getattr(chunk, 'usage', None) is not None:
+                            usage = chunk.usage
+                        if chunk.choices and chunk.choices[0].delta.content is not None:
+                            metrics.token(chunk.choices[0].delta.content)
+                            attempt_output.append(chunk.choices[0].delta.content)
+                            collected.append(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+                    if usage is not None:
+                        get_usage_tracker(self.base_url, model_name).record(usage)
+                    if not usage_options and stream_usage_options(self.base_url):
+                        mark_stream_usage_unsupported(self.base_url)
+                    break
+                            
+                except Exception as e:
+                    if cancel_token is not None and cancel_token.cancelled:
+                        if stream is not None:
+                            stream.close()
+                        raise GenerationCancelled(cancel_token.reason) from e
+                    if usage_options and not attempt_output and is_stream_options_rejected(e):
+                        # 接口可能不接受stream_options：去掉后立即重试一次，不计入重试次数
+                        usage_options = {}
+                        continue
+                    error = classify_error(e, "".join(collected), retries_done + 1)
+                    delay = self.retry_policy.next_delay(error, retries_done, total_delay)
+                    if delay is None:
+                        raise error from e
+                finally:
+                    if remove_close_callback is not None:
+                        remove_close_callback()
+                    if usage is not None:
+                        metrics.add_usage(usage)
+                    actual_tokens = usage.total_tokens if usage is not None else prompt_tokens + estimate_text_tokens("".join(attempt_output))
+                    rate_limiter.settle(estimated_tokens, actual_tokens)
+                
+                retries_done += 1
+                total_delay += delay
+                if cancel_token is not None:
+                    if cancel_token.wait(delay):
+                        raise GenerationCancelled(cancel_token.reason)
+                else:
+                    time.sleep(delay)
+            
+            # 只缓存完整结束的响应
+            if cache_key is not None and collected:
+                get_response_cache().put(cache_key, "".join(collected), model_name)
+            status = 'ok'
+        except (GeneratorExit, GenerationCancelled):
+            # 调用方提前停止读取，或被取消
+            status = 'cancelled'
+            raise
+        except Exception as e:
+            call_error = e
+            raise
+        finally:
+            get_telemetry().record(metrics.finish(status, call_error))
+    
+    def _analysis_system_prompt(self, analysis_type: str) -> str:
+        """获取文档分析的系统提示词"""
         if analysis_type == "overview":
-            system_prompt = """你是一个专业的招标文件分析专家。请分析上传的招标文件，提取并总结项目概述信息。
+            return """你是一个专业的招标文件分析专家。请分析上传的招标文件，提取并总结项目概述信息。
             
 请重点关注以下方面：
 1. 项目名称和基本信息
@@ -84,8 +320,8 @@ class OpenAIService:
 2. 只关注与项目实施有关的内容，不提取商务信息
 3. 直接返回整理好的项目概述，除此之外不返回任何其他内容
 """
-        else:  # requirements
-            system_prompt = """你是一个专业的招标文件分析专家。请分析上传的招标文件，提取技术评分要求,为编写投标文件中的技术方案做准备。
+        # requirements
+        return """你是一个专业的招标文件分析专家。请分析上传的招标文件，提取技术评分要求,为编写投标文件中的技术方案做准备。
             
 请重点关注以下方面：
 1. 理解技术评分的意思：用于编写、评比投标文件中技术标的标准，关注技术方案、实施计划、技术能力、质量控制、创新性等内容，避免混淆商务评分（资质、信誉、合同条款）和价格评分（报价金额）
@@ -93,25 +329,189 @@ class OpenAIService:
 3. 生成内容要确保是从招标文件中提取的，不要自己编写
 4. 直接返回整理好的技术评分要求，除此之外不返回任何其他内容
 """
+
+    def needs_chunking(self, file_content: str) -> bool:
+        """文档长度是否超过分块大小，需要分块解析"""
+        chunk_size = self.analysis_settings.get('chunk_size', DEFAULT_CHUNK_SIZE)
+        return chunk_size > 0 and len(file_content) > chunk_size
+    
+    def analyze_document(self, file_content: str, analysis_type: str = "overview",
+                         cancel_token: Optional[CancellationToken] = None) -> Generator[str, None, None]:
+        """
+        分析文档内容
+        
+        文档长度超过分块大小时自动切换为分块解析，见_analyze_document_chunked。
+        
+        Args:
+            file_content: 文档内容
+            analysis_type: 分析类型 ("overview" 或 "requirements")
+            cancel_token: 取消信号（可选）
+            
+        Yields:
+            流式分析结果
+        """
+        if self.needs_chunking(file_content):
+            chunk_size = self.analysis_settings.get('chunk_size', DEFAULT_CHUNK_SIZE)
+            yield from self._analyze_document_chunked(file_content, analysis_type, chunk_size, cancel_token)
+            return
+        
         analysis_type_cn = "项目概述" if analysis_type == "overview" else "技术评分要求"
         user_prompt = f"请分析以下招标文件内容，提取{analysis_type_cn}信息：\n\n{file_content}"
         
         messages = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": self._analysis_system_prompt(analysis_type)},
             {"role": "user", "content": user_prompt}
         ]
         
         # 流式返回分析结果
-        for chunk in self.stream_chat_completion(messages, temperature=0.3):
+        for chunk in self.stream_chat_completion(messages, temperature=0.3, task=TASK_ANALYSIS,
+                                                 cancel_token=cancel_token):
+            yield chunk
+    
+    def _analyze_document_chunked(self, file_content: str, analysis_type: str, chunk_size: int,
+                                  cancel_token: Optional[CancellationToken] = None) -> Generator[str, None, None]:
+        """
+        分块解析长文档（map-reduce）
+        
+        先按页/标题边界切块并行提取信息片段，再合并去重；片段总长仍超过分块大小时
+        先分组预合并，最后一次合并以流式返回。
+        
+        Args:
+            file_content: 文档内容
+            analysis_type: 分析类型 ("overview" 或 "requirements")
+            chunk_size: 每块的最大字符数
+            cancel_token: 取消信号（可选），取消后尚未开始的分块不再请求
+            
+        Yields:
+            流式分析结果
+        """
+        analysis_type_cn = "项目概述" if analysis_type == "overview" else "技术评分要求"
+        parallelism = max(1, self.analysis_settings.get('parallelism', DEFAULT_PARALLELISM))
+        chunks = split_document(file_content, chunk_size)
+        
+        map_system_prompt = self._analysis_system_prompt(analysis_type) + f"""
+注意：当前只提供了招标文件的其中一部分，只提取这一部分中出现的内容。如果这一部分没有任何相关内容，只返回“{NO_CONTENT_MARK}”。
+"""
+        
+        def extract(index: int, chunk: str) -> str:
+            messages = [
+                {"role": "system", "content": map_system_prompt},
+                {"role": "user", "content": f"以下是招标文件的第{index + 1}/{len(chunks)}部分，请提取{analysis_type_cn}信息：\n\n{chunk}"}
+            ]
+            return "".join(self.stream_chat_completion(messages, temperature=0.3, task=TASK_ANALYSIS,
+                                                       cancel_token=cancel_token)).strip()
+        
+        def merge(fragments: list) -> str:
+            return "".join(self.stream_chat_completion(self._build_merge_messages(fragments, analysis_type_cn), temperature=0.3,
+                                                       task=TASK_ANALYSIS, cancel_token=cancel_token)).strip()
+        
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            fragments = list(executor.map(extract, range(len(chunks)), chunks))
+            fragments = [f for f in fragments if f and f.strip('。. ') != NO_CONTENT_MARK]
+            
+            # 片段合计仍然过长时分组预合并，直到可以放进一次合并请求
+            while len(fragments) > 1 and sum(len(f) for f in fragments) > chunk_size:
+                groups = _group_fragments(fragments, chunk_size)
+                if len(groups) == len(fragments):
+                    break
+                fragments = list(executor.map(merge, groups))
+        
+        if not fragments:
+            return
+        if len(fragments) == 1:
+            yield fragments[0]
+            return
+        for chunk in self.stream_chat_completion(self._build_merge_messages(fragments, analysis_type_cn), temperature=0.3,
+                                                 task=TASK_ANALYSIS, cancel_token=cancel_token):
             yield chunk
+    
+    def analyze_document_combined(self, file_content: str,
+                                  cancel_token: Optional[CancellationToken] = None) -> Generator[Tuple[str, str], None, None]:
+        """
+        一次请求同时提取项目概述和技术评分要求
+        
+        模型按 {"overview": ..., "requirements": ...} 返回JSON，边接收边解析，
+        两部分内容分别流式输出，招标文件全文只需提交一次。
+        
+        Args:
+            file_content: 文档内容
+            cancel_token: 取消信号（可选）
+            
+        Yields:
+            (分析类型, 文本片段)，分析类型为 "overview" 或 "requirements"
             
-    def generate_outline(self, overview: str, requirements: str) -> Generator[str, None, None]:
+        Raises:
+            LLMServiceError: 请求失败，或返回结果中缺少某一部分
+        """
+        system_prompt = """你是一个专业的招标文件分析专家。请分析上传的招标文件，同时提取项目概述和技术评分要求。
+
+项目概述（overview）请重点关注以下方面：
+1. 项目名称和基本信息
+2. 项目背景和目的
+3. 项目规模和预算
+4. 项目时间安排
+5. 主要技术特点
+6. 关键要求
+
+技术评分要求（requirements）请重点关注以下方面：
+1. 理解技术评分的意思：用于编写、评比投标文件中技术标的标准，关注技术方案、实施计划、技术能力、质量控制、创新性等内容，避免混淆商务评分（资质、信誉、合同条款）和价格评分（报价金额）
+2. 仅提取技术评分项及相关要求，不包括商务、价格及其他
+
+工作要求：
+1. 保持提取信息的全面性和准确性，尽量使用原文内容，不要自己编写
+2. 项目概述只关注与项目实施有关的内容，不提取商务信息
+3. 两部分内容均为Markdown格式的文本
+4. 返回标准JSON格式，先输出overview，再输出requirements，除了JSON结果外，不要输出任何其他内容
+
+JSON格式要求：
+{
+  "overview": "整理好的项目概述",
+  "requirements": "整理好的技术评分要求"
+}
+"""
+        user_prompt = f"请分析以下招标文件内容，提取项目概述和技术评分要求信息：\n\n{file_content}"
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        
+        parser = JsonSectionStreamer()
+        for chunk in self.stream_chat_completion(messages, temperature=0.3, response_format={"type": "json_object"},
+                                                 task=TASK_ANALYSIS, cancel_token=cancel_token):
+            for section, text in parser.feed(chunk):
+                if section in ANALYSIS_SECTIONS:
+                    yield section, text
+        
+        missing = [name for section, name in ANALYSIS_SECTIONS.items() if section not in parser.completed]
+        if missing:
+            raise LLMServiceError(f"返回结果中缺少{'、'.join(missing)}，可尝试切换为分别解析模式")
+    
+    def _build_merge_messages(self, fragments: list, analysis_type_cn: str) -> list:
+        """构建合并分块提取结果的消息"""
+        system_prompt = f"""你是一个专业的招标文件分析专家。下面是从同一份招标文件的不同部分分别提取的{analysis_type_cn}片段，请将它们合并为一份完整的{analysis_type_cn}。
+
+工作要求：
+1. 合并相同或相近的内容，去除重复项
+2. 保留原文表述，不要自己编写
+3. 按照招标文件原有的顺序组织内容
+4. 直接返回整理好的{analysis_type_cn}，除此之外不返回任何其他内容
+"""
+        parts = "\n\n".join(f"【片段{i + 1}】\n{fragment}" for i, fragment in enumerate(fragments))
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": parts}
+        ]
+            
+    def generate_outline(self, overview: str, requirements: str,
+                         cancel_token: Optional[CancellationToken] = None) -> Generator[str, None, None]:
         """
         生成标书目录结构
         
         Args:
             overview: 项目概述信息
             requirements: 技术评分要求信息
+            cancel_token: 取消信号（可选）
             
         Yields:
             流式返回的JSON格式目录结构
@@ -168,13 +568,13 @@ JSON格式要求：
         ]
         
         # 流式返回目录结构
-        for chunk in self.stream_chat_completion(messages, temperature=0.7, response_format={"type": "json_object"}):
-            print(chunk, end="")
+        for chunk in self.stream_chat_completion(messages, temperature=0.7, response_format={"type": "json_object"},
+                                                 task=TASK_OUTLINE, cancel_token=cancel_token):
             yield chunk
 
     def generate_content_single(self, outline: str, project_overview: str = "") -> Generator[str, None, None]:
         """
-        递归遍历outline，为叶子节点生成内容
+        遍历outline，为叶子节点生成内容
 
         Args:
             outline: JSON格式的outline字符串
@@ -191,11 +591,8 @@ JSON格式要求：
                 yield "错误：无效的outline数据格式"
                 return
 
-            # 递归处理outline
-            # yield "开始处理outline结构...\n"
-
-            # 收集所有处理过程中的消息
-            for message in self._process_outline_recursive(outline_data['outline'], "", [], project_overview):
+            # 按目录索引逐个处理叶子章节
+            for message in self._process_outline_leaves(outline_data, project_overview):
                 yield message
 
             # 重新转换为JSON并返回
@@ -207,58 +604,36 @@ JSON格式要求：
         except Exception as e:
             yield f"处理过程中发生错误: {str(e)}"
 
-    def _process_outline_recursive(self, chapters: list, parent_path: str = "", parent_chapters: list = None, project_overview: str = ""):
+    def _process_outline_leaves(self, outline_data: dict, project_overview: str = ""):
         """
-        递归处理章节列表
+        按目录顺序为所有叶子章节生成内容，写入章节数据的content字段
 
         Args:
-            chapters: 章节列表
-            parent_path: 父级路径
-            parent_chapters: 上级章节列表，用于传递上下文信息
+            outline_data: 目录数据
             project_overview: 项目概述信息
 
         Yields:
             处理过程中的状态消息
         """
-        for i, chapter in enumerate(chapters):
-            current_path = f"{parent_path}.{i}" if parent_path else str(i)
-            chapter_id = chapter.get('id', f'unknown_{i}')
-            chapter_title = chapter.get('title', '未命名章节')
-
-            # 检查是否为叶子节点（没有children或children为空）
-            is_leaf = 'children' not in chapter or not chapter.get('children', [])
-
-            # 准备当前章节信息
-            current_chapter_info = {
-                'id': chapter_id,
-                'title': chapter_title,
-                'description': chapter.get('description', '')
-            }
-
-            # 构建完整的上级章节列表
-            current_parent_chapters = []
-            if parent_chapters:
-                current_parent_chapters.extend(parent_chapters)
-            current_parent_chapters.append(current_chapter_info)
-
-            if is_leaf:
-                # 为叶子节点生成内容
-                # 获取同级章节（排除当前章节）
-                sibling_chapters = [ch for ch in chapters if ch.get('id') != chapter_id]
-                content = self._generate_chapter_content(chapter, current_parent_chapters[:-1], sibling_chapters, project_overview)
-                if content:
-                    chapter['content'] = content
-                    yield content
-                    # yield f"✅ 为章节 {chapter_id} '{chapter_title}' 生成内容完成\n"
-                else:
-                    yield f"❌ 为章节 {chapter_id} '{chapter_title}' 生成内容失败\n"
+        for _, node_info in get_outline_index(outline_data).leaf_nodes_info():
+            chapter = node_info['chapter']
+            # 单个章节的接口错误只记为该章节失败，其余章节继续生成
+            try:
+                content = self._generate_chapter_content(chapter, node_info['parent_chapters'],
+                                                         node_info['sibling_chapters'], project_overview,
+                                                         context_info=node_info['context'])
+                error = None
+            except LLMServiceError as e:
+                content, error = "", str(e)
+            if content:
+                chapter['content'] = content
+                yield content
             else:
-                # 递归处理子章节
-                # yield f"📁 正在处理章节 {chapter_id} '{chapter_title}' 的子章节...\n"
-                for message in self._process_outline_recursive(chapter['children'], current_path, current_parent_chapters, project_overview):
-                    yield message
+                reason = f": {error}" if error else ""
+                yield f"❌ 为章节 {chapter.get('id', 'unknown')} '{chapter.get('title', '未命名章节')}' 生成内容失败{reason}\n"
 
-    def _generate_chapter_content(self, chapter: dict,  parent_chapters: list = None, sibling_chapters: list = None, project_overview: str = "") -> str:
+    def _generate_chapter_content(self, chapter: dict,  parent_chapters: list = None, sibling_chapters: list = None,
+                                  project_overview: str = "", context_info: Optional[str] = None) -> str:
         """
         为单个章节生成内容
 
@@ -268,17 +643,49 @@ JSON格式要求：
             parent_chapters: 上级章节列表，每个元素包含章节id、标题和描述
             sibling_chapters: 同级章节列表，避免内容重复
             project_overview: 项目概述信息，提供项目背景和要求
+            context_info: 预先生成的上下文文本（可选）
 
         Returns:
             生成的内容字符串
+
+        Raises:
+            LLMServiceError: 重试预算用尽或遇到不可重试的错误
         """
-        try:
-            chapter_id = chapter.get('id', 'unknown')
-            chapter_title = chapter.get('title', '未命名章节')
-            chapter_description = chapter.get('description', '')
+        messages = self._build_chapter_messages(chapter, parent_chapters, sibling_chapters, project_overview,
+                                                context_info)
+
+        # 收集所有生成的文本
+        model_name = self.router.model_for(TASK_CHAPTER, level=len(parent_chapters or []) + 1)
+        full_content = ""
+        for chunk in self.stream_chat_completion(messages, temperature=CHAPTER_TEMPERATURE, model_name=model_name,
+                                                 task=TASK_CHAPTER, chapter_id=chapter.get('id')):
+            full_content += chunk
+        return full_content.strip()
+
+    def _build_chapter_messages(self, chapter: dict, parent_chapters: list = None, sibling_chapters: list = None,
+                                project_overview: str = "", context_info: Optional[str] = None,
+                                references: Optional[List[str]] = None) -> list:
+        """
+        构建单个章节内容生成的消息列表，同步与异步服务共用
 
-            # 构建提示词
-            system_prompt = """你是一个专业的标书编写专家，负责为投标文件的技术标部分生成具体内容。
+        Args:
+            chapter: 章节数据
+            parent_chapters: 上级章节列表，每个元素包含章节id、标题和描述
+            sibling_chapters: 同级章节列表，避免内容重复
+            project_overview: 项目概述信息，提供项目背景和要求
+            context_info: 预先生成的上下文文本（见OutlineIndex），提供时不再由上级和同级章节构建
+            references: 从招标文件中检索到的参考段落（见TenderIndex.references_for），放在当前章节信息之前
+
+        Returns:
+            可直接传给chat completions接口的消息列表
+        """
+        chapter_id = chapter.get('id', 'unknown')
+        chapter_title = chapter.get('title', '未命名章节')
+        chapter_description = chapter.get('description', '')
+
+        # 提示词按“不变的内容在前、章节相关的内容在后”组织：系统提示词和项目概述对所有章节
+        # 完全相同，同级章节的上下文也相同，服务商可以缓存这段公共前缀
+        system_prompt = """你是一个专业的标书编写专家，负责为投标文件的技术标部分生成具体内容。
 
 要求：
 1. 内容要专业、准确，与章节标题和描述保持一致
@@ -288,53 +695,65 @@ JSON格式要求：
 5. 注意避免与同级章节内容重复，保持内容的独特性和互补性
 6. 直接返回章节内容，不生成标题，不要任何额外说明或格式标记
 """
+        if project_overview.strip():
+            system_prompt += f"\n项目概述信息：\n{project_overview}\n"
 
-            # 构建上下文信息
-            context_info = ""
-            
-            # 上级章节信息
-            if parent_chapters:
-                context_info += "上级章节信息：\n"
-                for parent in parent_chapters:
-                    context_info += f"- {parent['id']} {parent['title']}\n  {parent['description']}\n"
-            
-            # 同级章节信息（排除当前章节）
-            if sibling_chapters:
-                context_info += "同级章节信息（请避免内容重复）：\n"
-                for sibling in sibling_chapters:
-                    if sibling.get('id') != chapter_id:  # 排除当前章节
-                        context_info += f"- {sibling.get('id', 'unknown')} {sibling.get('title', '未命名')}\n  {sibling.get('description', '')}\n"
-
-            # 构建用户提示词
-            project_info = ""
-            if project_overview.strip():
-                project_info = f"项目概述信息：\n{project_overview}\n\n"
-            
-            user_prompt = f"""请为以下标书章节生成具体内容：
+        # 构建上下文信息，目录索引中已预先生成时直接使用
+        if context_info is None:
+            context_info = build_chapter_context(chapter_id, parent_chapters, sibling_chapters)
+
+        # 招标文件原文中与本章节相关的段落，只在有检索结果时加入，不影响没有原文时的提示词
+        if references:
+            context_info += "招标文件相关原文（供参考，内容应与之保持一致）：\n"
+            for number, passage in enumerate(references, 1):
+                context_info += f"[{number}] {passage}\n"
+            context_info += "\n"
+
+        # 构建用户提示词，当前章节信息放在最后
+        user_prompt = f"""请为以下标书章节生成具体内容：
 
-{project_info}{context_info if context_info else ''}当前章节信息：
+{context_info if context_info else ''}当前章节信息：
 章节ID: {chapter_id}
 章节标题: {chapter_title}
 章节描述: {chapter_description}
 
 请根据项目概述信息和上述章节层级关系，生成详细的专业内容，确保与上级章节的内容逻辑相承，同时避免与同级章节内容重复，突出本章节的独特性和技术方案的优势。"""
 
-            # 调用AI生成内容
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
 
-            # 收集所有生成的文本
-            full_content = ""
-            for chunk in self.stream_chat_completion(messages, temperature=0.7):
-                full_content += chunk
-            print(full_content.strip())
-            return full_content.strip()
+    def chapter_input_hash(self, chapter: dict, parent_chapters: list = None, sibling_chapters: list = None,
+                           project_overview: str = "", model_name: Optional[str] = None,
+                           context_info: Optional[str] = None, tender_hash: str = '') -> str:
+        """
+        计算章节生成输入的哈希，输入不变的章节无需重新生成
 
-        except Exception as e:
-            print(f"生成章节内容时出错: {str(e)}")
-            return ""
+        哈希覆盖提示词中的章节标题和描述、上级章节、同级章节、项目概述，以及模型和温度。
+        招标文件参考段落由招标文件内容和章节标题、描述决定，哈希中以招标文件的哈希代替检索结果，
+        计算哈希时不需要检索，只恢复了生成日志、没有检索索引时哈希也不变。
+
+        Args:
+            chapter: 章节数据
+            parent_chapters: 上级章节列表
+            sibling_chapters: 同级章节列表
+            project_overview: 项目概述信息
+            model_name: 模型名称，默认按章节层级路由
+            context_info: 预先生成的上下文文本（可选）
+            tender_hash: 招标文件的哈希（见tender_retrieval.document_hash），没有招标文件时为空
+
+        Returns:
+            十六进制哈希
+        """
+        messages = self._build_chapter_messages(chapter, parent_chapters, sibling_chapters, project_overview,
+                                                context_info)
+        if model_name is None:
+            model_name = self.router.model_for(TASK_CHAPTER, level=len(parent_chapters or []) + 1)
+        key = ResponseCache.make_key(model_name, messages, CHAPTER_TEMPERATURE)
+        if not tender_hash:
+            return key
+        return hashlib.sha256(f"{key}:{tender_hash}".encode('utf-8')).hexdigest()
 
 
 def get_openai_service() -> OpenAIService:
@@ -348,6 +767,12 @@ def get_openai_service() -> OpenAIService:
     api_key = st.session_state.get('api_key', '')
     base_url = st.session_state.get('base_url', '')
     model_name = st.session_state.get('model_name', 'gpt-3.5-turbo')
+    use_cache = not st.session_state.get('bypass_cache', False)
+    http_settings = get_http_settings()
+    rate_limits = get_rate_limit_settings()
+    max_retries = int(st.session_state.get('max_retries', DEFAULT_MAX_RETRIES))
+    analysis_settings = get_analysis_settings()
+    model_routes = get_model_routes()
     
     if not api_key:
         raise ValueError("请先配置OpenAI API密钥")
@@ -357,16 +782,60 @@ def get_openai_service() -> OpenAIService:
     if (cached_service and 
         cached_service.api_key == api_key and 
         cached_service.base_url == base_url and 
-        cached_service.model_name == model_name):
+        cached_service.model_name == model_name and
+        cached_service.http_settings == http_settings):
+        cached_service.use_cache = use_cache
+        cached_service.rate_limits = rate_limits
+        cached_service.retry_policy = RetryPolicy(max_retries=max_retries)
+        cached_service.analysis_settings = analysis_settings
+        cached_service.router = ModelRouter(model_name, model_routes)
         return cached_service
     
-    # 创建新的服务实例并缓存
-    new_service = OpenAIService(api_key, base_url, model_name)
+    # 创建新的服务实例并缓存（底层客户端由client_registry共享）
+    new_service = OpenAIService(api_key, base_url, model_name, use_cache=use_cache, http_settings=http_settings,
+                                rate_limits=rate_limits, max_retries=max_retries, analysis_settings=analysis_settings,
+                                model_routes=model_routes)
     st.session_state.openai_service_instance = new_service
     
     return new_service
 
+def get_rate_limit_settings() -> dict:
+    """
+    从session state读取当前的限流预算
+    
+    Returns:
+        {'rpm_limit': 每分钟请求数, 'tpm_limit': 每分钟token数}，0表示不限
+    """
+    return {
+        'rpm_limit': int(st.session_state.get('rpm_limit', DEFAULT_RPM_LIMIT)),
+        'tpm_limit': int(st.session_state.get('tpm_limit', DEFAULT_TPM_LIMIT)),
+    }
+
+def get_analysis_settings() -> dict:
+    """
+    从session state读取当前的文档分析设置
+    
+    Returns:
+        {'chunk_size': 每块最大字符数（0表示不分块）, 'parallelism': 并行解析的块数, 'mode': 分析模式}
+    """
+    return {
+        'chunk_size': int(st.session_state.get('analysis_chunk_size', DEFAULT_CHUNK_SIZE)),
+        'parallelism': int(st.session_state.get('analysis_parallelism', DEFAULT_PARALLELISM)),
+        'mode': st.session_state.get('analysis_mode', DEFAULT_ANALYSIS_MODE),
+    }
+
+def get_model_routes() -> dict:
+    """
+    从session state读取当前的模型路由规则
+    
+    Returns:
+        路由规则字典，键见DEFAULT_MODEL_ROUTES
+    """
+    return dict(DEFAULT_MODEL_ROUTES, **st.session_state.get('model_routes', {}))
+
 def clear_openai_service_cache():
     """清除OpenAI服务缓存"""
     if 'openai_service_instance' in st.session_state:
-        del st.session_state.openai_service_instance 
\ No newline at end of file
+        del st.session_state.openai_service_instance
+    if 'async_openai_service_instance' in st.session_state:
+        del st.session_state.async_openai_service_instance
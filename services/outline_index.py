@@ -0,0 +1,167 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from services.context_compression import build_chapter_context
+
+# 缓存的目录索引数（不同会话、不同版本的目录各一份）
+INDEX_CACHE_SIZE = 16
+
+
+class OutlineIndex:
+    """
+    目录的一次性索引
+
+    遍历目录一次，得到按顺序排列的全部章节（nodes）、叶子章节（leaves）、每个章节的上级章节链
+    和所在的同级章节组。上级章节列表和提示词上下文按同级章节组生成并共用，生成提示词时
+    只需拼接；内容显示、导出和章节生成都使用同一份索引，不再各自递归遍历目录。
+
+    节点（nodes中的元素）字段：
+        chapter: 原始章节数据
+        id / title / description: 章节ID、标题和描述
+        path: 章节路径（"{id} {title}"），也是生成内容的键
+        level: 层级，从1开始
+        parent: 上级章节在nodes中的下标，顶级章节为None
+        group: 所在同级章节组的下标
+        is_leaf: 是否为叶子章节
+    """
+
+    def __init__(self, outline_data: Optional[Dict]):
+        """
+        Args:
+            outline_data: 目录数据，包含outline键
+        """
+        # 保留目录数据的引用，索引引用的章节数据与之共用
+        self.outline_data = outline_data
+        self.nodes: List[Dict] = []
+        self.leaves: List[int] = []
+        self._by_path: Dict[str, Dict] = {}
+        self._groups: List[Dict] = []
+
+        if isinstance(outline_data, dict) and 'outline' in outline_data:
+            self._add_group(outline_data['outline'] or [], None, [], 1)
+
+        # 上下文在建索引时一并生成，之后目录数据被修改也不会混入索引
+        self._leaf_nodes_info: List[Tuple[str, dict]] = []
+        for leaf in self.leaves:
+            node = self.nodes[leaf]
+            group = self._groups[node['group']]
+            self._leaf_nodes_info.append((node['path'], {
+                'chapter': node['chapter'],
+                'parent_chapters': group['parent_chapters'],
+                'sibling_chapters': group['siblings'],
+                'level': node['level'],
+                'path': node['path'],
+                'context': self._context_for(node),
+            }))
+
+    def _add_group(self, chapters: List[dict], parent: Optional[int], parent_chapters: List[dict], level: int) -> None:
+        """按先序加入一组同级章节及其子章节"""
+        group_index = len(self._groups)
+        self._groups.append({
+            'siblings': chapters,
+            'parent_chapters': parent_chapters,
+            'ids': frozenset(chapter.get('id') for chapter in chapters),
+            'context': {},
+        })
+        for chapter in chapters:
+            chapter_id = chapter.get('id', '')
+            chapter_title = chapter.get('title', '未命名章节')
+            children = chapter.get('children') or []
+            node = {
+                'chapter': chapter,
+                'id': chapter_id,
+                'title': chapter_title,
+                'description': chapter.get('description', ''),
+                'path': f"{chapter.get('id', 'unknown')} {chapter_title}",
+                'level': level,
+                'parent': parent,
+                'group': group_index,
+                'is_leaf': not children,
+            }
+            node_index = len(self.nodes)
+            self.nodes.append(node)
+            self._by_path.setdefault(node['path'], node)
+            if children:
+                # 子章节共用同一个上级章节列表
+                child_parents = parent_chapters + [{
+                    'id': chapter.get('id'),
+                    'title': chapter.get('title'),
+                    'description': chapter.get('description', '')
+                }]
+                self._add_group(children, node_index, child_parents, level + 1)
+            else:
+                self.leaves.append(node_index)
+
+    def get(self, node_path: str) -> Optional[Dict]:
+        """按章节路径查找节点，路径重复时返回第一个"""
+        return self._by_path.get(node_path)
+
+    def _context_for(self, node: Dict) -> str:
+        """章节提示词中的上下文文本，与build_chapter_context的结果相同，同一组同级章节只生成一次"""
+        group = self._groups[node['group']]
+        chapter_id = node['chapter'].get('id', 'unknown')
+        # 上下文只在同级章节中是否有其他章节这一点上与当前章节有关
+        with_siblings = bool(group['ids'] - {chapter_id})
+        context = group['context'].get(with_siblings)
+        if context is None:
+            context = build_chapter_context(chapter_id, group['parent_chapters'], group['siblings'])
+            group['context'][with_siblings] = context
+        return context
+
+    def leaf_nodes_info(self) -> List[Tuple[str, dict]]:
+        """
+        章节生成使用的叶子章节列表
+
+        Returns:
+            (章节路径, 节点信息) 列表，节点信息包含chapter/parent_chapters/sibling_chapters/level/path，
+            以及预先生成的提示词上下文context；返回的列表不要修改，需要筛选时生成新列表
+        """
+        return self._leaf_nodes_info
+
+
+def outline_hash(outline_data: Optional[Dict]) -> str:
+    """
+    目录内容的哈希，与对象无关
+
+    Args:
+        outline_data: 目录数据
+
+    Returns:
+        十六进制哈希
+    """
+    return hashlib.sha256(json.dumps(outline_data, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+_cache: 'OrderedDict[Tuple[int, str], OutlineIndex]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_outline_index(outline_data: Optional[Dict]) -> OutlineIndex:
+    """
+    获取目录的索引，按目录内容缓存
+
+    目录编辑页会直接修改目录数据，因此除了对象还要按内容判断目录是否变化，
+    同一份目录在页面重新运行时不会重复建索引。
+
+    Args:
+        outline_data: 目录数据
+
+    Returns:
+        OutlineIndex实例
+    """
+    fingerprint = (id(outline_data), outline_hash(outline_data))
+    with _cache_lock:
+        index = _cache.get(fingerprint)
+        if index is not None:
+            _cache.move_to_end(fingerprint)
+            return index
+
+    index = OutlineIndex(outline_data)
+    with _cache_lock:
+        _cache[fingerprint] = index
+        _cache.move_to_end(fingerprint)
+        while len(_cache) > INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
@@ -0,0 +1,174 @@
+import asyncio
+import re
+import time
+import threading
+from typing import Dict, Tuple
+
+# 未配置预算时为0，表示不限制
+DEFAULT_RPM_LIMIT = 0
+DEFAULT_TPM_LIMIT = 0
+
+# 预估一次请求输出的token数（请求结束后按实际输出长度修正）
+DEFAULT_COMPLETION_TOKENS = 1500
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    粗略估算文本的token数：中日韩字符按1个token计，其余字符按4个字符1个token计
+
+    Args:
+        text: 文本内容
+
+    Returns:
+        估算的token数
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def estimate_prompt_tokens(messages: list) -> int:
+    """估算消息列表的输入token数（每条消息额外计4个token的格式开销）"""
+    return sum(estimate_text_tokens(m.get('content') or '') + 4 for m in messages)
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟预算，按预算匀速补充，允许预约导致的负余额"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        self.tokens = min(self.per_minute, self.tokens + elapsed * self.per_minute / 60.0)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        预约指定数量的令牌
+
+        Args:
+            amount: 需要的令牌数（超过容量时按容量计，避免永远等待）
+            now: 当前时间（time.monotonic）
+
+        Returns:
+            需要等待的秒数
+        """
+        self._refill(now)
+        amount = min(amount, self.per_minute)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens * 60.0 / self.per_minute
+
+    def refund(self, amount: float) -> None:
+        """归还（或在amount为负时追加扣除）令牌"""
+        self.tokens = min(self.per_minute, self.tokens + amount)
+
+
+class EndpointRateLimiter:
+    """单个 (base_url, model) 的限流器，同时按每分钟请求数(RPM)和每分钟token数(TPM)计量"""
+
+    def __init__(self, rpm_limit: int = DEFAULT_RPM_LIMIT, tpm_limit: int = DEFAULT_TPM_LIMIT):
+        self._lock = threading.Lock()
+        self.rpm_limit = 0
+        self.tpm_limit = 0
+        self._request_bucket = None
+        self._token_bucket = None
+        self.configure(rpm_limit, tpm_limit)
+
+    def configure(self, rpm_limit: int, tpm_limit: int) -> None:
+        """
+        更新预算，预算未变化时保留当前桶状态
+
+        Args:
+            rpm_limit: 每分钟请求数上限，0表示不限
+            tpm_limit: 每分钟token数上限，0表示不限
+        """
+        with self._lock:
+            if rpm_limit != self.rpm_limit:
+                self.rpm_limit = rpm_limit
+                self._request_bucket = TokenBucket(rpm_limit) if rpm_limit > 0 else None
+            if tpm_limit != self.tpm_limit:
+                self.tpm_limit = tpm_limit
+                self._token_bucket = TokenBucket(tpm_limit) if tpm_limit > 0 else None
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            delay = 0.0
+            if self._request_bucket is not None:
+                delay = max(delay, self._request_bucket.reserve(1, now))
+            if self._token_bucket is not None and estimated_tokens > 0:
+                delay = max(delay, self._token_bucket.reserve(estimated_tokens, now))
+            return delay
+
+    def acquire(self, estimated_tokens: int = 0) -> float:
+        """
+        同步等待直到预算允许发出请求
+
+        Args:
+            estimated_tokens: 本次请求预估消耗的token数
+
+        Returns:
+            实际等待的秒数
+        """
+        delay = self._reserve(estimated_tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def aacquire(self, estimated_tokens: int = 0) -> float:
+        """异步版本的acquire，在事件循环中等待而不阻塞其他请求"""
+        delay = self._reserve(estimated_tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        请求结束后按实际消耗修正TPM余额
+
+        Args:
+            estimated_tokens: 预约时的预估token数
+            actual_tokens: 实际消耗的token数
+        """
+        with self._lock:
+            if self._token_bucket is not None:
+                self._token_bucket.refund(estimated_tokens - actual_tokens)
+
+
+_rate_limiters: Dict[Tuple[str, str], EndpointRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(base_url: str, model_name: str, rpm_limit: int = DEFAULT_RPM_LIMIT,
+                     tpm_limit: int = DEFAULT_TPM_LIMIT, api_key: str = '') -> EndpointRateLimiter:
+    """
+    获取进程级限流器，按 (base_url, model_name, api_key) 区分
+
+    同时进行的多个标书任务共用同一个限流器，从而在发出请求前就平滑流量。
+
+    Args:
+        base_url: 基础URL
+        model_name: 模型名称
+        rpm_limit: 每分钟请求数上限，0表示不限
+        tpm_limit: 每分钟token数上限，0表示不限
+        api_key: API密钥，服务商的配额按密钥计算
+
+    Returns:
+        EndpointRateLimiter实例
+    """
+    key = (base_url or '', model_name, api_key or '')
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = EndpointRateLimiter(rpm_limit, tpm_limit)
+            _rate_limiters[key] = limiter
+    limiter.configure(rpm_limit, tpm_limit)
+    return limiter
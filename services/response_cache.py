@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Generator, Optional
+
+# 缓存文件路径 - 与用户配置一样存储到用户家目录中
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".ai_write_helper")
+CACHE_FILE = os.path.join(CACHE_DIR, "response_cache.sqlite3")
+
+# 缓存总大小上限（字节），超过后按最近访问时间淘汰
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+# 命中缓存时回放的分片大小（字符数）
+REPLAY_CHUNK_SIZE = 64
+
+
+class ResponseCache:
+    """基于SQLite的LLM响应缓存，按内容寻址，按大小做LRU淘汰"""
+
+    def __init__(self, path: str = CACHE_FILE, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        初始化响应缓存
+
+        Args:
+            path: SQLite文件路径
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    content TEXT,
+                    size INTEGER,
+                    created_at REAL,
+                    last_access REAL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+
+    @contextmanager
+    def _connect(self):
+        """打开连接并在退出时提交、关闭"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(model: str, messages: list, temperature: float, response_format: dict = None) -> str:
+        """
+        计算缓存键：模型名、规范化消息的哈希、温度和返回格式
+
+        Args:
+            model: 模型名称
+            messages: 消息列表
+            temperature: 温度参数
+            response_format: 返回格式
+
+        Returns:
+            十六进制缓存键
+        """
+        normalized_messages = [
+            {"role": m.get("role", ""), "content": (m.get("content") or "").strip()}
+            for m in messages
+        ]
+        messages_hash = hashlib.sha256(
+            json.dumps(normalized_messages, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        key_material = json.dumps(
+            {
+                "model": model,
+                "messages": messages_hash,
+                "temperature": round(float(temperature), 4),
+                "response_format": response_format,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存内容，命中时刷新最近访问时间"""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, content: str, model: str = "") -> None:
+        """写入缓存内容，并在超过大小上限时淘汰最久未访问的条目"""
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, size, now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        expired_keys = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            if total <= self.max_bytes:
+                break
+            expired_keys.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", expired_keys)
+
+    def clear(self) -> None:
+        """清空所有缓存"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict:
+        """
+        获取缓存统计信息
+
+        Returns:
+            包含条目数和总字节数的字典
+        """
+        with self._lock, self._connect() as conn:
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"entries": count, "bytes": total}
+
+
+def iter_cached_chunks(content: str, chunk_size: int = REPLAY_CHUNK_SIZE) -> Generator[str, None, None]:
+    """
+    将缓存内容切分为小片段回放，保持与真实流式输出一致的调用方式
+
+    Args:
+        content: 缓存的完整内容
+        chunk_size: 每个片段的字符数
+
+    Yields:
+        内容片段
+    """
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size]
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """获取进程级响应缓存实例"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+    return _response_cache
@@ -0,0 +1,171 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import httpx
+import openai
+
+# 单次调用默认的重试次数（不含首次请求）
+DEFAULT_MAX_RETRIES = 3
+
+# 指数退避的基础间隔与单次等待上限（秒）
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+# 单次调用累计等待时间上限（秒），超过后不再重试
+MAX_TOTAL_DELAY = 180.0
+
+# 这些状态码视为可重试的临时错误
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# 流在中途断开时，用于续写的提示
+RESUME_PROMPT = "上一次输出在中途被截断。请紧接着上文最后一个字继续输出剩余内容，不要重复已经输出的内容，也不要添加任何说明。"
+
+
+class LLMServiceError(Exception):
+    """LLM调用失败的统一异常，区分临时错误（可重试）和永久错误"""
+
+    def __init__(self, message: str, transient: bool = False, status_code: Optional[int] = None,
+                 retry_after: Optional[float] = None, partial_content: str = "", attempts: int = 1):
+        """
+        初始化异常
+
+        Args:
+            message: 错误信息
+            transient: 是否为可重试的临时错误
+            status_code: HTTP状态码（如有）
+            retry_after: 服务端要求的等待时间（秒，如有）
+            partial_content: 失败前已经输出的内容
+            attempts: 已尝试的次数
+        """
+        super().__init__(message)
+        self.transient = transient
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.partial_content = partial_content
+        self.attempts = attempts
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """
+    从响应头中解析服务端要求的等待时间
+
+    支持 retry-after-ms、retry-after（秒数或HTTP日期）两种格式。
+
+    Args:
+        error: 请求抛出的异常
+
+    Returns:
+        等待秒数，无法解析时返回None
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000.0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: Exception, partial_content: str = "", attempts: int = 1) -> LLMServiceError:
+    """
+    将底层异常转换为LLMServiceError，并判断是否可重试
+
+    Args:
+        error: 请求抛出的异常
+        partial_content: 失败前已经输出的内容
+        attempts: 已尝试的次数
+
+    Returns:
+        LLMServiceError实例
+    """
+    if isinstance(error, LLMServiceError):
+        return error
+
+    status_code = getattr(error, 'status_code', None)
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, httpx.TransportError)):
+        transient = True
+    elif status_code is not None:
+        # 额度用尽同样返回429，但重试没有意义
+        transient = status_code in TRANSIENT_STATUS_CODES and getattr(error, 'code', None) != 'insufficient_quota'
+    else:
+        transient = False
+
+    return LLMServiceError(
+        str(error),
+        transient=transient,
+        status_code=status_code,
+        retry_after=parse_retry_after(error),
+        partial_content=partial_content,
+        attempts=attempts
+    )
+
+
+class RetryPolicy:
+    """重试策略：指数退避 + 全抖动，优先遵循服务端的Retry-After，并限制单次调用的重试预算"""
+
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = BASE_DELAY,
+                 max_delay: float = MAX_DELAY, max_total_delay: float = MAX_TOTAL_DELAY):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_total_delay = max_total_delay
+
+    def next_delay(self, error: LLMServiceError, retries_done: int, total_delay: float) -> Optional[float]:
+        """
+        计算下一次重试前的等待时间
+
+        Args:
+            error: 本次失败的异常
+            retries_done: 已经重试的次数
+            total_delay: 已经累计等待的秒数
+
+        Returns:
+            等待秒数；不应再重试时返回None
+        """
+        if not error.transient or retries_done >= self.max_retries:
+            return None
+
+        if error.retry_after is not None:
+            delay = min(error.retry_after, self.max_delay)
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retries_done)))
+
+        if total_delay + delay > self.max_total_delay:
+            return None
+        return delay
+
+
+def build_resume_messages(messages: list, partial_content: str) -> list:
+    """
+    构建断点续写的消息列表：把已输出的部分作为assistant消息，再要求模型接着写
+
+    Args:
+        messages: 原始消息列表
+        partial_content: 已经输出的内容
+
+    Returns:
+        新的消息列表；没有已输出内容时原样返回
+    """
+    if not partial_content:
+        return messages
+    return messages + [
+        {"role": "assistant", "content": partial_content},
+        {"role": "user", "content": RESUME_PROMPT}
+    ]
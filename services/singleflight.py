@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from services.response_cache import ResponseCache
+from services.cancellation import CancellationToken
+
+
+def make_flight_key(base_url: str, model: str, messages: list, temperature: float,
+                    response_format: dict = None) -> str:
+    """
+    计算在途请求的键：在响应缓存键（模型、规范化消息、温度、返回格式）的基础上区分网关
+
+    Returns:
+        十六进制键
+    """
+    cache_key = ResponseCache.make_key(model, messages, temperature, response_format)
+    return hashlib.sha256(f"{base_url or ''}|{cache_key}".encode("utf-8")).hexdigest()
+
+
+class InflightStream:
+    """
+    一次正在进行的流式请求的输出
+
+    发起请求的一方（领头方）逐段写入；跟随方从第一段开始读取，已输出的片段立即得到，
+    之后的片段在写入时收到。领头方成功结束后succeeded为True。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chunks: List[str] = []
+        self._done = False
+        self._waiters: List[Callable[[], None]] = []
+        self.succeeded = False
+
+    def publish(self, chunk: str) -> None:
+        with self._lock:
+            self._chunks.append(chunk)
+            waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            waiter()
+
+    def finish(self, succeeded: bool) -> None:
+        with self._lock:
+            self._done = True
+            self.succeeded = succeeded
+            waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            waiter()
+
+    def _poll(self, index: int, waiter: Callable[[], None]) -> Tuple[List[str], bool]:
+        """取出index之后的片段；没有新片段且未结束时注册waiter，在下次写入或结束时调用"""
+        with self._lock:
+            chunks = self._chunks[index:]
+            if not chunks and not self._done:
+                self._waiters.append(waiter)
+            return chunks, self._done
+
+    def follow(self, cancel_token: Optional[CancellationToken] = None) -> Iterator[str]:
+        """
+        在当前线程中读取输出，直到领头方结束
+
+        Args:
+            cancel_token: 取消信号（可选），取消时抛出GenerationCancelled
+        """
+        index = 0
+        while True:
+            event = threading.Event()
+            chunks, done = self._poll(index, event.set)
+            if chunks:
+                index += len(chunks)
+                yield from chunks
+                continue
+            if done:
+                return
+            remove_callback = cancel_token.add_callback(event.set) if cancel_token is not None else None
+            try:
+                event.wait()
+            finally:
+                if remove_callback is not None:
+                    remove_callback()
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+
+    async def afollow(self) -> AsyncIterator[str]:
+        """在事件循环中读取输出，直到领头方结束；领头方可以在任意线程中写入"""
+        loop = asyncio.get_running_loop()
+        index = 0
+        while True:
+            event = asyncio.Event()
+            chunks, done = self._poll(index, lambda: loop.call_soon_threadsafe(event.set))
+            if chunks:
+                index += len(chunks)
+                for chunk in chunks:
+                    yield chunk
+                continue
+            if done:
+                return
+            await event.wait()
+
+
+class InflightTable:
+    """
+    进程级的在途请求表（singleflight）
+
+    多个会话或重复点击同时发出相同的请求时，只有第一个真正请求接口，其余的跟随它的输出。
+    领头方失败或被取消时，跟随方接着已收到的内容自己请求（断点续写），不会因为别人停止而失败。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, InflightStream] = {}
+
+    def _join(self, key: str) -> Tuple[InflightStream, bool]:
+        """加入或创建在途请求，返回 (请求, 是否为领头方)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = InflightStream()
+            self._flights[key] = flight
+            return flight, True
+
+    def _finish(self, key: str, flight: InflightStream, succeeded: bool) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(succeeded)
+
+    def stream(self, key: str, start: Callable[[List[str]], Iterator[str]],
+               cancel_token: Optional[CancellationToken] = None,
+               on_shared: Optional[Callable[[], None]] = None) -> Iterator[str]:
+        """
+        同步流式请求的去重
+
+        Args:
+            key: 请求的键，见make_flight_key
+            start: 真正发起请求的函数，参数为已经输出给调用方的片段（续写时使用），返回片段迭代器
+            cancel_token: 取消信号（可选）
+            on_shared: 完全由其他请求的输出满足时的回调（用于记录调用）
+
+        Yields:
+            流式返回的文本片段
+        """
+        flight, leader = self._join(key)
+        received = []
+        if not leader:
+            for chunk in flight.follow(cancel_token):
+                received.append(chunk)
+                yield chunk
+            if flight.succeeded:
+                if on_shared is not None:
+                    on_shared()
+                return
+            # 领头的请求失败或被取消：接着已收到的内容自己请求
+            flight = None
+
+        succeeded = False
+        try:
+            for chunk in start(received):
+                if flight is not None:
+                    flight.publish(chunk)
+                yield chunk
+            succeeded = True
+        finally:
+            if flight is not None:
+                self._finish(key, flight, succeeded)
+
+    async def astream(self, key: str, start: Callable[[List[str]], AsyncIterator[str]],
+                      on_shared: Optional[Callable[[], None]] = None, progress=None) -> AsyncIterator[str]:
+        """
+        异步流式请求的去重，参数见stream
+
+        Args:
+            progress: 跟随时用于报告进度的StreamProgress（可选），避免被误判为卡住而触发对冲
+        """
+        flight, leader = self._join(key)
+        received = []
+        if not leader:
+            if progress is not None:
+                progress.mark_sent(None)
+            async for chunk in flight.afollow():
+                if progress is not None:
+                    progress.mark_token()
+                received.append(chunk)
+                yield chunk
+            if flight.succeeded:
+                if on_shared is not None:
+                    on_shared()
+                return
+            flight = None
+
+        succeeded = False
+        try:
+            async for chunk in start(received):
+                if flight is not None:
+                    flight.publish(chunk)
+                yield chunk
+            succeeded = True
+        finally:
+            if flight is not None:
+                self._finish(key, flight, succeeded)
+
+
+_table: Optional[InflightTable] = None
+_table_lock = threading.Lock()
+
+
+def get_inflight_table() -> InflightTable:
+    """
+    获取进程级在途请求表，所有会话共用
+
+    Returns:
+        InflightTable实例
+    """
+    global _table
+    with _table_lock:
+        if _table is None:
+            _table = InflightTable()
+    return _table
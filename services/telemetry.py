@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+from services.rate_limiter import estimate_text_tokens
+from services.usage_tracker import parse_usage
+
+logger = logging.getLogger(__name__)
+
+# 每次LLM调用的明细按JSONL追加到本地文件，超过大小后轮转
+TELEMETRY_DIR = os.path.join(os.path.expanduser("~"), ".ai_write_helper", "telemetry")
+TELEMETRY_FILE = os.path.join(TELEMETRY_DIR, "llm_calls.jsonl")
+TELEMETRY_MAX_BYTES = 10 * 1024 * 1024
+TELEMETRY_BACKUP_COUNT = 5
+
+# 内存中保留最近的调用记录，供页面展示
+TELEMETRY_BUFFER_SIZE = 2000
+
+
+class CallMetrics:
+    """单次LLM调用（含重试）的计时与用量，由流式请求方法在各阶段更新"""
+
+    def __init__(self, task: Optional[str], chapter_id: Optional[str], model: str, base_url: str):
+        """
+        开始计时
+
+        Args:
+            task: 任务类型，见services.model_router
+            chapter_id: 章节编号（仅章节正文）
+            model: 模型名称
+            base_url: 基础URL
+        """
+        self.task = task
+        self.chapter_id = chapter_id
+        self.model = model
+        self.base_url = base_url or ''
+        self.endpoint: Optional[str] = None
+        self.started_at = time.monotonic()
+        self.queue_wait = 0.0
+        self.attempts = 0
+        self.ttft: Optional[float] = None
+        self._sent_at: Optional[float] = None
+        self._first_token_at: Optional[float] = None
+        self._estimated_completion_tokens = 0
+        self._usage_reported = False
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def queued(self, seconds: float) -> None:
+        """累计在限流器、端点池和并发控制器前排队的时间"""
+        self.queue_wait += seconds
+
+    def sent(self, endpoint: Optional[str] = None, model: Optional[str] = None) -> None:
+        """发出一次请求（重试时再次调用），记录实际使用的端点和模型"""
+        self.attempts += 1
+        self._sent_at = time.monotonic()
+        if endpoint is not None:
+            self.endpoint = endpoint
+        if model is not None:
+            self.model = model
+
+    def token(self, text: str) -> None:
+        """收到一个输出片段"""
+        if self._first_token_at is None:
+            self._first_token_at = time.monotonic()
+            self.ttft = self._first_token_at - (self._sent_at or self.started_at)
+        self._estimated_completion_tokens += estimate_text_tokens(text)
+
+    def add_usage(self, usage) -> None:
+        """累加一次请求的usage（重试时各次请求都计入）"""
+        counts = parse_usage(usage)
+        self._usage_reported = True
+        self.prompt_tokens += counts['prompt_tokens']
+        self.cached_tokens += counts['cached_tokens']
+        self.completion_tokens += counts['completion_tokens']
+
+    def finish(self, status: str, error: Optional[Exception] = None) -> Dict:
+        """
+        结束计时，生成调用记录
+
+        Args:
+            status: ok（成功）、cache_hit（命中本地缓存）、shared（跟随相同的在途请求）、
+                    error（失败）或 cancelled（被取消）
+            error: 失败时的异常
+
+        Returns:
+            可直接序列化为JSON的记录
+        """
+        now = time.monotonic()
+        completion_tokens = self.completion_tokens
+        if not self._usage_reported:
+            # 接口没有返回usage时按输出内容估算
+            completion_tokens = self._estimated_completion_tokens
+        generation_time = now - self._first_token_at if self._first_token_at is not None else 0.0
+        return {
+            'timestamp': time.time(),
+            'task': self.task,
+            'chapter_id': self.chapter_id,
+            'model': self.model,
+            'base_url': self.base_url,
+            'endpoint': self.endpoint,
+            'status': status,
+            'attempts': self.attempts,
+            'queue_wait': round(self.queue_wait, 3),
+            'ttft': round(self.ttft, 3) if self.ttft is not None else None,
+            'latency': round(now - self.started_at, 3),
+            'output_tokens_per_sec': round(completion_tokens / generation_time, 1) if generation_time > 0 else None,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+            'completion_tokens': completion_tokens,
+            'usage_reported': self._usage_reported,
+            'error': str(error) if error is not None else None,
+        }
+
+
+class TelemetryRecorder:
+    """LLM调用记录：写入轮转的JSONL文件，同时在内存中保留最近的记录"""
+
+    def __init__(self, path: str = TELEMETRY_FILE, buffer_size: int = TELEMETRY_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self._buffer = deque(maxlen=buffer_size)
+        self._logger = logging.getLogger("ai_write_helper.telemetry")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        # 只看文件handler：日志采集工具可能给不向上传递的logger挂上自己的handler
+        if not any(isinstance(handler, RotatingFileHandler) for handler in self._logger.handlers):
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                handler = RotatingFileHandler(path, maxBytes=TELEMETRY_MAX_BYTES,
+                                              backupCount=TELEMETRY_BACKUP_COUNT, encoding='utf-8')
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._logger.addHandler(handler)
+            except OSError as e:
+                # 无法写文件时只保留内存记录
+                logger.warning("无法创建调用记录文件: %s", e)
+
+    def record(self, record: Dict) -> None:
+        """保存一条调用记录"""
+        with self._lock:
+            self._buffer.append(record)
+        self._logger.info(json.dumps(record, ensure_ascii=False))
+
+    def recent(self, since: float = 0.0) -> List[Dict]:
+        """
+        获取内存中的调用记录
+
+        Args:
+            since: 只返回该时间戳（time.time()）之后的记录
+
+        Returns:
+            记录列表，按时间先后排列
+        """
+        with self._lock:
+            return [record for record in self._buffer if record['timestamp'] >= since]
+
+
+def summarize(records: List[Dict]) -> List[Dict]:
+    """
+    按任务类型和模型汇总调用记录，用于定位耗时花在哪里
+
+    Args:
+        records: 调用记录列表
+
+    Returns:
+        每个 (任务类型, 模型) 一行的汇总
+    """
+    groups: Dict[tuple, List[Dict]] = {}
+    for record in records:
+        groups.setdefault((record.get('task') or '-', record['model']), []).append(record)
+
+    rows = []
+    for (task, model), items in groups.items():
+        requested = [r for r in items if r['status'] not in ('cache_hit', 'shared')]
+        ttfts = sorted(r['ttft'] for r in requested if r['ttft'] is not None)
+        speeds = [r['output_tokens_per_sec'] for r in requested if r['output_tokens_per_sec']]
+        rows.append({
+            '任务': task,
+            '模型': model,
+            '调用数': len(items),
+            '缓存命中': sum(1 for r in items if r['status'] == 'cache_hit'),
+            '共享请求': sum(1 for r in items if r['status'] == 'shared'),
+            '失败': sum(1 for r in items if r['status'] == 'error'),
+            '排队(s)': round(sum(r['queue_wait'] for r in requested), 1),
+            '首字中位数(s)': ttfts[len(ttfts) // 2] if ttfts else None,
+            '总耗时(s)': round(sum(r['latency'] for r in requested), 1),
+            '输出速度(token/s)': round(sum(speeds) / len(speeds), 1) if speeds else None,
+            '输入token': sum(r['prompt_tokens'] for r in items),
+            '缓存token': sum(r['cached_tokens'] for r in items),
+            '输出token': sum(r['completion_tokens'] for r in items),
+        })
+    return rows
+
+
+_recorder: Optional[TelemetryRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_telemetry() -> TelemetryRecorder:
+    """
+    获取进程级调用记录器，所有会话共用
+
+    Returns:
+        TelemetryRecorder实例
+    """
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = TelemetryRecorder()
+    return _recorder
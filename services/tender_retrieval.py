@@ -0,0 +1,174 @@
+import hashlib
+import heapq
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+from services.document_chunker import split_passages
+
+# 检索段落的最大字符数，按分页和标题边界切分
+PASSAGE_CHARS = 400
+
+# 每个章节注入的参考段落数，提示词增加的长度不超过 REFERENCE_TOP_K * PASSAGE_CHARS
+REFERENCE_TOP_K = 3
+
+# BM25参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# 缓存的文档索引数（按文档内容哈希）
+INDEX_CACHE_SIZE = 4
+
+# 连续的汉字按字二元组切分，英文单词和数字（含1.2.3这类编号）整体作为一个词
+_TOKEN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+|[a-z0-9]+(?:\.[0-9]+)*')
+_CJK = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：汉字使用字二元组（单个汉字保留为一元），不依赖分词词典
+
+    Args:
+        text: 文本
+
+    Returns:
+        词列表
+    """
+    tokens = []
+    for run in _TOKEN.findall((text or '').lower()):
+        if _CJK.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class TenderIndex:
+    """
+    招标文件全文的BM25检索索引
+
+    全文按页和标题边界切成不超过PASSAGE_CHARS的段落（见split_passages），按章节标题和描述检索相关段落，
+    作为章节生成时的原文依据。检索结果按查询缓存，页面重新运行时计算输入哈希不会重复检索。
+    """
+
+    def __init__(self, text: str, passage_chars: int = PASSAGE_CHARS):
+        """
+        Args:
+            text: 招标文件全文
+            passage_chars: 段落的最大字符数
+        """
+        self.passages = split_passages(text, passage_chars)
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        for passage_index, passage in enumerate(self.passages):
+            counts = Counter(tokenize(passage))
+            self._lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self._postings.setdefault(term, []).append((passage_index, count))
+
+        total = len(self.passages)
+        self._average_length = sum(self._lengths) / total if total else 0.0
+        self._idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+        self._lock = threading.Lock()
+        self._results: Dict[Tuple[str, int], List[Tuple[int, float]]] = {}
+
+    def search(self, query: str, top_k: int = REFERENCE_TOP_K) -> List[Tuple[int, float]]:
+        """
+        检索与查询最相关的段落
+
+        Args:
+            query: 查询文本
+            top_k: 返回的段落数
+
+        Returns:
+            (段落下标, 得分) 列表，按得分从高到低；没有共同词的段落不返回
+        """
+        cache_key = (query, top_k)
+        with self._lock:
+            cached = self._results.get(cache_key)
+        if cached is not None:
+            return cached
+
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for passage_index, count in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[passage_index] / self._average_length)
+                scores[passage_index] = scores.get(passage_index, 0.0) + idf * count * (BM25_K1 + 1) / (count + norm)
+        results = heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+
+        with self._lock:
+            self._results[cache_key] = results
+        return results
+
+    def references_for(self, chapter: dict, top_k: int = REFERENCE_TOP_K) -> List[str]:
+        """
+        按章节标题和描述检索参考段落，按在原文中的顺序返回
+
+        Args:
+            chapter: 章节数据
+            top_k: 段落数
+
+        Returns:
+            段落文本列表
+        """
+        query = f"{chapter.get('title', '')} {chapter.get('description', '')}"
+        passage_indexes = sorted(passage_index for passage_index, _ in self.search(query, top_k))
+        return [self.passages[passage_index] for passage_index in passage_indexes]
+
+
+def document_hash(text: str) -> str:
+    """
+    招标文件内容的哈希，也是索引缓存的键
+
+    Args:
+        text: 招标文件全文
+
+    Returns:
+        十六进制哈希，没有文档内容时返回空字符串
+    """
+    if not text or not text.strip():
+        return ''
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+_cache: 'OrderedDict[str, TenderIndex]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_tender_index(text: str) -> Optional[TenderIndex]:
+    """
+    获取招标文件的检索索引，按文档内容哈希缓存，同一份文档只建一次索引
+
+    Args:
+        text: 招标文件全文
+
+    Returns:
+        TenderIndex实例，没有文档内容时返回None
+    """
+    key = document_hash(text)
+    if not key:
+        return None
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None:
+            _cache.move_to_end(key)
+            return index
+
+    index = TenderIndex(text)
+    with _cache_lock:
+        _cache[key] = index
+        _cache.move_to_end(key)
+        while len(_cache) > INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
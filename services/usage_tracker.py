@@ -0,0 +1,120 @@
+import threading
+from typing import Dict, Tuple
+
+
+def parse_usage(usage) -> Dict[str, int]:
+    """
+    从接口返回的usage对象中读取token数
+
+    Args:
+        usage: 流式响应最后一个chunk中的usage对象
+
+    Returns:
+        {'prompt_tokens': ..., 'cached_tokens': ..., 'completion_tokens': ...}
+    """
+    details = getattr(usage, 'prompt_tokens_details', None)
+    # 部分兼容接口（如DeepSeek）使用prompt_cache_hit_tokens字段
+    cached_tokens = getattr(details, 'cached_tokens', None) or getattr(usage, 'prompt_cache_hit_tokens', None) or 0
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+        'cached_tokens': cached_tokens,
+        'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+    }
+
+
+class UsageTracker:
+    """累计接口返回的token用量，用于观察服务端前缀缓存（cached_tokens）的命中率"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, usage) -> None:
+        """
+        记录一次请求的用量
+
+        Args:
+            usage: 流式响应最后一个chunk中的usage对象
+        """
+        counts = parse_usage(usage)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += counts['prompt_tokens']
+            self.cached_tokens += counts['cached_tokens']
+            self.completion_tokens += counts['completion_tokens']
+
+    def snapshot(self) -> Dict:
+        """
+        获取累计用量，供UI展示
+
+        Returns:
+            包含请求数、各类token数和缓存命中率的字典
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'prompt_tokens': self.prompt_tokens,
+                'cached_tokens': self.cached_tokens,
+                'completion_tokens': self.completion_tokens,
+                'cache_hit_rate': self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            }
+
+
+_trackers: Dict[Tuple[str, str], UsageTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_usage_tracker(base_url: str, model_name: str) -> UsageTracker:
+    """
+    获取进程级用量统计，按 (base_url, model_name) 区分
+
+    Args:
+        base_url: 基础URL
+        model_name: 模型名称
+
+    Returns:
+        UsageTracker实例
+    """
+    key = (base_url or '', model_name)
+    with _trackers_lock:
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = UsageTracker()
+            _trackers[key] = tracker
+    return tracker
+
+
+# 不接受stream_options参数的接口（部分兼容代理和自建网关对未知参数返回400），按base_url记录
+_stream_usage_unsupported = set()
+_stream_usage_lock = threading.Lock()
+
+
+def stream_usage_options(base_url: str) -> Dict:
+    """
+    流式请求中用于获取用量的参数
+
+    Args:
+        base_url: 基础URL
+
+    Returns:
+        接口支持时为 {'stream_options': {'include_usage': True}}，已知不支持时为空字典，
+        此时用量按输出长度估算
+    """
+    with _stream_usage_lock:
+        if (base_url or '') in _stream_usage_unsupported:
+            return {}
+    return {'stream_options': {'include_usage': True}}
+
+
+def is_stream_options_rejected(error: Exception) -> bool:
+    """请求是否因参数不被接受而失败（400），此时可以去掉stream_options再试一次"""
+    return getattr(error, 'status_code', None) == 400
+
+
+def mark_stream_usage_unsupported(base_url: str) -> None:
+    """去掉stream_options后请求成功，记住该接口不支持，之后的请求不再携带"""
+    with _stream_usage_lock:
+        _stream_usage_unsupported.add(base_url or '')
@@ -0,0 +1,69 @@
+import os
+import tempfile
+
+# 服务模块在导入时确定本地数据目录（~/.ai_write_helper），测试使用临时目录，不读写本机数据
+os.environ['HOME'] = tempfile.mkdtemp(prefix="ai_write_helper_test_")
+
+import pytest
+import streamlit as st
+from benchmarks.mock_openai_server import MockSettings, start_mock_server
+
+
+class FakeSessionState(dict):
+    """代替st.session_state，支持属性访问，测试之间互不影响"""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError as e:
+            raise AttributeError(key) from e
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def __delattr__(self, key):
+        del self[key]
+
+
+@pytest.fixture
+def session_state(monkeypatch):
+    state = FakeSessionState()
+    monkeypatch.setattr(st, "session_state", state)
+    return state
+
+
+@pytest.fixture
+def mock_server(request):
+    """
+    启动本地模拟接口，返回 (base_url, state)
+
+    行为参数可通过 @pytest.mark.mock_settings(...) 覆盖，默认立即返回少量输出。
+    """
+    options = dict(ttft=0.0, ttft_jitter=0.0, tokens_per_second=0.0, output_tokens=30)
+    marker = request.node.get_closest_marker("mock_settings")
+    if marker is not None:
+        options.update(marker.kwargs)
+    server, base_url = start_mock_server(MockSettings(**options))
+    yield base_url, server.RequestHandlerClass.state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def outline_data():
+    """两个一级章节、五个叶子章节的目录"""
+    return {'outline': [
+        {'id': '1', 'title': '运维方案', 'description': '运维服务的总体方案', 'children': [
+            {'id': '1.1', 'title': '巡检计划', 'description': '日常巡检的频率和内容'},
+            {'id': '1.2', 'title': '电池更换', 'description': '用传蓄电池和传感器电池的更换'},
+            {'id': '1.3', 'title': '故障处理', 'description': '故障分级和响应时间'},
+        ]},
+        {'id': '2', 'title': '人员配置', 'description': '团队构成', 'children': [
+            {'id': '2.1', 'title': '值守人员', 'description': '监控中心7X24小时值守'},
+            {'id': '2.2', 'title': '技术人员', 'description': '硬件和软件技术人员'},
+        ]},
+    ]}
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mock_settings(**kwargs): 覆盖模拟接口的行为参数")
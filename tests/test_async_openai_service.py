@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import pytest
+from services.async_openai_service import AsyncOpenAIService, get_event_loop, run_coroutine
+from services.cancellation import CancellationToken
+from services.outline_index import get_outline_index
+
+
+def _service(base_url="http://async.test/v1"):
+    return AsyncOpenAIService(api_key="test-key", base_url=base_url, model_name="mock-gpt-fast", use_cache=False)
+
+
+def test_event_loop_is_shared_and_runs_in_background_thread():
+    loop = get_event_loop()
+    assert get_event_loop() is loop
+    assert loop.is_running()
+
+    async def where():
+        return asyncio.get_running_loop(), threading.current_thread().name
+
+    assert run_coroutine(where()).result(5) == (loop, "async-openai-loop")
+
+
+def test_run_coroutine_propagates_exceptions():
+    async def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        run_coroutine(fail()).result(5)
+
+
+def test_results_are_reported_in_completion_order(outline_data, monkeypatch):
+    service = _service()
+    # 越靠前的章节越晚完成，1.3生成失败
+    delays = {'1.1': 0.25, '1.2': 0.2, '1.3': 0.15, '2.1': 0.1, '2.2': 0.05}
+
+    async def fake_generate(chapter, **kwargs):
+        await asyncio.sleep(delays[chapter['id']])
+        if chapter['id'] == '1.3':
+            raise RuntimeError("接口错误")
+        return f"{chapter['title']}正文"
+
+    monkeypatch.setattr(service, "agenerate_chapter_content", fake_generate)
+    leaf_nodes_info = get_outline_index(outline_data).leaf_nodes_info()
+    results = []
+    completed = run_coroutine(service.generate_chapters(leaf_nodes_info, "项目概述", results.append)).result(5)
+
+    assert completed == 5
+    assert [path.split(' ')[0] for path, _, _ in results] == ['2.2', '2.1', '1.3', '1.2', '1.1']
+    by_id = {path.split(' ')[0]: (content, error) for path, content, error in results}
+    assert by_id['2.2'] == ("技术人员正文", None)
+    assert by_id['1.3'] == (None, "生成失败: 接口错误")
+
+
+def test_real_requests_fill_every_chapter(outline_data, mock_server):
+    base_url, state = mock_server
+    service = _service(base_url)
+    results = {}
+    leaf_nodes_info = get_outline_index(outline_data).leaf_nodes_info()
+    run_coroutine(service.generate_chapters(
+        leaf_nodes_info, "项目概述", lambda result: results.update({result[0]: result[1:]}))).result(30)
+
+    assert sorted(results) == sorted(path for path, _ in leaf_nodes_info)
+    assert all(content and error is None for content, error in results.values())
+    assert state.snapshot()['requests'] == 5
+
+
+def test_cancel_stops_unfinished_chapters(outline_data, monkeypatch):
+    service = _service()
+    token = CancellationToken()
+    cancelled = []
+
+    async def fake_generate(chapter, **kwargs):
+        if chapter['id'] == '1.1':
+            return "巡检计划正文"
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(chapter['id'])
+            raise
+
+    monkeypatch.setattr(service, "agenerate_chapter_content", fake_generate)
+    results = []
+
+    def on_result(result):
+        results.append(result)
+        token.cancel()
+
+    leaf_nodes_info = get_outline_index(outline_data).leaf_nodes_info()
+    completed = run_coroutine(service.generate_chapters(leaf_nodes_info, "项目概述", on_result, token)).result(5)
+
+    # 已完成的章节照常回调，其余章节全部取消，不当作失败上报
+    assert completed == 1
+    assert [content for _, content, _ in results] == ["巡检计划正文"]
+    assert sorted(cancelled) == ['1.2', '1.3', '2.1', '2.2']
@@ -0,0 +1,91 @@
+import pytest
+from services import batch_service, generation_journal
+from services.batch_service import BatchGenerator, build_batch_file, parse_batch_output
+from services.openai_servce import OpenAIService
+from page_modules import content_edit
+
+
+@pytest.fixture
+def generator(mock_server, monkeypatch, tmp_path):
+    base_url, _ = mock_server
+    monkeypatch.setattr(batch_service, "BATCH_JOBS_DIR", str(tmp_path / "batch_jobs"))
+    monkeypatch.setattr(generation_journal, "JOURNAL_DIR", str(tmp_path / "journals"))
+    service = OpenAIService(api_key="test-key", base_url=base_url, model_name="mock-gpt-fast", use_cache=False)
+    return BatchGenerator(service)
+
+
+@pytest.fixture
+def prepared_session(session_state, outline_data):
+    session_state.outline_data = outline_data
+    session_state.project_overview = "消防物联网远程监控系统运维服务项目"
+    session_state.file_content = ""
+    return session_state
+
+
+def test_build_and_parse_batch_file_round_trip():
+    data = build_batch_file([("chapter-0", [{"role": "user", "content": "你好"}])], "mock-gpt-fast")
+    line = data.decode("utf-8").strip()
+    assert '"custom_id": "chapter-0"' in line
+    assert '"url": "/v1/chat/completions"' in line
+
+    output = (
+        '{"custom_id": "chapter-0", "response": {"status_code": 200, "body": '
+        '{"choices": [{"message": {"content": " 正文 "}}]}}, "error": null}\n'
+        '{"custom_id": "chapter-1", "response": {"status_code": 500, "body": '
+        '{"error": {"message": "boom"}}}, "error": null}\n'
+        'not json\n'
+    )
+    assert parse_batch_output(output) == {
+        "chapter-0": ("正文", None),
+        "chapter-1": (None, "生成失败: boom"),
+    }
+
+
+def test_batch_end_to_end_merges_into_session(generator, prepared_session):
+    leaf_nodes_info = content_edit._collect_leaf_nodes(prepared_session.outline_data)
+    job = generator.submit(leaf_nodes_info, prepared_session.project_overview)
+    assert job['status'] == "completed"
+    assert len(job['paths']) == 5
+
+    generator.refresh(job)
+    content_edit._merge_batch_results(generator, job)
+
+    paths = [path for path, _ in leaf_nodes_info]
+    assert sorted(prepared_session.generated_content) == sorted(paths)
+    assert all(prepared_session.generated_content[path] for path in paths)
+    assert prepared_session.generation_errors == {}
+    expected_hashes = content_edit._compute_input_hashes(
+        generator.service, leaf_nodes_info, prepared_session.project_overview, model_name=job['model'])
+    assert prepared_session.generation_hashes == expected_hashes
+    # 合并后的任务保存到本地，之后不会重复合并
+    saved = batch_service.list_batch_jobs(generator.service.base_url, job['model'])
+    assert saved[0]['batch_id'] == job['batch_id'] and saved[0]['merged']
+    # 批量结果写入生成日志，重启后恢复的哈希与合并时相同
+    journal = generation_journal.GenerationJournal.for_project(prepared_session.project_overview).load()
+    assert journal['outline_data'] == prepared_session.outline_data
+    assert journal['contents'] == prepared_session.generated_content
+    assert journal['hashes'] == expected_hashes
+
+
+@pytest.mark.mock_settings(error_rate=1.0)
+def test_batch_failures_are_recorded_as_errors(generator, prepared_session):
+    leaf_nodes_info = content_edit._collect_leaf_nodes(prepared_session.outline_data)
+    job = generator.submit(leaf_nodes_info, prepared_session.project_overview)
+    content_edit._merge_batch_results(generator, job)
+
+    assert prepared_session.generated_content == {}
+    assert set(prepared_session.generation_errors) == {path for path, _ in leaf_nodes_info}
+    assert all("Internal server error" in error for error in prepared_session.generation_errors.values())
+
+
+@pytest.mark.mock_settings(batch_seconds=60)
+def test_cancelled_batch_marks_every_chapter_failed(generator, prepared_session):
+    leaf_nodes_info = content_edit._collect_leaf_nodes(prepared_session.outline_data)
+    job = generator.submit(leaf_nodes_info, prepared_session.project_overview)
+    assert job['status'] == "in_progress"
+
+    generator.cancel(job)
+    assert job['status'] == "cancelled"
+    results = generator.fetch_results(job)
+    assert len(results) == 5
+    assert all(content is None and "已取消" in error for content, error in results.values())
@@ -0,0 +1,117 @@
+import threading
+import time
+import pytest
+from services.async_openai_service import AsyncOpenAIService, run_coroutine
+from services.cancellation import DEFAULT_CANCEL_REASON, CancellationToken, GenerationCancelled
+from services.openai_servce import OpenAIService
+from services.outline_index import get_outline_index
+from services.telemetry import get_telemetry
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def test_callbacks_run_exactly_once():
+    token = CancellationToken()
+    calls = []
+    token.add_callback(lambda: calls.append('a'))
+    token.add_callback(lambda: calls.append('b'))
+
+    token.cancel("切换页面")
+    token.cancel("再次取消")
+    assert calls == ['a', 'b']
+    assert token.cancelled and token.reason == "切换页面"
+
+
+def test_callback_added_after_cancel_runs_immediately():
+    token = CancellationToken()
+    token.cancel()
+    calls = []
+    remove = token.add_callback(lambda: calls.append('late'))
+    assert calls == ['late']
+    remove()
+    token.cancel()
+    assert calls == ['late']
+
+
+def test_removed_callback_does_not_run():
+    token = CancellationToken()
+    calls = []
+    remove = token.add_callback(lambda: calls.append('removed'))
+    token.add_callback(lambda: calls.append('kept'))
+    remove()
+    token.cancel()
+    assert calls == ['kept']
+
+
+def test_failing_callback_is_logged_and_others_still_run(caplog):
+    token = CancellationToken()
+    calls = []
+
+    def fail():
+        raise RuntimeError("回调出错")
+
+    token.add_callback(fail)
+    token.add_callback(lambda: calls.append('after'))
+    token.cancel()
+    assert calls == ['after']
+    assert "执行取消回调失败" in caplog.text
+    assert "回调出错" in caplog.text
+
+
+def test_wait_returns_early_and_raise_if_cancelled():
+    token = CancellationToken()
+    token.raise_if_cancelled()
+    assert token.wait(0.01) is False
+
+    threading.Timer(0.05, token.cancel).start()
+    started = time.monotonic()
+    assert token.wait(5) is True
+    assert time.monotonic() - started < 2
+    with pytest.raises(GenerationCancelled, match=DEFAULT_CANCEL_REASON):
+        token.raise_if_cancelled()
+
+
+@pytest.mark.mock_settings(tokens_per_second=20.0, output_tokens=2000)
+def test_cancelled_generation_closes_its_streams(outline_data, mock_server):
+    base_url, state = mock_server
+    service = AsyncOpenAIService(api_key="test-key", base_url=base_url, model_name="mock-gpt-fast", use_cache=False)
+    token = CancellationToken()
+    results = []
+    started_wall = time.time()
+    future = run_coroutine(service.generate_chapters(get_outline_index(outline_data).leaf_nodes_info(), "项目概述",
+                                                     results.append, token))
+
+    assert _wait_until(lambda: state.snapshot()['in_flight'] == 5)
+    token.cancel()
+    # 按模拟接口的速度每章需要100秒，取消后任务立即结束，服务端的连接也随之断开
+    assert future.result(5) == 0
+    assert results == []
+    assert _wait_until(lambda: state.snapshot()['in_flight'] == 0)
+    assert state.snapshot()['requests'] == 5
+
+    statuses = [record['status'] for record in get_telemetry().recent(since=started_wall)
+                if record['base_url'] == base_url]
+    assert statuses == ['cancelled'] * 5
+
+
+@pytest.mark.mock_settings(tokens_per_second=20.0, output_tokens=2000)
+def test_cancelled_sync_stream_stops_reading(mock_server):
+    base_url, state = mock_server
+    service = OpenAIService(api_key="test-key", base_url=base_url, model_name="mock-gpt-fast", use_cache=False)
+    token = CancellationToken()
+    chunks = []
+    with pytest.raises(GenerationCancelled):
+        for chunk in service.stream_chat_completion([{"role": "user", "content": "目录"}], cancel_token=token,
+                                                    share=False):
+            chunks.append(chunk)
+            token.cancel()
+
+    assert len(chunks) == 1
+    assert _wait_until(lambda: state.snapshot()['in_flight'] == 0)
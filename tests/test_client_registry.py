@@ -0,0 +1,56 @@
+from services.async_openai_service import AsyncOpenAIService
+from services.client_registry import (DEFAULT_CONNECT_TIMEOUT, DEFAULT_MAX_CONNECTIONS, DEFAULT_READ_TIMEOUT,
+                                      get_async_openai_client, get_http_settings, get_openai_client)
+from services.openai_servce import OpenAIService, get_openai_service
+
+
+def test_clients_are_shared_per_key_url_and_http_settings():
+    client = get_openai_client("key-a", "http://registry.test/v1", 5.0, 30.0, 16)
+    assert get_openai_client("key-a", "http://registry.test/v1", 5.0, 30.0, 16) is client
+    assert get_openai_client("key-b", "http://registry.test/v1", 5.0, 30.0, 16) is not client
+    assert get_openai_client("key-a", "http://other.test/v1", 5.0, 30.0, 16) is not client
+    assert get_openai_client("key-a", "http://registry.test/v1", 5.0, 60.0, 16) is not client
+    assert get_openai_client("key-a", "http://registry.test/v1", 5.0, 30.0, 32) is not client
+    # SDK自带的重试关闭，由retry_policy统一处理
+    assert client.max_retries == 0
+
+
+def test_http_settings_reach_the_connection_pool():
+    client = get_async_openai_client("key-a", "http://registry.test/v1", 3.0, 45.0, 8)
+    http_client = client._client
+    assert http_client.timeout.connect == 3.0
+    assert http_client.timeout.read == 45.0
+    assert http_client._transport._pool._max_connections == 8
+    assert http_client._transport._pool._max_keepalive_connections == 8
+
+
+def test_services_with_same_settings_share_clients():
+    settings = {'connect_timeout': 5.0, 'read_timeout': 30.0, 'max_connections': 16}
+    first = AsyncOpenAIService("key-a", "http://registry.test/v1", "mock-gpt-fast", http_settings=settings)
+    second = AsyncOpenAIService("key-a", "http://registry.test/v1", "mock-gpt-slow", http_settings=settings)
+    assert first.client is second.client
+    assert first.async_client is second.async_client
+    assert OpenAIService("key-a", "http://registry.test/v1", http_settings=settings).client is first.client
+
+
+def test_http_settings_default_and_follow_session(session_state):
+    assert get_http_settings() == {
+        'connect_timeout': DEFAULT_CONNECT_TIMEOUT,
+        'read_timeout': DEFAULT_READ_TIMEOUT,
+        'max_connections': DEFAULT_MAX_CONNECTIONS,
+    }
+    session_state.update(read_timeout="300", max_connections="32")
+    assert get_http_settings()['read_timeout'] == 300.0
+    assert get_http_settings()['max_connections'] == 32
+
+
+def test_service_is_rebuilt_when_http_settings_change(session_state):
+    session_state.update(api_key="key-a", base_url="http://registry.test/v1", model_name="mock-gpt-fast")
+    service = get_openai_service()
+    assert get_openai_service() is service
+
+    session_state.read_timeout = 300
+    rebuilt = get_openai_service()
+    assert rebuilt is not service
+    assert rebuilt.client is not service.client
+    assert rebuilt.client._client.timeout.read == 300.0
@@ -0,0 +1,115 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from services import concurrency_controller
+from services.concurrency_controller import AdaptiveConcurrencyController, get_concurrency_controller, is_overload_error
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(concurrency_controller, "time", clock)
+    return clock
+
+
+def _status_error(status_code):
+    request = httpx.Request("POST", "http://aimd.test/v1/chat/completions")
+    return openai.APIStatusError("mock error", response=httpx.Response(status_code, request=request), body=None)
+
+
+def test_overload_errors():
+    assert is_overload_error(_status_error(429))
+    assert is_overload_error(_status_error(502))
+    assert is_overload_error(openai.APIConnectionError(request=httpx.Request("POST", "http://aimd.test")))
+    assert not is_overload_error(_status_error(400))
+    assert not is_overload_error(ValueError("bug"))
+
+
+def test_slow_start_then_additive_increase_after_backoff(clock):
+    controller = AdaptiveConcurrencyController(initial_limit=4, max_limit=64)
+    for _ in range(4):
+        controller.record_success(1.0)
+    assert controller.target == 8
+
+    controller.record_failure(_status_error(429))
+    assert controller.target == 4
+    assert controller.overloads == 1
+
+    # 回退后每轮（target次成功）只增加1
+    for _ in range(4):
+        controller.record_success(1.0)
+    assert controller.target == 4
+    controller.record_success(1.0)
+    assert controller.target == 5
+
+
+def test_decrease_cooldown_absorbs_a_burst_of_errors(clock):
+    controller = AdaptiveConcurrencyController(initial_limit=16)
+    for _ in range(5):
+        controller.record_failure(_status_error(503))
+    assert controller.target == 8
+
+    clock.now += concurrency_controller.DECREASE_COOLDOWN
+    controller.record_failure(_status_error(503))
+    assert controller.target == 4
+    # 非过载错误不影响并发数
+    clock.now += concurrency_controller.DECREASE_COOLDOWN
+    controller.record_failure(_status_error(400))
+    assert controller.target == 4
+
+
+def test_rising_ttft_backs_off_gently(clock):
+    controller = AdaptiveConcurrencyController(initial_limit=10)
+    controller.record_success(1.0)
+    assert controller.target == 11
+    for _ in range(10):
+        controller.record_success(10.0)
+    assert controller.target < 11
+    assert controller.snapshot()['ttft_ewma'] > 2.0
+
+
+def test_limit_stays_within_bounds(clock):
+    controller = AdaptiveConcurrencyController(initial_limit=2, min_limit=2, max_limit=3)
+    for _ in range(10):
+        controller.record_success(1.0)
+    assert controller.target == 3
+    for _ in range(5):
+        clock.now += concurrency_controller.DECREASE_COOLDOWN
+        controller.record_failure(_status_error(429))
+    assert controller.target == 2
+
+
+def test_acquire_blocks_until_release():
+    controller = AdaptiveConcurrencyController(initial_limit=2)
+
+    async def scenario():
+        peak = 0
+
+        async def request():
+            nonlocal peak
+            await controller.acquire()
+            peak = max(peak, controller.in_flight)
+            await asyncio.sleep(0.01)
+            await controller.release()
+
+        await asyncio.gather(*(request() for _ in range(6)))
+        return peak
+
+    assert asyncio.run(scenario()) == 2
+    assert controller.in_flight == 0
+
+
+def test_controllers_are_shared_per_endpoint_and_key():
+    controller = get_concurrency_controller("http://aimd.test/v1", "model-a", max_limit=32, api_key="k1")
+    assert get_concurrency_controller("http://aimd.test/v1", "model-a", max_limit=16, api_key="k1") is controller
+    assert controller.max_limit == 16
+    assert get_concurrency_controller("http://aimd.test/v1", "model-a", api_key="k2") is not controller
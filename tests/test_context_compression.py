@@ -0,0 +1,59 @@
+from services.context_compression import (MIN_DESCRIPTION_CHARS, PARENT_DESCRIPTION_CHARS, ContextSavings,
+                                          build_chapter_context, parent_description, sibling_digest)
+from services.rate_limiter import estimate_text_tokens
+
+
+def _siblings(count, description_chars):
+    return [{'id': f"1.{index}", 'title': f"章节{index}", 'description': "描" * description_chars}
+            for index in range(1, count + 1)]
+
+
+def test_small_sibling_list_is_kept_verbatim():
+    siblings = _siblings(3, 10)
+    digest, full_tokens, digest_tokens = sibling_digest(siblings)
+    assert digest == "".join(f"- {s['id']} {s['title']}\n  {s['description']}\n" for s in siblings)
+    assert full_tokens == digest_tokens
+
+
+def test_descriptions_are_truncated_evenly_to_fit_budget():
+    digest, full_tokens, digest_tokens = sibling_digest(_siblings(10, 100), token_budget=400)
+    assert digest_tokens <= 400 < full_tokens
+    descriptions = [line.strip() for line in digest.splitlines() if line.startswith("  ")]
+    assert len(descriptions) == 10
+    assert len(set(descriptions)) == 1 and descriptions[0].endswith("…")
+    assert len(descriptions[0]) - 1 >= MIN_DESCRIPTION_CHARS
+
+
+def test_titles_only_when_descriptions_cannot_fit():
+    digest, _, digest_tokens = sibling_digest(_siblings(200, 50), token_budget=400)
+    assert digest_tokens <= 400 + estimate_text_tokens("- ……等共200个同级章节\n")
+    assert "描" not in digest
+    assert digest.endswith("- ……等共200个同级章节\n")
+
+
+def test_digest_is_cached_per_sibling_group():
+    siblings = _siblings(50, 60)
+    assert sibling_digest(siblings) is sibling_digest([dict(sibling) for sibling in siblings])
+
+
+def test_chapter_context_includes_parents_and_siblings():
+    parents = [{'id': '1', 'title': '运维方案', 'description': "长" * 200}]
+    siblings = _siblings(2, 5)
+    context = build_chapter_context('1.1', parents, siblings)
+    assert context.startswith("上级章节信息：\n- 1 运维方案\n")
+    assert parent_description("长" * 200) in context
+    assert len(parent_description("长" * 200)) == PARENT_DESCRIPTION_CHARS + 1
+    assert "同级章节信息" in context and "- 1.2 章节2" in context
+
+    # 只有当前章节自己时不列同级章节
+    assert "同级章节信息" not in build_chapter_context('1.1', parents, siblings[:1])
+    assert build_chapter_context('1') == ""
+
+
+def test_context_savings_snapshot():
+    savings = ContextSavings()
+    assert savings.snapshot()['saved_ratio'] == 0.0
+    savings.record(1000, 400)
+    savings.record(100, 100)
+    assert savings.snapshot() == {'chapters': 2, 'full_tokens': 1100, 'compressed_tokens': 500,
+                                  'saved_tokens': 600, 'saved_ratio': 600 / 1100}
@@ -0,0 +1,44 @@
+from services.document_chunker import split_document, split_passages
+
+
+def _page(number, body):
+    return f"--- 第{number}页 ---\n{body}"
+
+
+def test_small_document_is_a_single_chunk():
+    assert split_document("") == []
+    assert split_document("短文本", chunk_size=100) == ["短文本"]
+    assert split_document("不分块", chunk_size=0) == ["不分块"]
+
+
+def test_chunks_break_on_page_boundaries():
+    pages = [_page(number, "内容" * 20) for number in range(1, 6)]
+    text = "\n".join(pages)
+    chunks = split_document(text, chunk_size=100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert all(chunk.startswith("--- 第") for chunk in chunks)
+    # 合并后的块拼回来就是原文
+    assert "\n".join(chunks) == text
+
+
+def test_adjacent_segments_are_merged_greedily():
+    text = "\n".join(["第一章 总则", "一、项目背景", "说明", "1.1 范围", "说明", "第二章 要求", "说明"])
+    chunks = split_document(text, chunk_size=20)
+    assert chunks == ["第一章 总则\n一、项目背景\n说明", "1.1 范围\n说明\n第二章 要求\n说明"]
+
+
+def test_oversized_lines_are_hard_split():
+    text = "第一章 总则\n" + "长" * 250
+    chunks = split_document(text, chunk_size=100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunk.replace("\n", "") for chunk in chunks) == text.replace("\n", "")
+
+
+def test_passages_are_not_merged_and_skip_blank_segments():
+    text = "\n".join([_page(1, "招标公告"), "", _page(2, "1.1 服务范围\n巡检"), "2.1 人员\n" + "值守" * 30])
+    passages = split_passages(text, max_chars=40)
+    assert passages[0] == "--- 第1页 ---\n招标公告"
+    assert passages[1] == "--- 第2页 ---"
+    assert passages[2] == "1.1 服务范围\n巡检"
+    assert all(len(passage) <= 40 for passage in passages)
+    assert split_passages("", 40) == []
@@ -0,0 +1,160 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from benchmarks.mock_openai_server import MockSettings, start_mock_server
+from services import endpoint_pool
+from services.async_openai_service import AsyncOpenAIService, run_coroutine
+from services.endpoint_pool import BASE_EJECT_SECONDS, EndpointPool, PooledEndpoint
+from services.outline_index import get_outline_index
+from services.retry_policy import LLMServiceError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(endpoint_pool, "time", clock)
+    return clock
+
+
+def _status_error(status_code):
+    request = httpx.Request("POST", "http://pool.test/v1/chat/completions")
+    return openai.APIStatusError("mock error", response=httpx.Response(status_code, request=request), body=None)
+
+
+def _endpoint(name, **kwargs):
+    return PooledEndpoint(name, f"key-{name}", f"http://{name}.test/v1", "model", **kwargs)
+
+
+def _acquire(pool, exclude=()):
+    return asyncio.run(pool.acquire(exclude))
+
+
+def test_consecutive_transient_failures_eject_endpoint(clock):
+    primary, backup = _endpoint("primary"), _endpoint("backup")
+    pool = EndpointPool([primary, backup])
+    for _ in range(2):
+        pool.record_failure(primary, _status_error(503))
+    assert primary.state(clock.now) == 'healthy'
+    pool.record_failure(primary, _status_error(503))
+    assert primary.state(clock.now) == 'ejected'
+    assert pool.next_recovery_in() == BASE_EJECT_SECONDS
+
+    # 摘除期间只会选中其他端点
+    for _ in range(10):
+        endpoint = _acquire(pool)
+        assert endpoint is backup
+        pool.release(endpoint)
+
+
+def test_request_errors_do_not_count_but_auth_errors_eject_at_once(clock):
+    endpoint = _endpoint("primary")
+    pool = EndpointPool([endpoint, _endpoint("backup")])
+    for _ in range(5):
+        pool.record_failure(endpoint, _status_error(400))
+    assert endpoint.state(clock.now) == 'healthy' and endpoint.failures == 0
+
+    pool.record_failure(endpoint, _status_error(401))
+    assert endpoint.state(clock.now) == 'ejected'
+
+
+def test_half_open_allows_a_single_probe(clock):
+    primary, backup = _endpoint("primary"), _endpoint("backup")
+    pool = EndpointPool([primary, backup])
+    pool.record_failure(primary, _status_error(401))
+    clock.now += BASE_EJECT_SECONDS
+    assert primary.state(clock.now) == 'half_open'
+
+    # 到期的端点优先用于探测，探测期间不再放行其他请求
+    probe = _acquire(pool)
+    assert probe is primary and primary.probing
+    assert _acquire(pool) is backup
+
+    pool.record_success(primary)
+    pool.release(primary)
+    assert primary.state(clock.now) == 'healthy'
+    assert not primary.probing and primary.ejections == 0
+
+
+def test_failed_probe_doubles_ejection(clock):
+    primary = _endpoint("primary")
+    pool = EndpointPool([primary, _endpoint("backup")])
+    pool.record_failure(primary, _status_error(401))
+    clock.now += BASE_EJECT_SECONDS
+    assert _acquire(pool) is primary
+
+    pool.record_failure(primary, _status_error(503))
+    pool.release(primary)
+    assert primary.state(clock.now) == 'ejected'
+    assert pool.next_recovery_in() == 2 * BASE_EJECT_SECONDS
+
+
+def test_probe_released_without_result_can_be_retried(clock):
+    primary = _endpoint("primary")
+    pool = EndpointPool([primary])
+    pool.record_failure(primary, _status_error(401))
+    clock.now += BASE_EJECT_SECONDS
+    assert _acquire(pool) is primary
+    # 被取消的探测请求不影响端点状态，下一个请求继续探测
+    pool.release(primary)
+    assert _acquire(pool) is primary
+
+
+def test_all_endpoints_ejected_raises_transient_error(clock):
+    only = _endpoint("only")
+    pool = EndpointPool([only])
+    pool.record_failure(only, _status_error(403))
+    with pytest.raises(LLMServiceError) as excinfo:
+        _acquire(pool)
+    assert excinfo.value.transient
+    assert excinfo.value.retry_after == BASE_EJECT_SECONDS
+
+
+def test_failed_endpoints_are_avoided_and_state_survives_reconfigure(clock):
+    primary, backup = _endpoint("primary"), _endpoint("backup")
+    pool = EndpointPool([primary, backup])
+    for _ in range(10):
+        endpoint = _acquire(pool, exclude=[primary])
+        assert endpoint is backup
+        pool.release(endpoint)
+
+    pool.record_failure(primary, _status_error(503))
+    pool.configure([_endpoint("primary", weight=3), _endpoint("backup")])
+    assert pool.endpoints[0] is primary
+    assert primary.weight == 3 and primary.consecutive_failures == 1
+
+
+@pytest.mark.mock_settings(error_rate=1.0)
+def test_chapters_fail_over_to_healthy_endpoint(mock_server):
+    failing_url, failing_state = mock_server
+    server, healthy_url = start_mock_server(MockSettings(ttft=0.0, ttft_jitter=0.0, tokens_per_second=0.0,
+                                                         output_tokens=30))
+    try:
+        service = AsyncOpenAIService(api_key="test-key", base_url=failing_url, model_name="mock-gpt-fast",
+                                     use_cache=False, endpoints=[
+                                         {'name': "备用", 'api_key': "backup-key", 'base_url': healthy_url}
+                                     ])
+        # 按权重随机分流，章节足够多时主端点一定会连续失败到被摘除
+        outline_data = {'outline': [{'id': str(index), 'title': f"章节{index}"} for index in range(1, 31)]}
+        leaf_nodes_info = get_outline_index(outline_data).leaf_nodes_info()
+        results = {}
+        run_coroutine(service.generate_chapters(
+            leaf_nodes_info, "项目概述", lambda result: results.update({result[0]: result[1:]}))).result(30)
+
+        assert len(results) == len(leaf_nodes_info)
+        assert all(content and error is None for content, error in results.values())
+        states = {endpoint['name']: endpoint for endpoint in service.endpoint_pool.snapshot()}
+        assert states["主端点"]['state'] == 'ejected'
+        assert states["备用"]['successes'] == len(leaf_nodes_info)
+        assert failing_state.snapshot()['errors'] >= endpoint_pool.EJECT_AFTER_FAILURES
+    finally:
+        server.shutdown()
+        server.server_close()
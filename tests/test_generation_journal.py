@@ -0,0 +1,92 @@
+import os
+import pytest
+from services import generation_journal
+from services.generation_journal import GenerationJournal, list_journals, project_key
+
+
+@pytest.fixture(autouse=True)
+def journal_dir(tmp_path, monkeypatch):
+    path = tmp_path / "journals"
+    monkeypatch.setattr(generation_journal, "JOURNAL_DIR", str(path))
+    return path
+
+
+def test_project_key_is_stable_per_overview():
+    assert project_key("项目A") == project_key("项目A")
+    assert project_key("项目A") != project_key("项目B")
+    assert len(project_key("")) == 16
+
+
+def test_replay_keeps_latest_result_per_chapter(outline_data):
+    journal = GenerationJournal.for_project("项目A")
+    assert journal.load() is None
+    journal.start(outline_data, "项目A", reset=True)
+    journal.record("1.1 巡检计划", "第一版", input_hash="h1")
+    journal.record("1.2 电池更换", None, "生成失败: 超时")
+    journal.record("1.1 巡检计划", None, "生成失败: 429")
+    journal.record("1.2 电池更换", "重试成功", input_hash="h2")
+
+    state = journal.load()
+    assert state['outline_data'] == outline_data
+    assert state['project_overview'] == "项目A"
+    # 失败记录不会覆盖之前成功的内容
+    assert state['contents'] == {"1.1 巡检计划": "第一版", "1.2 电池更换": "重试成功"}
+    assert state['errors'] == {"1.1 巡检计划": "生成失败: 429"}
+    assert state['hashes'] == {"1.1 巡检计划": "h1", "1.2 电池更换": "h2"}
+
+
+def test_truncated_last_line_is_ignored_and_terminated(outline_data):
+    journal = GenerationJournal.for_project("项目A")
+    journal.start(outline_data, "项目A", reset=True)
+    journal.record("1.1 巡检计划", "完整", input_hash="h1")
+    # 模拟写到一半时崩溃
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"type": "chapter", "path": "1.2 电池更换", "cont')
+    assert journal.load()['contents'] == {"1.1 巡检计划": "完整"}
+
+    # 继续生成时先补上换行，新记录不会与残缺的行连在一起
+    journal.start(outline_data, "项目A")
+    journal.record("1.2 电池更换", "续写", input_hash="h2")
+    state = journal.load()
+    assert state['contents'] == {"1.1 巡检计划": "完整", "1.2 电池更换": "续写"}
+
+
+def test_reset_discards_previous_records(outline_data):
+    journal = GenerationJournal.for_project("项目A")
+    journal.start(outline_data, "项目A", reset=True)
+    journal.record("1.1 巡检计划", "旧内容")
+    journal.start(outline_data, "项目A", reset=True)
+    assert journal.load()['contents'] == {}
+
+
+def test_tender_text_is_restored_only_when_it_matches(outline_data):
+    journal = GenerationJournal.for_project("项目A")
+    journal.start(outline_data, "项目A", reset=True, tender_text="招标文件全文")
+    assert journal.load_tender_text() == "招标文件全文"
+
+    # 保存的全文与最近一次生成记录的哈希不一致时不恢复
+    with open(journal.tender_path, 'w', encoding='utf-8') as f:
+        f.write("被改过的内容")
+    assert journal.load_tender_text() == ""
+    journal.start(outline_data, "项目A")
+    assert journal.load_tender_text() == ""
+
+
+def test_list_journals_newest_first(outline_data, journal_dir):
+    older = GenerationJournal.for_project("项目A")
+    older.start(outline_data, "项目A", reset=True)
+    newer = GenerationJournal.for_project("项目B")
+    newer.start(outline_data, "项目B", reset=True)
+    os.utime(older.path, (1, 1))
+    # 没有目录的日志不列出
+    GenerationJournal.for_project("项目C").record("1.1 巡检计划", "内容")
+
+    assert [journal['project_overview'] for journal in list_journals()] == ["项目B", "项目A"]
+
+
+def test_write_failure_is_logged_not_raised(outline_data, journal_dir, caplog):
+    journal_dir.parent.mkdir(parents=True, exist_ok=True)
+    journal_dir.write_text("不是目录")
+    journal = GenerationJournal.for_project("项目A")
+    journal.start(outline_data, "项目A", reset=True)
+    assert "写入生成日志失败" in caplog.text
@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+from services import async_openai_service, hedging
+from services.async_openai_service import AsyncOpenAIService, run_coroutine
+from services.hedging import (DEFAULT_HEDGE_DELAY, MIN_HEDGE_DELAY, HedgeBudget, LatencyTracker, StreamProgress,
+                              percentile)
+from services.outline_index import get_outline_index
+
+
+def test_percentile_nearest_rank():
+    assert percentile([5, 1, 3, 2, 4], 50) == 3
+    assert percentile(range(1, 101), 95) == 95
+    assert percentile([7], 0) == 7
+
+
+def test_latency_threshold_needs_enough_samples():
+    tracker = LatencyTracker()
+    for _ in range(hedging.MIN_HEDGE_SAMPLES - 1):
+        tracker.record(5.0, 1.0)
+    assert tracker.threshold('first_token') == DEFAULT_HEDGE_DELAY
+    tracker.record(5.0, 1.0)
+    assert tracker.threshold('first_token') == 5.0
+    # 阈值不低于下限
+    assert tracker.threshold('progress') == MIN_HEDGE_DELAY
+
+
+def test_stream_progress_reports_what_it_is_waiting_for():
+    progress = StreamProgress()
+    assert progress.stalled_for(100.0) is None
+    progress.mark_sent()
+    kind, seconds = progress.stalled_for(progress.sent_at + 3)
+    assert kind == 'first_token' and seconds == pytest.approx(3)
+    progress.mark_token()
+    kind, seconds = progress.stalled_for(progress.last_token_at + 1)
+    assert kind == 'progress' and seconds == pytest.approx(1)
+
+
+def test_hedge_budget_is_a_fraction_of_requests():
+    budget = HedgeBudget(0.25)
+    assert not budget.try_spend()
+    for _ in range(8):
+        budget.record_request()
+    assert budget.try_spend() and budget.try_spend()
+    assert not budget.try_spend()
+    budget.record_win()
+    assert budget.snapshot() == {'requests': 8, 'hedges': 2, 'hedge_wins': 1}
+    assert not HedgeBudget(0).try_spend()
+
+
+@pytest.fixture
+def fast_hedging(monkeypatch):
+    """样本不足时0.2秒无进展即视为卡住"""
+    monkeypatch.setattr(hedging, "DEFAULT_HEDGE_DELAY", 0.2)
+    monkeypatch.setattr(async_openai_service, "HEDGE_CHECK_INTERVAL", 0.02)
+
+
+def _service(base_url="http://hedge.test/v1", **kwargs):
+    return AsyncOpenAIService(api_key="test-key", base_url=base_url, model_name="mock-gpt-fast", use_cache=False,
+                              **kwargs)
+
+
+def test_stalled_request_is_hedged_and_loser_cancelled(fast_hedging, monkeypatch):
+    service = _service()
+    calls = []
+
+    async def fake_collect(messages, temperature, model_name, chapter_id, progress=None, avoid_endpoints=None,
+                           share=True):
+        calls.append(share)
+        if len(calls) == 1:
+            # 原请求发出后一直没有首字
+            progress.mark_sent()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                calls.append('cancelled')
+                raise
+        return "对冲结果"
+
+    monkeypatch.setattr(service, "_acollect", fake_collect)
+    budget = HedgeBudget(1.0)
+    result = asyncio.run(service._acollect_hedged([], 0.7, "mock-gpt-fast", "1.1", budget))
+
+    assert result == "对冲结果"
+    # 对冲请求不跟随原请求的输出；原请求在对冲完成后被取消
+    assert calls == [True, False, 'cancelled']
+    assert budget.snapshot() == {'requests': 1, 'hedges': 1, 'hedge_wins': 1}
+
+
+def test_no_hedge_without_budget(fast_hedging, monkeypatch):
+    service = _service()
+    calls = []
+
+    async def slow_collect(messages, temperature, model_name, chapter_id, progress=None, avoid_endpoints=None,
+                           share=True):
+        calls.append(share)
+        progress.mark_sent()
+        await asyncio.sleep(0.4)
+        return "原请求"
+
+    monkeypatch.setattr(service, "_acollect", slow_collect)
+    budget = HedgeBudget(0.5)
+    assert asyncio.run(service._acollect_hedged([], 0.7, "mock-gpt-fast", "1.1", budget)) == "原请求"
+    assert calls == [True]
+    assert budget.snapshot()['hedges'] == 0
+
+
+@pytest.mark.mock_settings(ttft=0.5)
+def test_hedges_against_slow_server_stay_within_budget(fast_hedging, mock_server):
+    base_url, state = mock_server
+    service = _service(base_url, hedge_ratio=0.2)
+    outline_data = {'outline': [{'id': str(index), 'title': f"章节{index}"} for index in range(1, 11)]}
+    results = {}
+    run_stats = {}
+    run_coroutine(service.generate_chapters(
+        get_outline_index(outline_data).leaf_nodes_info(), "项目概述",
+        lambda result: results.update({result[0]: result[1:]}), run_stats=run_stats)).result(30)
+
+    assert len(results) == 10 and all(content for content, _ in results.values())
+    stats = run_stats['hedging'].snapshot()
+    assert stats['requests'] == 10
+    assert stats['hedges'] == 2
+    # 对冲请求可能还在排队等待并发名额时就被取消，服务端收到的请求数不超过原请求加对冲
+    assert 10 <= state.snapshot()['requests'] <= 12
@@ -0,0 +1,127 @@
+import copy
+import pytest
+from page_modules import content_edit
+from services.openai_servce import OpenAIService
+
+OVERVIEW = "消防物联网远程监控系统运维服务项目"
+
+
+@pytest.fixture
+def service():
+    return OpenAIService(api_key="test-key", base_url="http://incremental.test/v1", model_name="mock-gpt-fast",
+                         use_cache=False)
+
+
+@pytest.fixture
+def generated(session_state, service, outline_data):
+    """所有章节都已按当前输入生成"""
+    session_state.file_content = ""
+    hashes = content_edit._compute_input_hashes(service, content_edit._collect_leaf_nodes(outline_data), OVERVIEW)
+    session_state.generated_content = {path: "正文" for path in hashes}
+    session_state.generation_errors = {}
+    session_state.generation_hashes = dict(hashes)
+    return session_state
+
+
+def _changed_ids(service, outline_data, overview=OVERVIEW, model_name=None):
+    hashes = content_edit._compute_input_hashes(service, content_edit._collect_leaf_nodes(outline_data), overview,
+                                                model_name=model_name)
+    return sorted(path.split(' ')[0] for path in content_edit._changed_paths(hashes))
+
+
+def _chapter(outline_data, chapter_id):
+    for chapter in outline_data['outline']:
+        if chapter['id'] == chapter_id:
+            return chapter
+        for child in chapter.get('children', []):
+            if child['id'] == chapter_id:
+                return child
+    raise KeyError(chapter_id)
+
+
+def test_unchanged_inputs_need_no_regeneration(generated, service, outline_data):
+    assert _changed_ids(service, copy.deepcopy(outline_data)) == []
+
+
+def test_failed_or_missing_chapters_are_regenerated(generated, service, outline_data):
+    paths = sorted(generated.generated_content)
+    generated.generation_errors[paths[0]] = "生成失败: 超时"
+    del generated.generated_content[paths[-1]]
+    assert _changed_ids(service, outline_data) == ['1.1', '2.2']
+
+
+def test_title_change_affects_the_chapter_and_its_siblings(generated, service, outline_data):
+    outline = copy.deepcopy(outline_data)
+    _chapter(outline, '1.1')['title'] = "巡检与保养计划"
+    # 标题是章节路径的一部分，同级章节的提示词中也列出了它
+    assert _changed_ids(service, outline) == ['1.1', '1.2', '1.3']
+
+
+def test_description_change_affects_the_sibling_group(generated, service, outline_data):
+    outline = copy.deepcopy(outline_data)
+    _chapter(outline, '2.2')['description'] = "硬件、软件和网络技术人员"
+    assert _changed_ids(service, outline) == ['2.1', '2.2']
+
+
+def test_parent_change_affects_its_children(generated, service, outline_data):
+    outline = copy.deepcopy(outline_data)
+    _chapter(outline, '1')['description'] = "运维服务的总体方案和保障措施"
+    assert _changed_ids(service, outline) == ['1.1', '1.2', '1.3']
+
+
+def test_new_sibling_affects_the_sibling_group(generated, service, outline_data):
+    outline = copy.deepcopy(outline_data)
+    outline['outline'][1]['children'].append({'id': '2.3', 'title': '培训计划', 'description': '人员培训'})
+    assert _changed_ids(service, outline) == ['2.1', '2.2', '2.3']
+
+
+def test_overview_model_or_tender_change_affects_every_chapter(generated, service, outline_data):
+    everything = ['1.1', '1.2', '1.3', '2.1', '2.2']
+    assert _changed_ids(service, outline_data, overview=OVERVIEW + "，服务期三年") == everything
+    assert _changed_ids(service, outline_data, model_name="mock-gpt-slow") == everything
+
+    generated.file_content = "--- 第1页 ---\n招标公告"
+    assert _changed_ids(service, outline_data) == everything
+
+
+def test_chapter_routes_change_only_the_routed_level(generated, service, outline_data):
+    assert _changed_ids(service, outline_data) == []
+    # 只给一级章节单独配置模型，叶子章节都在第二级
+    service.router.routes.update(major_chapter_level=1, major_chapter_model="mock-gpt-slow")
+    assert _changed_ids(service, outline_data) == []
+    service.router.routes['major_chapter_level'] = 2
+    assert _changed_ids(service, outline_data) == ['1.1', '1.2', '1.3', '2.1', '2.2']
+
+
+def test_chapter_input_hash_covers_model_and_tender_but_not_client(service):
+    chapter = {'id': '1.1', 'title': '巡检计划', 'description': '日常巡检'}
+    base = service.chapter_input_hash(chapter, project_overview=OVERVIEW)
+    other_service = OpenAIService(api_key="other-key", base_url="http://other.test/v1", model_name="mock-gpt-fast",
+                                  use_cache=False)
+    assert other_service.chapter_input_hash(chapter, project_overview=OVERVIEW) == base
+    assert service.chapter_input_hash(chapter, project_overview=OVERVIEW, model_name="mock-gpt-slow") != base
+    assert service.chapter_input_hash(chapter, project_overview=OVERVIEW, tender_hash="") == base
+
+    with_tender = service.chapter_input_hash(chapter, project_overview=OVERVIEW, tender_hash="a" * 64)
+    assert with_tender not in (base, service.chapter_input_hash(chapter, project_overview=OVERVIEW,
+                                                                tender_hash="b" * 64))
+
+
+def test_changed_count_reuses_cached_hashes(generated, outline_data, monkeypatch):
+    generated.update(api_key="test-key", base_url="http://incremental.test/v1", model_name="mock-gpt-fast",
+                     outline_data=outline_data, project_overview=OVERVIEW)
+    computed = []
+    compute = content_edit._compute_input_hashes
+
+    def counting_compute(*args, **kwargs):
+        computed.append(1)
+        return compute(*args, **kwargs)
+
+    monkeypatch.setattr(content_edit, "_compute_input_hashes", counting_compute)
+    assert content_edit._count_changed_chapters() == 0
+    assert content_edit._count_changed_chapters() == 0
+    assert len(computed) == 1
+
+    generated.project_overview = OVERVIEW + "，服务期三年"
+    assert content_edit._count_changed_chapters() == 5
+    assert len(computed) == 2
@@ -0,0 +1,178 @@
+import threading
+import time
+import pytest
+import streamlit as st
+from services import job_manager
+from services.cancellation import GenerationCancelled
+from services.job_manager import (JOB_ANALYSIS, JOB_CANCELLED, JOB_COMPLETED, JOB_CONTENT, JOB_FAILED, JOB_OUTLINE,
+                                  JOB_RUNNING, MAX_FINISHED_JOBS, SESSION_PARAM, JobManager, claim_finished_job,
+                                  current_owner, get_session_job, submit_session_job)
+
+OWNER_A = "a" * 32
+OWNER_B = "b" * 32
+
+
+def _wait_done(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.done
+    return job.snapshot()
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    manager = JobManager()
+    monkeypatch.setattr(job_manager, "_manager", manager)
+    return manager
+
+
+@pytest.fixture
+def query_params(monkeypatch, session_state):
+    params = {}
+    monkeypatch.setattr(st, "query_params", params)
+    return params
+
+
+def test_job_reports_progress_and_result(manager):
+    release = threading.Event()
+
+    def target(job, prefix):
+        job.append_output('overview', prefix)
+        job.append_output('overview', "第二段")
+        job.record_item("1.1 巡检计划", "正文")
+        job.record_item("1.2 电池更换", None, "生成失败: 超时")
+        job.set_stats({'concurrency': 4})
+        release.wait(5)
+        return "完成"
+
+    job = manager.submit(JOB_CONTENT, OWNER_A, target, "第一段", inputs={'overview': "概述"}, total=2)
+    deadline = time.monotonic() + 5
+    while job.snapshot()['completed'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    running = job.snapshot()
+    assert running['status'] == JOB_RUNNING and not job.done
+    assert running['outputs'] == {'overview': "第一段第二段"}
+    assert (running['total'], running['completed'], running['failed']) == (2, 1, 1)
+    assert running['errors'] == {"1.2 电池更换": "生成失败: 超时"}
+    assert running['stats'] == {'concurrency': 4}
+
+    release.set()
+    finished = _wait_done(job)
+    assert finished['status'] == JOB_COMPLETED
+    assert finished['result'] == "完成"
+    assert finished['finished_at'] is not None
+    assert job.inputs == {'overview': "概述"}
+
+
+def test_retried_item_clears_its_error():
+    job = job_manager.Job(JOB_CONTENT, OWNER_A)
+    job.record_item("1.1", None, "失败")
+    job.record_item("1.1", "正文")
+    snapshot = job.snapshot()
+    assert snapshot['errors'] == {} and snapshot['results'] == {"1.1": "正文"}
+
+
+def test_failed_and_cancelled_jobs(manager):
+    def fail(job):
+        raise ValueError("接口错误")
+
+    failed = _wait_done(manager.submit(JOB_ANALYSIS, OWNER_A, fail))
+    assert failed['status'] == JOB_FAILED and failed['error'] == "接口错误"
+
+    def wait_for_cancel(job):
+        job.cancel_token.wait(5)
+        job.cancel_token.raise_if_cancelled()
+
+    job = manager.submit(JOB_OUTLINE, OWNER_A, wait_for_cancel)
+    manager.cancel(job.id, "用户停止")
+    cancelled = _wait_done(job)
+    assert cancelled['status'] == JOB_CANCELLED and cancelled['error'] == "用户停止"
+
+    # 任务函数在取消后正常返回时，保留已有结果并标记为已取消
+    def return_partial(job):
+        job.cancel_token.wait(5)
+        return "部分结果"
+
+    job = manager.submit(JOB_OUTLINE, OWNER_A, return_partial)
+    job.cancel_token.cancel()
+    partial = _wait_done(job)
+    assert partial['status'] == JOB_CANCELLED and partial['result'] == "部分结果"
+
+    def raise_cancelled(job):
+        raise GenerationCancelled("已停止")
+
+    assert _wait_done(manager.submit(JOB_OUTLINE, OWNER_A, raise_cancelled))['status'] == JOB_CANCELLED
+
+
+def test_one_running_job_per_session_and_kind(manager):
+    def wait_for_cancel(job):
+        job.cancel_token.wait(5)
+
+    first = manager.submit(JOB_CONTENT, OWNER_A, wait_for_cancel)
+    other_kind = manager.submit(JOB_OUTLINE, OWNER_A, wait_for_cancel)
+    other_owner = manager.submit(JOB_CONTENT, OWNER_B, wait_for_cancel)
+    second = manager.submit(JOB_CONTENT, OWNER_A, wait_for_cancel)
+
+    assert first.cancel_token.cancelled and first.cancel_token.reason == "已被新的任务替代"
+    assert _wait_done(first)['status'] == JOB_CANCELLED
+    assert not other_kind.cancel_token.cancelled
+    assert not other_owner.cancel_token.cancelled
+    assert manager.active(JOB_CONTENT, OWNER_A) is second
+    assert manager.active(JOB_CONTENT, OWNER_B) is other_owner
+    assert manager.latest(JOB_ANALYSIS, OWNER_A) is None
+
+    for job in (other_kind, other_owner, second):
+        job.cancel_token.cancel()
+        _wait_done(job)
+    assert manager.active(JOB_CONTENT, OWNER_A) is None
+    assert manager.latest(JOB_CONTENT, OWNER_A) is second
+
+
+def test_finished_jobs_are_pruned_per_session(manager):
+    jobs = [manager.submit(JOB_ANALYSIS, OWNER_A, lambda job: None) for _ in range(MAX_FINISHED_JOBS + 3)]
+    for job in jobs:
+        _wait_done(job)
+    other = _wait_done(manager.submit(JOB_ANALYSIS, OWNER_B, lambda job: None))
+    manager.submit(JOB_OUTLINE, OWNER_A, lambda job: None)
+
+    kept = manager.list(OWNER_A)
+    assert len(kept) <= MAX_FINISHED_JOBS + 1
+    assert jobs[0] not in kept and jobs[-1] in kept
+    assert manager.get(other['id']) is not None
+
+
+def test_owner_is_kept_in_the_sid_query_param(query_params, session_state):
+    owner = current_owner()
+    assert len(owner) == 32
+    assert query_params[SESSION_PARAM] == owner
+    assert current_owner() == owner
+
+    # 页面刷新后session_state被清空，从URL参数中找回
+    session_state.clear()
+    assert current_owner() == owner
+
+    # 不合法的参数不被采用
+    session_state.clear()
+    query_params[SESSION_PARAM] = "../../etc"
+    assert current_owner() != "../../etc"
+    assert query_params[SESSION_PARAM] == session_state.job_owner
+
+
+def test_session_jobs_are_found_by_sid_only(manager, query_params, session_state):
+    query_params[SESSION_PARAM] = OWNER_A
+    job = submit_session_job(JOB_OUTLINE, lambda job: "目录")
+    assert job.owner == OWNER_A
+    _wait_done(job)
+
+    # 刷新页面：同一sid找回任务，结果只应用一次
+    session_state.clear()
+    assert get_session_job(JOB_OUTLINE) is job
+    assert claim_finished_job(job)
+    assert not claim_finished_job(job)
+
+    # 另一个浏览器会话（不同的sid）看不到该任务，即使拿到了任务ID
+    session_state.clear()
+    query_params[SESSION_PARAM] = OWNER_B
+    session_state[f'{JOB_OUTLINE}_job_id'] = job.id
+    assert get_session_job(JOB_OUTLINE) is None
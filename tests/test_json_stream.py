@@ -0,0 +1,91 @@
+import json
+import pytest
+from services.json_stream import IncrementalJsonParser, JsonSectionStreamer, OutlineStreamParser
+
+OUTLINE = {
+    "outline": [
+        {"id": "1", "title": "运维方案", "description": "总体\"方案\"", "children": [
+            {"id": "1.1", "title": "巡检计划", "description": "每月巡检 😀"},
+            {"id": "1.2", "title": "电池更换", "description": "换行\n制表\t"},
+        ]},
+        {"id": "2", "title": "人员配置", "description": "", "children": [
+            {"id": "2.1", "title": "值守人员", "description": "7×24小时"},
+        ]},
+    ]
+}
+
+
+def _chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1000])
+def test_incremental_parser_rebuilds_document_for_any_split(chunk_size):
+    # ensure_ascii=True时中文和emoji都是\u转义，代理对可能被拆在两个片段之间
+    text = json.dumps(OUTLINE, ensure_ascii=True, indent=2)
+    parser = IncrementalJsonParser()
+    for chunk in _chunks(text, chunk_size):
+        parser.feed(chunk)
+    assert parser.done
+    assert parser.root == OUTLINE
+
+
+def test_incremental_parser_reports_objects_as_they_close():
+    text = json.dumps(OUTLINE, ensure_ascii=False)
+    parser = IncrementalJsonParser()
+    closed = []
+    cut = text.index('"2.1"')
+    closed.extend(path for path, _ in parser.feed(text[:cut]))
+    assert closed == [('outline', 0, 'children', 0), ('outline', 0, 'children', 1), ('outline', 0)]
+
+    closed.extend(path for path, _ in parser.feed(text[cut:]))
+    assert closed[3:] == [('outline', 1, 'children', 0), ('outline', 1), ()]
+
+
+def test_incremental_parser_keeps_scalars_and_ignores_trailing_text():
+    parser = IncrementalJsonParser()
+    parser.feed('{"count": 12, "ratio": -1.5e2, "ok": true, "none": null, "list": [1, "a"]}')
+    parser.feed(' 多余的说明文字 {"x": 1}')
+    assert parser.root == {"count": 12, "ratio": -150.0, "ok": True, "none": None, "list": [1, "a"]}
+
+
+def test_outline_parser_yields_first_level_chapters_once():
+    text = json.dumps(OUTLINE, ensure_ascii=False)
+    parser = OutlineStreamParser()
+    new_chapters = []
+    for chunk in _chunks(text, 5):
+        new_chapters.extend(parser.feed(chunk))
+    assert [chapter['id'] for chapter in new_chapters] == ["1", "2"]
+    assert parser.completed_chapters == OUTLINE['outline']
+
+
+def test_partial_outline_only_shows_complete_titles():
+    text = json.dumps(OUTLINE, ensure_ascii=False)
+    parser = OutlineStreamParser()
+    assert parser.partial_outline() == []
+
+    # 截断在"电池更换"标题中间
+    parser.feed(text[:text.index('电池更换') + 2])
+    partial = parser.partial_outline()
+    assert [chapter['id'] for chapter in partial] == ["1"]
+    assert [child['id'] for child in partial[0]['children']] == ["1.1"]
+
+
+def test_section_streamer_streams_string_fields():
+    text = json.dumps({"overview": "项目\"概述\"\n第二行", "count": [1, {"a": "}"}], "requirements": "技术要求"},
+                      ensure_ascii=True)
+    streamer = JsonSectionStreamer()
+    sections = {}
+    for chunk in _chunks(text, 4):
+        for key, content in streamer.feed(chunk):
+            sections[key] = sections.get(key, '') + content
+    assert sections == {"overview": "项目\"概述\"\n第二行", "requirements": "技术要求"}
+    assert streamer.completed == {"overview", "requirements"}
+
+
+def test_section_streamer_merges_consecutive_content_of_one_field():
+    streamer = JsonSectionStreamer()
+    assert streamer.feed('{"overview": "ab') == [("overview", "ab")]
+    assert "overview" not in streamer.completed
+    assert streamer.feed('c", "requirements": "d') == [("overview", "c"), ("requirements", "d")]
+    assert streamer.completed == {"overview"}
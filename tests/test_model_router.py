@@ -0,0 +1,51 @@
+from services.async_openai_service import AsyncOpenAIService, run_coroutine
+from services.model_router import TASK_ANALYSIS, TASK_CHAPTER, TASK_OUTLINE, ModelRouter
+from services.outline_index import get_outline_index
+from services.telemetry import get_telemetry
+
+
+def test_unconfigured_tasks_use_default_model():
+    router = ModelRouter("main-model")
+    for task in (TASK_ANALYSIS, TASK_OUTLINE, TASK_CHAPTER):
+        assert router.model_for(task) == "main-model"
+    assert router.model_for(TASK_CHAPTER, level=1) == "main-model"
+
+
+def test_routes_by_task_and_chapter_level():
+    router = ModelRouter("main-model", {
+        'analysis_model': "long-context",
+        'chapter_model': "cheap",
+        'major_chapter_model': "strong",
+        'major_chapter_level': 2,
+    })
+    assert router.model_for(TASK_ANALYSIS) == "long-context"
+    assert router.model_for(TASK_OUTLINE) == "main-model"
+    assert router.model_for(TASK_CHAPTER) == "cheap"
+    assert router.model_for(TASK_CHAPTER, level=1) == "strong"
+    assert router.model_for(TASK_CHAPTER, level=2) == "strong"
+    assert router.model_for(TASK_CHAPTER, level=3) == "cheap"
+
+
+def test_major_level_without_model_falls_back_to_chapter_model():
+    router = ModelRouter("main-model", {'chapter_model': "cheap", 'major_chapter_level': 2})
+    assert router.model_for(TASK_CHAPTER, level=1) == "cheap"
+
+
+def test_chapter_requests_use_routed_models(mock_server):
+    base_url, _ = mock_server
+    service = AsyncOpenAIService(api_key="test-key", base_url=base_url, model_name="mock-gpt-fast", use_cache=False,
+                                 model_routes={'major_chapter_model': "mock-gpt-large", 'major_chapter_level': 1})
+    outline_data = {'outline': [
+        {'id': '1', 'title': '项目理解'},
+        {'id': '2', 'title': '实施方案', 'children': [{'id': '2.1', 'title': '进度计划'}]},
+    ]}
+    results = {}
+    run_coroutine(service.generate_chapters(
+        get_outline_index(outline_data).leaf_nodes_info(), "项目概述",
+        lambda result: results.update({result[0]: result[1:]}))).result(30)
+
+    assert all(content for content, _ in results.values())
+    models = {record['chapter_id']: record['model'] for record in get_telemetry().recent()
+              if record['base_url'] == base_url}
+    # 没有下级的一级章节使用重点章节模型，其余使用主模型
+    assert models == {'1': "mock-gpt-large", '2.1': "mock-gpt-fast"}
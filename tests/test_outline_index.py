@@ -0,0 +1,50 @@
+from services.context_compression import build_chapter_context
+from services.outline_index import OutlineIndex, get_outline_index, outline_hash
+
+
+def test_nodes_are_in_preorder_with_levels_and_parents(outline_data):
+    index = OutlineIndex(outline_data)
+    assert [node['id'] for node in index.nodes] == ['1', '1.1', '1.2', '1.3', '2', '2.1', '2.2']
+    assert [index.nodes[leaf]['id'] for leaf in index.leaves] == ['1.1', '1.2', '1.3', '2.1', '2.2']
+
+    node = index.get("1.2 电池更换")
+    assert node['level'] == 2 and node['is_leaf']
+    assert index.nodes[node['parent']]['id'] == '1'
+    assert index.get("9 不存在") is None
+
+
+def test_leaf_info_matches_recursive_context(outline_data):
+    leaf_nodes_info = OutlineIndex(outline_data).leaf_nodes_info()
+    path, info = leaf_nodes_info[3]
+    assert path == "2.1 值守人员"
+    assert info['parent_chapters'] == [{'id': '2', 'title': '人员配置', 'description': '团队构成'}]
+    assert info['sibling_chapters'] is outline_data['outline'][1]['children']
+    assert info['context'] == build_chapter_context('2.1', info['parent_chapters'], info['sibling_chapters'])
+    # 同一组同级章节共用上级章节列表
+    assert leaf_nodes_info[4][1]['parent_chapters'] is info['parent_chapters']
+
+
+def test_context_is_fixed_when_index_is_built(outline_data):
+    index = OutlineIndex(outline_data)
+    before = index.leaf_nodes_info()[0][1]['context']
+    outline_data['outline'][0]['children'][1]['title'] = '改过的标题'
+    assert index.leaf_nodes_info()[0][1]['context'] == before
+
+
+def test_empty_or_invalid_outline():
+    assert OutlineIndex(None).leaf_nodes_info() == []
+    assert OutlineIndex({'outline': None}).nodes == []
+    assert OutlineIndex({'title': 'no outline'}).nodes == []
+
+
+def test_index_cache_follows_content_changes(outline_data):
+    index = get_outline_index(outline_data)
+    assert get_outline_index(outline_data) is index
+
+    # 目录编辑页直接修改目录数据，内容变化后重新建索引
+    hash_before = outline_hash(outline_data)
+    outline_data['outline'][1]['children'].append({'id': '2.3', 'title': '后勤人员'})
+    assert outline_hash(outline_data) != hash_before
+    updated = get_outline_index(outline_data)
+    assert updated is not index
+    assert [path for path, _ in updated.leaf_nodes_info()][-1] == "2.3 后勤人员"
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+import pytest
+from services.openai_servce import OpenAIService
+from services.outline_index import get_outline_index
+from services.usage_tracker import UsageTracker, get_usage_tracker, parse_usage, stream_usage_options
+
+# 足够长的项目概述，系统提示词超过模拟接口的缓存粒度
+OVERVIEW = "消防物联网远程监控系统运维服务项目，服务期三年，覆盖监控中心、IDC机房和前端设备。" * 20
+
+
+def _service(base_url="http://prefix.test/v1"):
+    return OpenAIService(api_key="test-key", base_url=base_url, model_name="mock-gpt-fast", use_cache=False)
+
+
+def _messages(service, node_info, overview=OVERVIEW):
+    return service._build_chapter_messages(node_info['chapter'], node_info['parent_chapters'],
+                                           node_info['sibling_chapters'], overview, node_info['context'])
+
+
+def test_system_prompt_and_overview_are_identical_across_chapters(outline_data):
+    service = _service()
+    leaves = get_outline_index(outline_data).leaf_nodes_info()
+    all_messages = [_messages(service, info) for _, info in leaves]
+
+    system_prompts = {messages[0]['content'] for messages in all_messages}
+    assert len(system_prompts) == 1
+    assert system_prompts.pop().endswith(f"\n项目概述信息：\n{OVERVIEW}\n")
+    # 同一上级章节下，用户提示词在当前章节信息之前逐字节相同
+    by_parent = {}
+    for (path, info), messages in zip(leaves, all_messages):
+        user_prompt = messages[1]['content']
+        prefix = user_prompt[:user_prompt.index("当前章节信息：")].encode('utf-8')
+        by_parent.setdefault(info['parent_chapters'][0]['id'], set()).add(prefix)
+    assert {parent: len(prefixes) for parent, prefixes in by_parent.items()} == {'1': 1, '2': 1}
+
+
+def test_chapter_details_only_appear_after_the_shared_prefix(outline_data):
+    service = _service()
+    _, info = get_outline_index(outline_data).leaf_nodes_info()[0]
+    system_prompt, user_prompt = (message['content'] for message in _messages(service, info))
+    assert "巡检计划" not in system_prompt
+    assert user_prompt.index("章节ID: 1.1") > user_prompt.index("同级章节信息")
+
+
+def test_parse_usage_reads_cached_tokens_from_either_field():
+    openai_usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=200,
+                                   prompt_tokens_details=SimpleNamespace(cached_tokens=768))
+    deepseek_usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=200, prompt_cache_hit_tokens=512)
+    assert parse_usage(openai_usage) == {'prompt_tokens': 1000, 'cached_tokens': 768, 'completion_tokens': 200}
+    assert parse_usage(deepseek_usage)['cached_tokens'] == 512
+    assert parse_usage(SimpleNamespace(prompt_tokens=10, completion_tokens=None))['cached_tokens'] == 0
+
+    tracker = UsageTracker()
+    tracker.record(openai_usage)
+    tracker.record(deepseek_usage)
+    assert tracker.snapshot() == {'requests': 2, 'prompt_tokens': 2000, 'cached_tokens': 1280,
+                                  'completion_tokens': 400, 'cache_hit_rate': 0.64}
+
+
+def test_cached_tokens_are_tracked_from_stream_usage(outline_data, mock_server):
+    base_url, state = mock_server
+    service = _service(base_url)
+    for _, info in get_outline_index(outline_data).leaf_nodes_info()[:2]:
+        assert "".join(service.stream_chat_completion(_messages(service, info), model_name="mock-gpt-fast",
+                                                      share=False))
+
+    usage = get_usage_tracker(base_url, "mock-gpt-fast").snapshot()
+    server = state.snapshot()
+    assert usage['requests'] == 2
+    assert usage['prompt_tokens'] == server['prompt_tokens']
+    # 第二个章节复用了第一个章节的系统提示词前缀
+    assert usage['cached_tokens'] == server['cached_tokens'] > 0
+
+
+@pytest.mark.mock_settings(reject_stream_options=True)
+def test_gateway_rejecting_stream_options_falls_back_without_usage(mock_server):
+    base_url, state = mock_server
+    service = _service(base_url)
+    messages = [{"role": "user", "content": "第一次"}]
+    assert stream_usage_options(base_url) == {'stream_options': {'include_usage': True}}
+
+    assert "".join(service.stream_chat_completion(messages, share=False))
+    # 被拒绝后立即去掉stream_options重试，之后的请求不再携带
+    assert state.snapshot()['requests'] == 2
+    assert stream_usage_options(base_url) == {}
+
+    assert "".join(service.stream_chat_completion([{"role": "user", "content": "第二次"}], share=False))
+    assert state.snapshot()['requests'] == 3
+    assert get_usage_tracker(base_url, "mock-gpt-fast").snapshot()['requests'] == 0
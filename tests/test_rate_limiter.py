@@ -0,0 +1,87 @@
+import pytest
+from services import rate_limiter
+from services.rate_limiter import (EndpointRateLimiter, TokenBucket, estimate_prompt_tokens, estimate_text_tokens,
+                                   get_rate_limiter)
+
+
+class FakeClock:
+    """代替time模块：monotonic返回手动推进的时间，sleep只记录等待时间"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+def test_token_estimates_count_cjk_characters_individually():
+    assert estimate_text_tokens("") == 0
+    assert estimate_text_tokens("消防系统") == 4
+    assert estimate_text_tokens("abcdefgh") == 2
+    assert estimate_prompt_tokens([{"role": "user", "content": "消防"}, {"role": "system", "content": None}]) == 10
+
+
+def test_token_bucket_refills_at_budget_rate():
+    bucket = TokenBucket(60)
+    now = bucket.updated_at
+    assert bucket.reserve(60, now) == 0.0
+    # 余额为负时按每秒1个令牌补充
+    assert bucket.reserve(3, now) == pytest.approx(3.0)
+    assert bucket.reserve(1, now + 2) == pytest.approx(2.0)
+    # 超过容量的预约按容量计，不会永远等待
+    assert bucket.reserve(10_000, now + 1000) == pytest.approx(0.0)
+
+
+def test_rpm_limit_spaces_requests(clock):
+    limiter = EndpointRateLimiter(rpm_limit=2)
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() == pytest.approx(30.0)
+    assert clock.sleeps == [pytest.approx(30.0)]
+
+
+def test_tpm_settle_refunds_overestimate(clock):
+    limiter = EndpointRateLimiter(tpm_limit=1000)
+    assert limiter.acquire(900) == 0.0
+    limiter.settle(900, 100)
+    # 实际只用了100个token，剩余的预算可以直接使用
+    assert limiter.acquire(800) == 0.0
+    assert limiter.acquire(200) == pytest.approx(6.0)
+
+
+def test_unlimited_limiter_never_waits(clock):
+    limiter = EndpointRateLimiter()
+    for _ in range(100):
+        assert limiter.acquire(10_000) == 0.0
+    assert clock.sleeps == []
+
+
+def test_reconfigure_keeps_bucket_state_when_budget_unchanged(clock):
+    limiter = EndpointRateLimiter(rpm_limit=1)
+    limiter.acquire()
+    limiter.configure(1, 0)
+    assert limiter.acquire() == pytest.approx(60.0)
+    # 预算变化时重新建桶
+    limiter.configure(2, 0)
+    assert limiter.acquire() == 0.0
+
+
+def test_get_rate_limiter_is_shared_per_endpoint_model_and_key():
+    first = get_rate_limiter("http://limiter.test/v1", "model-a", rpm_limit=10, api_key="k1")
+    assert get_rate_limiter("http://limiter.test/v1", "model-a", rpm_limit=10, api_key="k1") is first
+    assert get_rate_limiter("http://limiter.test/v1", "model-a", rpm_limit=10, api_key="k2") is not first
+    assert get_rate_limiter("http://limiter.test/v1", "model-b", rpm_limit=10, api_key="k1") is not first
+    # 再次获取时按新的预算更新
+    assert get_rate_limiter("http://limiter.test/v1", "model-a", rpm_limit=20, api_key="k1").rpm_limit == 20
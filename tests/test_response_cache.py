@@ -0,0 +1,70 @@
+import pytest
+from services import openai_servce, response_cache
+from services.openai_servce import OpenAIService
+from services.response_cache import ResponseCache, iter_cached_chunks
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(path=str(tmp_path / "cache.sqlite3"))
+
+
+def test_key_ignores_surrounding_whitespace_but_not_parameters():
+    messages = [{"role": "user", "content": "写一章"}]
+    key = ResponseCache.make_key("model-a", messages, 0.7)
+    assert ResponseCache.make_key("model-a", [{"role": "user", "content": " 写一章\n"}], 0.7) == key
+    assert ResponseCache.make_key("model-b", messages, 0.7) != key
+    assert ResponseCache.make_key("model-a", messages, 0.3) != key
+    assert ResponseCache.make_key("model-a", messages, 0.7, {"type": "json_object"}) != key
+    assert ResponseCache.make_key("model-a", [{"role": "system", "content": "写一章"}], 0.7) != key
+
+
+def test_put_get_and_clear(cache):
+    assert cache.get("missing") is None
+    cache.put("key", "内容", model="model-a")
+    assert cache.get("key") == "内容"
+    assert cache.stats() == {"entries": 1, "bytes": len("内容".encode("utf-8"))}
+    cache.clear()
+    assert cache.get("key") is None
+
+
+def test_least_recently_accessed_entries_are_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(path=str(tmp_path / "cache.sqlite3"), max_bytes=25)
+    for key in ("a", "b"):
+        cache.put(key, "x" * 10)
+        now[0] += 1
+    # 读取a后，b成为最久未访问的条目
+    assert cache.get("a")
+    now[0] += 1
+    cache.put("c", "x" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    # 超过上限的单个条目不写入
+    cache.put("huge", "x" * 100)
+    assert cache.get("huge") is None
+
+
+def test_cached_chunks_replay_the_whole_content():
+    content = "正文" * 100
+    chunks = list(iter_cached_chunks(content, chunk_size=64))
+    assert "".join(chunks) == content
+    assert max(len(chunk) for chunk in chunks) == 64
+
+
+def test_service_serves_repeated_request_from_cache(mock_server, tmp_path, monkeypatch):
+    base_url, state = mock_server
+    monkeypatch.setattr(openai_servce, "get_response_cache",
+                        lambda: ResponseCache(path=str(tmp_path / "service-cache.sqlite3")))
+    service = OpenAIService(api_key="test-key", base_url=base_url, model_name="mock-gpt-fast", use_cache=True)
+    messages = [{"role": "user", "content": "缓存测试"}]
+
+    first = "".join(service.stream_chat_completion(messages, share=False))
+    second = "".join(service.stream_chat_completion(messages, share=False))
+    assert first and second == first
+    assert state.snapshot()['requests'] == 1
+
+    service.use_cache = False
+    "".join(service.stream_chat_completion(messages, share=False))
+    assert state.snapshot()['requests'] == 2
@@ -0,0 +1,97 @@
+import time
+from email.utils import format_datetime
+from datetime import datetime, timezone
+import httpx
+import openai
+import pytest
+from services import openai_servce
+from services.openai_servce import OpenAIService
+from services.retry_policy import (LLMServiceError, RetryPolicy, RESUME_PROMPT, build_resume_messages,
+                                   classify_error, parse_retry_after)
+
+
+def _status_error(status_code, headers=None, error_class=openai.APIStatusError, code=None):
+    request = httpx.Request("POST", "http://retry.test/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    body = {"code": code} if code else None
+    return error_class("mock error", response=response, body=body)
+
+
+def test_parse_retry_after_formats():
+    assert parse_retry_after(_status_error(429, {"retry-after-ms": "1500"})) == 1.5
+    assert parse_retry_after(_status_error(429, {"retry-after": "7"})) == 7.0
+    later = datetime.fromtimestamp(time.time() + 30, tz=timezone.utc)
+    assert parse_retry_after(_status_error(429, {"retry-after": format_datetime(later, usegmt=True)})) == \
+        pytest.approx(30, abs=2)
+    assert parse_retry_after(_status_error(429, {"retry-after": "soon"})) is None
+    assert parse_retry_after(ValueError("no response")) is None
+
+
+def test_classify_error_separates_transient_and_permanent():
+    assert classify_error(_status_error(503)).transient
+    assert classify_error(_status_error(429, {"retry-after": "3"}, openai.RateLimitError)).retry_after == 3.0
+    assert not classify_error(_status_error(400, error_class=openai.BadRequestError)).transient
+    # 额度用尽也是429，但重试没有意义
+    assert not classify_error(_status_error(429, error_class=openai.RateLimitError, code="insufficient_quota")).transient
+    assert classify_error(httpx.ReadTimeout("timed out")).transient
+    assert not classify_error(ValueError("bug")).transient
+
+    error = LLMServiceError("already classified", transient=True)
+    assert classify_error(error) is error
+
+
+def test_retry_policy_prefers_retry_after_and_respects_budgets():
+    policy = RetryPolicy(max_retries=3, base_delay=1.0, max_delay=10.0, max_total_delay=20.0)
+    throttled = LLMServiceError("429", transient=True, status_code=429, retry_after=4.0)
+    assert policy.next_delay(throttled, 0, 0.0) == 4.0
+    assert policy.next_delay(LLMServiceError("429", transient=True, retry_after=99.0), 0, 0.0) == 10.0
+    assert policy.next_delay(throttled, 3, 0.0) is None
+    assert policy.next_delay(throttled, 1, 18.0) is None
+    assert policy.next_delay(LLMServiceError("400", transient=False), 0, 0.0) is None
+
+    # 没有Retry-After时按指数退避全抖动
+    backoff = LLMServiceError("500", transient=True)
+    for retries_done in range(3):
+        assert 0 <= policy.next_delay(backoff, retries_done, 0.0) <= 2 ** retries_done
+
+
+def test_build_resume_messages_appends_partial_output():
+    messages = [{"role": "user", "content": "写一章"}]
+    assert build_resume_messages(messages, "") is messages
+    resumed = build_resume_messages(messages, "已经写了")
+    assert resumed[:1] == messages
+    assert resumed[1:] == [{"role": "assistant", "content": "已经写了"}, {"role": "user", "content": RESUME_PROMPT}]
+
+
+@pytest.mark.mock_settings(rpm_limit=1, retry_after=0.25)
+def test_service_waits_for_retry_after_from_server(mock_server, monkeypatch):
+    base_url, state = mock_server
+    sleeps = []
+    monkeypatch.setattr(openai_servce.time, "sleep", sleeps.append)
+    service = OpenAIService(api_key="test-key", base_url=base_url, model_name="mock-gpt-fast", use_cache=False,
+                            max_retries=2)
+
+    assert "".join(service.stream_chat_completion([{"role": "user", "content": "第一次"}], share=False))
+    with pytest.raises(LLMServiceError) as excinfo:
+        list(service.stream_chat_completion([{"role": "user", "content": "第二次"}], share=False))
+
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.attempts == 3
+    # 每次重试都按服务端返回的Retry-After等待（time.sleep是全局的，忽略其他代码的sleep(0)）
+    assert [seconds for seconds in sleeps if seconds] == [0.25, 0.25]
+    assert state.snapshot()['rate_limited'] == 3
+
+
+@pytest.mark.mock_settings(error_rate=1.0)
+def test_chapter_errors_propagate_and_mark_chapters_failed(mock_server, outline_data):
+    base_url, _ = mock_server
+    service = OpenAIService(api_key="test-key", base_url=base_url, model_name="mock-gpt-fast", use_cache=False,
+                            max_retries=0)
+    with pytest.raises(LLMServiceError) as excinfo:
+        service._generate_chapter_content({'id': '1.1', 'title': '巡检计划'})
+    assert excinfo.value.status_code == 500
+
+    messages = list(service._process_outline_leaves(outline_data))
+    assert len(messages) == 5
+    assert all(message.startswith("❌") and "生成内容失败: " in message for message in messages)
+    assert not any('content' in child for chapter in outline_data['outline'] for child in chapter['children'])
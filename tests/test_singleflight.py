@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import pytest
+from services.openai_servce import OpenAIService
+from services.singleflight import InflightTable, make_flight_key
+
+
+def test_flight_key_separates_gateways():
+    messages = [{"role": "user", "content": "写一章"}]
+    key = make_flight_key("http://a.test/v1", "model", messages, 0.7)
+    assert make_flight_key("http://a.test/v1", "model", messages, 0.7) == key
+    assert make_flight_key("http://b.test/v1", "model", messages, 0.7) != key
+
+
+class GatedStart:
+    """
+    可控的请求函数：每输出一段就等待放行，用于让跟随方在请求进行中加入
+
+    fail_after为整数时，输出这么多段后抛出异常
+    """
+
+    def __init__(self, chunks, fail_after=None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.calls = []
+        self.gate = threading.Semaphore(0)
+
+    def __call__(self, received):
+        self.calls.append(list(received))
+        return self._run(len(received))
+
+    def _run(self, offset):
+        for index, chunk in enumerate(self.chunks[offset:], offset):
+            if self.fail_after is not None and index == self.fail_after and len(self.calls) == 1:
+                raise RuntimeError("leader failed")
+            self.gate.acquire()
+            yield chunk
+
+    def release_all(self):
+        for _ in range(len(self.chunks) * 2):
+            self.gate.release()
+
+
+def _consume_in_thread(iterator):
+    result = {}
+
+    def run():
+        try:
+            result['chunks'] = list(iterator)
+        except Exception as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, result
+
+
+def _wait_for_follower(table, key):
+    # 跟随方注册等待后在途请求表中的waiters非空
+    for _ in range(200):
+        flight = table._flights.get(key)
+        if flight is not None and flight._waiters:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("follower did not join")
+
+
+def test_follower_shares_leader_output():
+    table = InflightTable()
+    start = GatedStart(["a", "b", "c"])
+    shared = []
+    start.gate.release()
+    leader_stream = table.stream("key", start)
+    assert next(leader_stream) == "a"
+
+    follower, follower_result = _consume_in_thread(table.stream("key", start, on_shared=lambda: shared.append(1)))
+    _wait_for_follower(table, "key")
+    start.release_all()
+    assert list(leader_stream) == ["b", "c"]
+    follower.join(5)
+
+    assert follower_result['chunks'] == ["a", "b", "c"]
+    assert start.calls == [[]]
+    assert shared == [1]
+    assert table._flights == {}
+
+
+def test_follower_resumes_when_leader_fails():
+    table = InflightTable()
+    start = GatedStart(["a", "b", "c", "d"], fail_after=2)
+    start.gate.release()
+    leader_stream = table.stream("key", start)
+    assert next(leader_stream) == "a"
+
+    follower, follower_result = _consume_in_thread(table.stream("key", start))
+    _wait_for_follower(table, "key")
+    start.release_all()
+    with pytest.raises(RuntimeError):
+        list(leader_stream)
+    follower.join(5)
+
+    # 跟随方拿到领头方已输出的a、b后，从这里继续自己请求
+    assert follower_result['chunks'] == ["a", "b", "c", "d"]
+    assert start.calls == [[], ["a", "b"]]
+
+
+def test_follower_resumes_when_leader_stops_reading():
+    table = InflightTable()
+    start = GatedStart(["a", "b", "c"])
+    start.gate.release()
+    leader_stream = table.stream("key", start)
+    assert next(leader_stream) == "a"
+
+    follower, follower_result = _consume_in_thread(table.stream("key", start))
+    _wait_for_follower(table, "key")
+    start.release_all()
+    leader_stream.close()
+    follower.join(5)
+
+    assert follower_result['chunks'] == ["a", "b", "c"]
+    assert start.calls == [[], ["a"]]
+
+
+def test_async_follower_shares_thread_leader_output():
+    table = InflightTable()
+    start = GatedStart(["a", "b"])
+    start.gate.release()
+    leader_stream = table.stream("key", start)
+    assert next(leader_stream) == "a"
+
+    async def never_called(received):
+        raise AssertionError("follower should not request")
+        yield
+
+    async def follow():
+        collected = []
+        async for chunk in table.astream("key", never_called):
+            collected.append(chunk)
+        return collected
+
+    async def scenario():
+        task = asyncio.ensure_future(follow())
+        await asyncio.sleep(0.05)
+        start.release_all()
+        await asyncio.get_running_loop().run_in_executor(None, list, leader_stream)
+        return await task
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+
+
+@pytest.mark.mock_settings(ttft=0.3)
+def test_identical_service_requests_hit_the_server_once(mock_server):
+    base_url, state = mock_server
+    service = OpenAIService(api_key="test-key", base_url=base_url, model_name="mock-gpt-fast", use_cache=False)
+    messages = [{"role": "user", "content": "同时解析同一份招标文件"}]
+    threads = [_consume_in_thread(service.stream_chat_completion(messages)) for _ in range(3)]
+    for thread, _ in threads:
+        thread.join(10)
+
+    outputs = {"".join(result['chunks']) for _, result in threads}
+    assert len(outputs) == 1 and outputs.pop()
+    assert state.snapshot()['requests'] == 1
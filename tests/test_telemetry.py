@@ -0,0 +1,133 @@
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+from types import SimpleNamespace
+import pytest
+from services import telemetry
+from services.telemetry import CallMetrics, TelemetryRecorder, summarize
+
+RECORD_FIELDS = {'timestamp', 'task', 'chapter_id', 'model', 'base_url', 'endpoint', 'status', 'attempts',
+                 'queue_wait', 'ttft', 'latency', 'output_tokens_per_sec', 'prompt_tokens', 'cached_tokens',
+                 'completion_tokens', 'usage_reported', 'error'}
+
+
+class FakeClock:
+    """代替time模块：monotonic返回手动推进的时间"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return 1700000000.0 + self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(telemetry, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def telemetry_logger():
+    """记录文件的logger是进程级的，测试期间摘下已有的文件handler，结束后恢复"""
+    file_logger = logging.getLogger("ai_write_helper.telemetry")
+    saved = [handler for handler in file_logger.handlers if isinstance(handler, RotatingFileHandler)]
+    for handler in saved:
+        file_logger.removeHandler(handler)
+    yield file_logger
+    for handler in file_logger.handlers[:]:
+        if isinstance(handler, RotatingFileHandler):
+            file_logger.removeHandler(handler)
+            handler.close()
+    for handler in saved:
+        file_logger.addHandler(handler)
+
+
+def test_call_metrics_measure_queue_ttft_and_speed(clock):
+    metrics = CallMetrics('chapter', '1.1', 'mock-gpt-fast', 'http://telemetry.test/v1')
+    clock.now += 0.5
+    metrics.queued(0.5)
+    metrics.sent('primary', 'mock-gpt-slow')
+    clock.now += 0.25
+    metrics.token("第一段")
+    clock.now += 2.0
+    metrics.token("第二段")
+    metrics.add_usage(SimpleNamespace(prompt_tokens=300, completion_tokens=50,
+                                      prompt_tokens_details=SimpleNamespace(cached_tokens=256)))
+    record = metrics.finish('ok')
+
+    assert set(record) == RECORD_FIELDS
+    assert record['model'] == 'mock-gpt-slow' and record['endpoint'] == 'primary'
+    assert record['attempts'] == 1
+    assert record['queue_wait'] == 0.5
+    assert record['ttft'] == 0.25
+    assert record['latency'] == 2.75
+    assert record['output_tokens_per_sec'] == 25.0
+    assert (record['prompt_tokens'], record['cached_tokens'], record['completion_tokens']) == (300, 256, 50)
+    assert record['usage_reported'] and record['error'] is None
+
+
+def test_completion_tokens_are_estimated_without_usage(clock):
+    metrics = CallMetrics(None, None, 'mock-gpt-fast', None)
+    metrics.sent()
+    metrics.token("巡检计划")
+    record = metrics.finish('error', RuntimeError("断开"))
+    assert record['completion_tokens'] == 4
+    assert not record['usage_reported']
+    assert record['error'] == "断开"
+    assert record['base_url'] == ''
+
+
+def test_records_rotate_past_size_limit(tmp_path, monkeypatch, telemetry_logger):
+    monkeypatch.setattr(telemetry, "TELEMETRY_MAX_BYTES", 2000)
+    monkeypatch.setattr(telemetry, "TELEMETRY_BACKUP_COUNT", 2)
+    path = tmp_path / "telemetry" / "llm_calls.jsonl"
+    recorder = TelemetryRecorder(str(path), buffer_size=5)
+    for index in range(40):
+        recorder.record(CallMetrics('chapter', f"1.{index}", 'mock-gpt-fast', 'http://telemetry.test/v1')
+                        .finish('ok'))
+
+    files = sorted(p.name for p in path.parent.iterdir())
+    assert files == ["llm_calls.jsonl", "llm_calls.jsonl.1", "llm_calls.jsonl.2"]
+    lines = []
+    for name in reversed(files):
+        content = (path.parent / name).read_text(encoding='utf-8')
+        assert len(content.encode('utf-8')) <= 2000
+        lines.extend(json.loads(line) for line in content.splitlines())
+    assert all(set(line) == RECORD_FIELDS for line in lines)
+    # 超出备份数的旧记录被丢弃，保留的记录连续且以最新一条结束
+    ids = [int(line['chapter_id'].split('.')[1]) for line in lines]
+    assert ids == list(range(40 - len(ids), 40))
+    assert len(ids) < 40
+    assert [record['chapter_id'] for record in recorder.recent()] == [f"1.{index}" for index in range(35, 40)]
+
+
+def test_unwritable_directory_keeps_records_in_memory(tmp_path, telemetry_logger, caplog):
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    with caplog.at_level(logging.WARNING, logger="services.telemetry"):
+        recorder = TelemetryRecorder(str(blocker / "llm_calls.jsonl"))
+    assert "无法创建调用记录文件" in caplog.text
+    recorder.record({'timestamp': 1.0})
+    assert recorder.recent(since=1.0) == [{'timestamp': 1.0}]
+    assert recorder.recent(since=2.0) == []
+
+
+def test_summarize_groups_by_task_and_model():
+    records = [
+        {'task': 'chapter', 'model': 'm', 'status': 'ok', 'ttft': 0.4, 'latency': 2.0, 'queue_wait': 0.1,
+         'output_tokens_per_sec': 20.0, 'prompt_tokens': 100, 'cached_tokens': 64, 'completion_tokens': 40},
+        {'task': 'chapter', 'model': 'm', 'status': 'cache_hit', 'ttft': None, 'latency': 0.0, 'queue_wait': 0.0,
+         'output_tokens_per_sec': None, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0},
+        {'task': None, 'model': 'm', 'status': 'error', 'ttft': None, 'latency': 1.0, 'queue_wait': 0.0,
+         'output_tokens_per_sec': None, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0},
+    ]
+    rows = {row['任务']: row for row in summarize(records)}
+    assert rows['chapter']['调用数'] == 2 and rows['chapter']['缓存命中'] == 1
+    assert rows['chapter']['首字中位数(s)'] == 0.4
+    assert rows['chapter']['缓存token'] == 64
+    assert rows['-']['失败'] == 1
@@ -0,0 +1,71 @@
+import pytest
+from services import tender_retrieval
+from services.tender_retrieval import TenderIndex, document_hash, get_tender_index, tokenize
+
+TENDER = "\n".join([
+    "--- 第1页 ---",
+    "第一章 招标公告",
+    "本项目为消防物联网远程监控系统运维服务，服务期三年。",
+    "--- 第2页 ---",
+    "第二章 技术要求",
+    "1.1 巡检要求",
+    "每月对烟感、温感设备进行一次全面巡检，巡检记录须在3个工作日内提交。",
+    "1.2 电池更换",
+    "用户传输装置蓄电池每两年更换一次，传感器电池电量低于20%时及时更换。",
+    "1.3 故障响应",
+    "接到故障报修后30分钟内响应，4小时内到场处理。",
+    "--- 第3页 ---",
+    "第三章 人员要求",
+    "监控中心实行7×24小时值守，值守人员须持有消防设施操作员证书。",
+])
+
+
+def test_tokenize_uses_cjk_bigrams_and_keeps_numbering():
+    assert tokenize("巡检要求") == ["巡检", "检要", "要求"]
+    assert tokenize("第 1.2.3 节") == ["第", "1.2.3", "节"]
+    assert tokenize("Battery 20%") == ["battery", "20"]
+    assert tokenize("") == []
+
+
+def test_search_ranks_the_matching_passage_first():
+    index = TenderIndex(TENDER, passage_chars=200)
+    results = index.search("电池更换")
+    assert "蓄电池每两年更换" in index.passages[results[0][0]]
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+    assert index.search("完全无关的词语xyz") == []
+
+
+def test_references_follow_document_order():
+    index = TenderIndex(TENDER, passage_chars=200)
+    references = index.references_for({'title': "值守人员", 'description': "监控中心故障响应"}, top_k=2)
+    assert len(references) == 2
+    positions = [TENDER.index(reference.splitlines()[-1]) for reference in references]
+    assert positions == sorted(positions)
+    assert any("7×24小时值守" in reference for reference in references)
+
+
+def test_search_results_are_cached_per_query():
+    index = TenderIndex(TENDER, passage_chars=200)
+    assert index.search("巡检") is index.search("巡检")
+    assert index.search("巡检", top_k=1) is not index.search("巡检")
+
+
+def test_index_is_cached_by_document_content(monkeypatch):
+    monkeypatch.setattr(tender_retrieval, "INDEX_CACHE_SIZE", 2)
+    assert get_tender_index("") is None and get_tender_index("  \n") is None
+    assert document_hash("") == ""
+
+    index = get_tender_index(TENDER)
+    assert get_tender_index(str(TENDER)) is index
+    get_tender_index(TENDER + "\n附件一")
+    get_tender_index(TENDER + "\n附件二")
+    # 超过缓存数后最久未用的索引被淘汰
+    assert get_tender_index(TENDER) is not index
+
+
+@pytest.mark.parametrize("query", ["电池", "巡检记录", "故障报修"])
+def test_every_returned_passage_shares_a_term_with_the_query(query):
+    index = TenderIndex(TENDER, passage_chars=200)
+    terms = set(tokenize(query))
+    for passage_index, _ in index.search(query, top_k=5):
+        assert terms & set(tokenize(index.passages[passage_index]))